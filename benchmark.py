@@ -0,0 +1,467 @@
+"""Benchmarks reproducibles de indexación, recuperación y respuesta de extremo a extremo.
+
+Uso:
+    python benchmark.py [--sizes 50,500] [--concurrency 1,4] [--queries 200]
+                        [--json resultados.json] [--baseline benchmark_baseline.json]
+                        [--save-baseline] [--threshold 0.2]
+
+Todo corre sin red: corpus sintético de conocimiento_manual, embeddings
+deterministas y un servidor falso de Ollama en localhost. Cada tamaño de
+corpus se mide en un proceso aparte para que la memoria pico sea solo suya.
+Con una línea base guardada, las métricas que empeoran más que `--threshold`
+se marcan como regresión y el programa termina con código 1.
+"""
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import numpy as np
+import psutil
+from langchain_core.embeddings import Embeddings
+
+from topics import TOPICS
+
+SEED = 1234
+EMBEDDING_DIM = 384  # como all-MiniLM-L6-v2
+BASELINE_FILE = "benchmark_baseline.json"
+# Diferencias por debajo de estos valores absolutos se consideran ruido
+NOISE_FLOOR = {"_s": 0.005, "_ms": 1.0, "_mb": 5.0}
+
+_FILLER = ("el la los las un una de del en con por para sobre entre desde que como cuando "
+           "porque aunque también siempre nunca mañana tarde noche semana mes año casa "
+           "trabajo familia amigo idea plan nota dato lista tema parte forma manera").split()
+
+
+# ---- corpus sintético ----
+
+def generate_corpus(docs_path: str, files: int, paragraphs: int = 8, seed: int = SEED) -> int:
+    """Escribe `files` archivos .txt repartidos por carpetas de tema; devuelve los bytes."""
+    rng = random.Random(seed)
+    folders = list(TOPICS) + ["general"]
+    total = 0
+    for i in range(files):
+        topic = folders[i % len(folders)]
+        vocabulary = _FILLER + TOPICS.get(topic, {}).get("keywords", [])
+        text = "\n\n".join(_paragraph(rng, vocabulary) for _ in range(paragraphs))
+        folder = os.path.join(docs_path, topic)
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"nota_{i:05d}.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+        total += len(text.encode("utf-8"))
+    return total
+
+
+def _paragraph(rng: random.Random, vocabulary: List[str]) -> str:
+    sentences = []
+    for _ in range(rng.randint(3, 6)):
+        words = [rng.choice(vocabulary) for _ in range(rng.randint(8, 16))]
+        sentences.append(" ".join(words).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def _questions(count: int, seed: int = SEED) -> List[str]:
+    rng = random.Random(seed + 1)
+    vocabulary = _FILLER + [word for info in TOPICS.values() for word in info["keywords"]]
+    return [f"¿Qué sabes de {' '.join(rng.choice(vocabulary) for _ in range(4))}?"
+            for _ in range(count)]
+
+
+# ---- dobles deterministas ----
+
+class FakeEmbeddings(Embeddings):
+    """Vectores unitarios pseudoaleatorios derivados del hash del texto.
+
+    `cost` simula los segundos que tarda el modelo real por texto.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM, cost: float = 0.0):
+        self.dim = dim
+        self.cost = cost
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.cost:
+            time.sleep(self.cost * len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class FakeOllamaServer:
+    """Imita /api/tags, /api/ps, /api/generate y /api/chat de Ollama en un puerto libre.
+
+    La respuesta tarda `prefill` segundos por cada 1000 caracteres de prompt y
+    `token_delay` por token, para que el coste dependa del prompt como en CPU.
+    `installed` son los modelos de /api/tags y `loaded` los de /api/ps; una
+    precarga (/api/generate sin prompt) carga el modelo. Con `port` se puede
+    volver a levantar en la misma dirección (p. ej. tras simular una caída).
+    """
+
+    def __init__(self, model: str, tokens: int = 32, token_delay: float = 0.002,
+                 prefill: float = 0.01, installed: Optional[List[str]] = None,
+                 loaded: Optional[List[str]] = None, port: int = 0, warmup_delay: float = 0.0):
+        self.model = model
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.prefill = prefill
+        self.installed = set(installed if installed is not None else [model])
+        self.loaded = set(loaded if loaded is not None else self.installed)
+        self.warmup_delay = warmup_delay  # segundos que tarda en cargarse un modelo
+        self.requests = 0
+        self.warmups: List[str] = []
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "FakeOllamaServer":
+        threading.Thread(target=self._server.serve_forever, daemon=True,
+                         name="fake-ollama").start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _json(self, body: dict):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _chunk(self, body: dict):
+                data = (json.dumps(body) + "\n").encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def do_GET(self):
+                models = fake.loaded if self.path == "/api/ps" else fake.installed
+                self._json({"models": [{"name": name, "model": name} for name in sorted(models)]})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                fake.requests += 1
+                prompt = request.get("prompt") or "".join(
+                    message.get("content", "") for message in request.get("messages", []))
+                if request.get("model") not in fake.installed:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if self.path == "/api/generate" and not prompt:
+                    if request["model"] not in fake.loaded:
+                        time.sleep(fake.warmup_delay)
+                    fake.warmups.append(request["model"])
+                fake.loaded.add(request["model"])
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                base = {"model": fake.model, "created_at": "2024-01-01T00:00:00Z"}
+                chat = self.path == "/api/chat"
+                if chat or prompt:
+                    time.sleep(fake.prefill * len(prompt) / 1000)
+                    for i in range(fake.tokens):
+                        time.sleep(fake.token_delay)
+                        token = f"palabra{i} "
+                        self._chunk(dict(base, done=False, **(
+                            {"message": {"role": "assistant", "content": token}} if chat
+                            else {"response": token})))
+                done = {"message": {"role": "assistant", "content": ""}} if chat else {"response": ""}
+                self._chunk(dict(base, done=True, done_reason="stop", eval_count=fake.tokens,
+                                 prompt_eval_count=len(prompt) // 4, **done))
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+
+class PeakRSS:
+    """Muestrea la memoria residente del proceso en segundo plano y guarda el máximo."""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak = 0
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="peak-rss")
+
+    def __enter__(self) -> "PeakRSS":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            self.peak = max(self.peak, self._process.memory_info().rss)
+            if self._stop.wait(self.interval):
+                return
+
+
+# ---- medición ----
+
+def _percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q * 100)) if values else 0.0
+
+
+def _timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def _concurrent(fn, items: list, concurrency: int) -> Dict[str, float]:
+    """Ejecuta fn(item) con `concurrency` hilos; latencias en ms y peticiones por segundo."""
+    latencies = []
+    lock = threading.Lock()
+
+    def run(item):
+        start = time.perf_counter()
+        fn(item)
+        with lock:
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(run, items))
+    elapsed = time.perf_counter() - start
+    return {
+        "p50_ms": round(_percentile(latencies, 0.5), 3),
+        "p99_ms": round(_percentile(latencies, 0.99), 3),
+        "qps": round(len(items) / elapsed, 2),
+    }
+
+
+def run_size(files: int, options: dict) -> dict:
+    """Mide un tamaño de corpus de principio a fin; se ejecuta en su propio proceso."""
+    output = contextlib.nullcontext() if options["verbose"] else \
+        contextlib.redirect_stdout(open(os.devnull, "w", encoding="utf-8"))
+    with output, PeakRSS() as rss, tempfile.TemporaryDirectory(prefix="jarvis-bench-") as root:
+        import llm
+        from engine import AssistantEngine
+        from knowledge import KnowledgeManager
+
+        docs_path = os.path.join(root, "conocimiento_manual")
+        vectorstore_path = os.path.join(root, "vector_store")
+        embeddings = FakeEmbeddings(cost=options["embed_cost_ms"] / 1000)
+
+        def open_km() -> KnowledgeManager:
+            return KnowledgeManager(docs_path=docs_path, vectorstore_path=vectorstore_path,
+                                    index_config=llm.index_config(), embeddings=embeddings,
+                                    ingestion_options={"batch_size": llm.INGEST_BATCH_SIZE})
+
+        result = {"files": files, "corpus_bytes": generate_corpus(docs_path, files)}
+
+        start = time.perf_counter()
+        km = open_km()
+        result["initial_build_s"] = round(time.perf_counter() - start, 4)
+        result["chunks"] = len(km.vectorstore)
+        km.close()
+
+        # Arranque en frío: snapshot en disco y caché de embeddings ya llena
+        start = time.perf_counter()
+        km = open_km()
+        result["cold_start_s"] = round(time.perf_counter() - start, 4)
+
+        result["full_rebuild_s"] = round(_timed(km.reload_knowledge), 4)
+
+        # Actualización incremental: cambia el 1 % de los archivos
+        rng = random.Random(SEED + 2)
+        sources = sorted(km._scan_sources())
+        for rel_path in rng.sample(sources, max(1, len(sources) // 100)):
+            with open(os.path.join(docs_path, rel_path), "a", encoding="utf-8") as f:
+                f.write("\n\n" + _paragraph(rng, _FILLER))
+        result["incremental_update_s"] = round(_timed(km.sync_sources), 4)
+
+        questions = _questions(options["queries"])
+        for concurrency in options["concurrency"]:
+            stats = _concurrent(lambda q: km.query(q, k=llm.CONTEXT_K), questions, concurrency)
+            for key, value in stats.items():
+                result[f"query_c{concurrency}_{key}"] = value
+
+        appends = []
+        for i in range(options["appends"]):
+            appends.append(_timed(km.add_interaction_to_history, f"Pregunta {i} de prueba",
+                                  "Respuesta de prueba " * 10) * 1000)
+        result["history_append_p50_ms"] = round(_percentile(appends, 0.5), 3)
+        result["history_append_p99_ms"] = round(_percentile(appends, 0.99), 3)
+
+        # Extremo a extremo: motor real, prompt real y Ollama falso
+        server = FakeOllamaServer(llm.MODEL_NAME, tokens=options["tokens"]).start()
+        engine = AssistantEngine(lambda: km, model_factory=lambda: llm.get_model(server.url),
+                                 build_prompt=llm.build_prompt, concurrency=llm.MAX_CONCURRENT_REQUESTS,
+                                 queue_size=len(questions) * 2, request_timeout=600,
+                                 context_k=llm.CONTEXT_K)
+        engine.start()
+        try:
+            answers = questions[:options["answers"]]
+            engine.ask_sync(answers[0])  # conexión y modelo ya creados
+            for concurrency in options["concurrency"]:
+                first_tokens = []
+
+                def answer(question):
+                    start = time.perf_counter()
+                    stream = engine.stream_sync(question)
+                    next(stream, None)
+                    first_tokens.append((time.perf_counter() - start) * 1000)
+                    for _ in stream:
+                        pass
+
+                stats = _concurrent(answer, answers, concurrency)
+                result[f"answer_c{concurrency}_ttft_p50_ms"] = round(_percentile(first_tokens, 0.5), 3)
+                for key, value in stats.items():
+                    result[f"answer_c{concurrency}_{key}"] = value
+        finally:
+            engine.stop()
+            server.stop()
+            km.close()
+    result["peak_rss_mb"] = round(rss.peak / (1024 * 1024), 1)
+    return result
+
+
+# ---- resultados y línea base ----
+
+def environment() -> dict:
+    import faiss
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "faiss": faiss.__version__,
+    }
+
+
+def _higher_is_better(metric: str) -> bool:
+    return metric.endswith("_qps")
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[dict]:
+    """Cambios de cada métrica frente a la línea base; `regression` si empeora más del umbral."""
+    rows = []
+    for size, current in results["results"].items():
+        previous = baseline.get("results", {}).get(size)
+        if not previous:
+            continue
+        for metric, value in current.items():
+            old = previous.get(metric)
+            if metric in ("files", "corpus_bytes", "chunks") or not isinstance(old, (int, float)):
+                continue
+            floor = next((f for suffix, f in NOISE_FLOOR.items() if metric.endswith(suffix)), 0.0)
+            if abs(value - old) <= floor or not old:
+                change = 0.0
+            else:
+                change = (value - old) / old
+            worse = -change if _higher_is_better(metric) else change
+            rows.append({"size": size, "metric": metric, "baseline": old, "value": value,
+                         "change": round(change, 4), "regression": worse > threshold})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de indexación, búsqueda y respuesta")
+    parser.add_argument("--sizes", default="50,500", help="archivos del corpus, separados por comas")
+    parser.add_argument("--concurrency", default="1,4", help="hilos simultáneos, separados por comas")
+    parser.add_argument("--queries", type=int, default=200, help="consultas de recuperación por nivel")
+    parser.add_argument("--answers", type=int, default=20, help="respuestas completas por nivel")
+    parser.add_argument("--appends", type=int, default=50, help="interacciones añadidas al historial")
+    parser.add_argument("--tokens", type=int, default=32, help="tokens de cada respuesta falsa")
+    parser.add_argument("--embed-cost-ms", type=float, default=0.0,
+                        help="milisegundos simulados por embedding")
+    parser.add_argument("--json", help="guardar los resultados en este archivo")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="línea base con la que comparar")
+    parser.add_argument("--save-baseline", action="store_true", help="guardar estos resultados como línea base")
+    parser.add_argument("--threshold", type=float, default=0.2, help="empeoramiento relativo tolerado")
+    parser.add_argument("--verbose", action="store_true", help="mostrar la salida de Jarvis")
+    args = parser.parse_args()
+
+    options = {
+        "concurrency": [int(c) for c in args.concurrency.split(",")],
+        "queries": args.queries,
+        "answers": args.answers,
+        "appends": args.appends,
+        "tokens": args.tokens,
+        "embed_cost_ms": args.embed_cost_ms,
+        "verbose": args.verbose,
+    }
+    results = {"environment": environment(), "options": options, "results": {}}
+    # Un proceso nuevo por tamaño: memoria pico y cachés independientes
+    context = multiprocessing.get_context("spawn")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        print(f"⏱️ Midiendo corpus de {size} archivos...")
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            result = pool.submit(run_size, size, options).result()
+        results["results"][str(size)] = result
+        for metric, value in result.items():
+            print(f"   {metric:<28} {value}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Resultados guardados en {args.json}")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("environment", {}).get("platform") != results["environment"]["platform"]:
+            print("⚠️ La línea base es de otra máquina; las diferencias pueden no ser del código")
+        rows = compare(results, baseline, args.threshold)
+        print(f"\n{'tamaño':>7} {'métrica':<28} {'base':>10} {'actual':>10} {'cambio':>8}")
+        for row in rows:
+            mark = "  ❌" if row["regression"] else ""
+            print(f"{row['size']:>7} {row['metric']:<28} {row['baseline']:>10} {row['value']:>10} "
+                  f"{row['change']:>+8.1%}{mark}")
+        regressions = [row for row in rows if row["regression"]]
+        if regressions:
+            print(f"\n❌ {len(regressions)} métricas empeoran más de un {args.threshold:.0%}")
+        else:
+            print("\n✅ Sin regresiones frente a la línea base")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Línea base guardada en {args.baseline}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import json
+import threading
+import http.client
+from typing import Iterator, List, Optional
+from urllib.parse import urlsplit
+
+# Errores de una conexión persistente que el servidor ya cerró por inactividad
+_STALE_CONNECTION = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+class JarvisClientError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+
+class JarvisClient:
+    """Cliente de server.py: reutiliza el proceso ya cargado en lugar de arrancar otro.
+
+    Mantiene una conexión persistente por hilo. `generate_response` y
+    `generate_response_stream` tienen la misma forma que las de llm.py, así que
+    una interfaz puede usar cualquiera de las dos, p. ej. JarvisGUI(client.generate_response).
+    """
+
+    def __init__(self, base_url: str = "http://127.0.0.1:8765", token: Optional[str] = None,
+                 timeout: float = 300):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.token = token
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conn(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _request(self, method: str, path: str, body: Optional[dict] = None,
+                 stream: bool = False) -> http.client.HTTPResponse:
+        headers = {"Accept": "text/event-stream" if stream else "application/json"}
+        data = None
+        if body is not None:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            headers["Content-Type"] = "application/json; charset=utf-8"
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        for attempt in range(2):
+            conn = self._conn()
+            try:
+                conn.request(method, path, body=data, headers=headers)
+                response = conn.getresponse()
+                break
+            except _STALE_CONNECTION:
+                # Se reintenta una vez con una conexión nueva
+                self.close()
+                if attempt:
+                    raise
+        if response.status >= 400:
+            payload = response.read()
+            try:
+                message = json.loads(payload.decode("utf-8")).get("error", "")
+            except ValueError:
+                message = payload.decode("utf-8", "replace")
+            raise JarvisClientError(response.status, message)
+        return response
+
+    def _json(self, method: str, path: str, body: Optional[dict] = None):
+        return json.loads(self._request(method, path, body).read().decode("utf-8"))
+
+    # ---- API ----
+
+    def health(self) -> dict:
+        return self._json("GET", "/health")
+
+    def ask(self, question: str, filters: Optional[dict] = None,
+            timeout: Optional[float] = None) -> dict:
+        """{"status", "text"} de la respuesta completa."""
+        return self._json("POST", "/ask", {"question": question, "filters": filters,
+                                           "timeout": timeout})
+
+    def stream(self, question: str, filters: Optional[dict] = None,
+               timeout: Optional[float] = None) -> Iterator[dict]:
+        """Eventos SSE como {"event", "data"}: varios "token" y un "done" al final."""
+        response = self._request("POST", "/ask/stream", {"question": question, "filters": filters,
+                                                         "timeout": timeout}, stream=True)
+        event, data = "message", []
+        try:
+            while True:
+                line = response.readline()
+                if not line:
+                    return
+                line = line.decode("utf-8").rstrip("\r\n")
+                if not line:
+                    if data:
+                        payload = {"event": event, "data": json.loads("\n".join(data))}
+                        if event == "done":
+                            response.read()  # fin del cuerpo: la conexión queda libre
+                        yield payload
+                        if event == "done":
+                            return
+                    event, data = "message", []
+                elif line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data.append(line[5:].strip())
+        finally:
+            if not response.isclosed():
+                # Sin leer hasta el final la conexión no se puede reutilizar
+                self.close()
+
+    def query(self, question: str, k: int = 4, filters: Optional[dict] = None) -> List[dict]:
+        """Fragmentos más relevantes ({"id", "text", "metadata"}), sin pasar por el modelo."""
+        return self._json("POST", "/query", {"question": question, "k": k,
+                                             "filters": filters})["results"]
+
+    def stats(self) -> dict:
+        return self._json("GET", "/admin/stats")
+
+    def reindex(self, full: bool = False) -> dict:
+        return self._json("POST", "/admin/reindex", {"full": full})
+
+    def sources(self) -> dict:
+        return self._json("GET", "/admin/sources")["sources"]
+
+    def inject(self, path: str, description: str = "") -> str:
+        """Inyecta un archivo del equipo del servidor; devuelve el id de la fuente."""
+        return self._json("POST", "/admin/inject", {"path": path,
+                                                    "description": description})["source_id"]
+
+    def uninject(self, source_id: str) -> int:
+        return self._json("POST", "/admin/uninject", {"source_id": source_id})["removed"]
+
+    # ---- misma forma que llm.py ----
+
+    def generate_response(self, user_input: str, filters: Optional[dict] = None) -> str:
+        return self.ask(user_input, filters)["text"]
+
+    def generate_response_stream(self, user_input: str, filters: Optional[dict] = None) -> Iterator[str]:
+        for event in self.stream(user_input, filters):
+            if event["event"] == "token":
+                yield event["data"]["token"]
@@ -0,0 +1,104 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from langchain_core.documents import Document
+
+
+class SQLiteDocstore:
+    """Texto y metadatos de los fragmentos en SQLite, indexados por la etiqueta FAISS.
+
+    Las etiquetas no se reutilizan nunca, así que una fila no cambia desde que se
+    escribe: todas las generaciones del índice comparten la misma base de datos y
+    cada consulta lee solo las filas de sus k resultados. Las filas que ya no
+    referencia ningún snapshot se purgan con `purge()`.
+    """
+
+    def __init__(self, path: str, mmap_size: int = 256 * 1024 * 1024):
+        self.path = path
+        self.mmap_size = mmap_size
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()  # una conexión por hilo
+        self._write_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                label INTEGER PRIMARY KEY,
+                doc_id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )
+        """)
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            # WAL: las lecturas no esperan a las escrituras; mmap evita copias al leer
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            self._local.conn = conn
+        return conn
+
+    def put(self, labels: Iterable[int], ids: Iterable[str], texts: Iterable[str],
+            metadatas: Iterable[Optional[dict]]):
+        """Inserta filas; reescribir la misma etiqueta (al reaplicar el WAL) es inocuo."""
+        rows = [(int(label), doc_id, text, json.dumps(metadata or {}, ensure_ascii=False))
+                for label, doc_id, text, metadata in zip(labels, ids, texts, metadatas)]
+        with self._write_lock:
+            conn = self._conn()
+            conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?)", rows)
+            conn.commit()
+
+    def get_many(self, labels: Iterable[int]) -> List[Optional[Document]]:
+        """Documentos en el mismo orden que `labels`; None si la fila no existe."""
+        labels = [int(label) for label in labels]
+        if not labels:
+            return []
+        found: Dict[int, Document] = {}
+        # Por tandas para no superar el límite de parámetros de SQLite
+        for start in range(0, len(labels), 500):
+            batch = labels[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            cursor = self._conn().execute(
+                f"SELECT label, doc_id, text, metadata FROM chunks WHERE label IN ({placeholders})", batch)
+            for label, doc_id, text, metadata in cursor:
+                found[label] = Document(id=doc_id, page_content=text, metadata=json.loads(metadata))
+        return [found.get(label) for label in labels]
+
+    def purge(self, keep: Iterable[int], below: int) -> int:
+        """Borra las filas con etiqueta < `below` que no están en `keep`."""
+        keep = [(int(label),) for label in keep]
+        with self._write_lock:
+            conn = self._conn()
+            (count,) = conn.execute("SELECT COUNT(*) FROM chunks WHERE label < ?", (below,)).fetchone()
+            if count <= len(keep):
+                return 0
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep (label INTEGER PRIMARY KEY)")
+            conn.execute("DELETE FROM keep")
+            conn.executemany("INSERT INTO keep VALUES (?)", keep)
+            cursor = conn.execute(
+                "DELETE FROM chunks WHERE label < ? AND label NOT IN (SELECT label FROM keep)", (below,))
+            conn.execute("DELETE FROM keep")
+            conn.commit()
+            return cursor.rowcount
+
+    def next_label(self) -> int:
+        """Primera etiqueta sin usar; un índice nuevo empieza aquí para no pisar filas."""
+        (label,) = self._conn().execute("SELECT MAX(label) FROM chunks").fetchone()
+        return 0 if label is None else label + 1
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
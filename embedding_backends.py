@@ -0,0 +1,198 @@
+import os
+import time
+import shutil
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Backends de embeddings; todos producen vectores de la misma dimensión y normalizados
+BACKEND_TORCH = "torch"  # sentence-transformers sobre PyTorch (referencia)
+BACKEND_ONNX = "onnx"  # el mismo modelo exportado a ONNX, en ONNX Runtime
+BACKEND_ONNX_INT8 = "onnx-int8"  # el ONNX con los pesos cuantizados a int8
+BACKENDS = (BACKEND_TORCH, BACKEND_ONNX, BACKEND_ONNX_INT8)
+
+
+class EmbeddingConfig:
+    """Qué backend calcula los embeddings y con qué hilos y tamaño de tanda.
+
+    `threads` son los hilos intra-op del backend (None: los que decida él).
+    Los modelos ONNX se descargan o se generan una vez en `onnx_dir`.
+    """
+
+    def __init__(self, backend: str = BACKEND_TORCH,
+                 model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 threads: Optional[int] = None, batch_size: int = 32, max_length: int = 256,
+                 onnx_dir: str = "onnx_models"):
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend de embeddings desconocido: {backend}")
+        self.backend = backend
+        self.model_name = model_name
+        self.threads = threads
+        self.batch_size = batch_size
+        self.max_length = max_length  # tokens por texto, como max_seq_length en sentence-transformers
+        self.onnx_dir = onnx_dir
+
+    def variant(self, backend: str) -> "EmbeddingConfig":
+        """La misma configuración con otro backend."""
+        return EmbeddingConfig(backend, self.model_name, self.threads, self.batch_size,
+                               self.max_length, self.onnx_dir)
+
+    def cache_name(self) -> str:
+        """Espacio de la caché de embeddings: int8 da vectores algo distintos y no se mezclan."""
+        if self.backend == BACKEND_ONNX_INT8:
+            return f"{self.model_name}#{self.backend}"
+        # torch y onnx (fp32) coinciden; se conserva la caché ya calculada
+        return self.model_name
+
+
+def load_embeddings(config: EmbeddingConfig) -> Embeddings:
+    """Construye el modelo de embeddings del backend elegido."""
+    if config.backend == BACKEND_TORCH:
+        # Importación diferida: torch solo se carga si se usa este backend
+        from langchain_huggingface import HuggingFaceEmbeddings
+        if config.threads:
+            import torch
+            torch.set_num_threads(config.threads)
+        return HuggingFaceEmbeddings(
+            model_name=config.model_name,
+            encode_kwargs={'normalize_embeddings': True, 'batch_size': config.batch_size}
+        )
+    return OnnxEmbeddings(prepare_onnx_model(config), threads=config.threads,
+                          batch_size=config.batch_size, max_length=config.max_length)
+
+
+def prepare_onnx_model(config: EmbeddingConfig) -> str:
+    """Carpeta con model.onnx (o model_int8.onnx) y tokenizer.json del modelo.
+
+    Se descarga la exportación ONNX publicada con el modelo o, si no la hay y
+    está instalado optimum, se exporta localmente. La versión int8 se obtiene
+    con cuantización dinámica de ONNX Runtime, válida en cualquier CPU.
+    """
+    folder = os.path.join(config.onnx_dir, config.model_name.replace("/", "--"))
+    model_path = os.path.join(folder, "model.onnx")
+    tokenizer_path = os.path.join(folder, "tokenizer.json")
+    if not (os.path.exists(model_path) and os.path.exists(tokenizer_path)):
+        os.makedirs(folder, exist_ok=True)
+        print(f"📦 Preparando {config.model_name} en ONNX (solo la primera vez)...")
+        try:
+            from huggingface_hub import hf_hub_download
+            for remote, local in (("onnx/model.onnx", model_path), ("tokenizer.json", tokenizer_path)):
+                shutil.copyfile(hf_hub_download(config.model_name, remote), local + ".tmp")
+                os.replace(local + ".tmp", local)
+        except Exception as e:
+            print(f"⚠️ No hay exportación ONNX publicada ({str(e)}), exportando con optimum...")
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+            from transformers import AutoTokenizer
+            ORTModelForFeatureExtraction.from_pretrained(config.model_name, export=True).save_pretrained(folder)
+            AutoTokenizer.from_pretrained(config.model_name).save_pretrained(folder)
+
+    if config.backend != BACKEND_ONNX_INT8:
+        return model_path
+    quantized_path = os.path.join(folder, "model_int8.onnx")
+    if not os.path.exists(quantized_path):
+        print("🗜️ Cuantizando el modelo ONNX a int8...")
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        tmp_path = quantized_path + ".tmp"
+        quantize_dynamic(model_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, quantized_path)
+    return quantized_path
+
+
+class OnnxEmbeddings(Embeddings):
+    """Embeddings de un modelo sentence-transformers exportado a ONNX.
+
+    Reproduce lo que hace sentence-transformers con los modelos tipo MiniLM:
+    media de los tokens según la máscara de atención y normalización L2, así
+    que la dimensión y la escala coinciden con las del índice ya construido.
+    """
+
+    def __init__(self, model_path: str, threads: Optional[int] = None, batch_size: int = 32,
+                 max_length: int = 256):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1  # el paralelismo entre tandas lo pone la ingesta
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {item.name for item in self.session.get_inputs()}
+        outputs = [item.name for item in self.session.get_outputs()]
+        # Las exportaciones de sentence-transformers pueden traer más salidas; interesan los tokens
+        self.output_name = "last_hidden_state" if "last_hidden_state" in outputs else outputs[0]
+        self.batch_size = batch_size
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(os.path.dirname(model_path), "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self.tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        # Por longitud: las tandas llevan menos relleno
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            rows = order[start:start + self.batch_size]
+            encodings = self.tokenizer.encode_batch([texts[i] for i in rows])
+            mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {"input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                     "attention_mask": mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+            hidden = self.session.run([self.output_name], feeds)[0]
+            weights = mask[:, :, None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            for row, vector in zip(rows, pooled):
+                vectors[row] = vector
+        return np.stack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+def parity_report(config: EmbeddingConfig, texts: List[str],
+                  backends: Optional[List[str]] = None) -> List[dict]:
+    """Deriva coseno frente a torch y rendimiento de cada backend sobre `texts`.
+
+    Por fila: dimensión, error máximo de la norma, deriva coseno media, p99 y
+    máxima respecto a la referencia, textos/s y tiempo de carga.
+    """
+    rows = []
+    reference = None
+    for backend in backends or list(BACKENDS):
+        started = time.perf_counter()
+        try:
+            model = load_embeddings(config.variant(backend))
+        except Exception as e:
+            print(f"⚠️ Backend {backend} no disponible: {str(e)}")
+            continue
+        load_s = time.perf_counter() - started
+        model.embed_documents(texts[:config.batch_size])  # calentamiento
+        started = time.perf_counter()
+        vectors = np.asarray(model.embed_documents(texts), dtype=np.float32)
+        elapsed = time.perf_counter() - started
+        row = {"backend": backend, "dim": int(vectors.shape[1]), "load_s": load_s,
+               "texts_per_s": len(texts) / elapsed if elapsed else float("inf"),
+               "norm_error": float(np.abs(np.linalg.norm(vectors, axis=1) - 1).max())}
+        # La deriva es solo de dirección; la norma ya se mide en norm_error
+        unit = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        if reference is None:
+            reference = unit  # el primero (torch por defecto) es la referencia
+        if unit.shape != reference.shape:
+            row.update(drift_mean=None, drift_p99=None, drift_max=None)
+        else:
+            drift = 1 - np.sum(unit * reference, axis=1)
+            row.update(drift_mean=float(drift.mean()), drift_p99=float(np.percentile(drift, 99)),
+                       drift_max=float(drift.max()))
+        rows.append(row)
+    if rows:
+        base = rows[0]["texts_per_s"]
+        for row in rows:
+            row["speedup"] = row["texts_per_s"] / base if base else None
+    return rows
@@ -0,0 +1,221 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+_KEY_BYTES = 32  # sha256 del texto
+
+
+class EmbeddingCache:
+    """Caché persistente de embeddings direccionada por el hash del texto.
+
+    Los vectores viven en una matriz float32 mapeada en memoria; en paralelo se
+    guardan la clave (sha256) y el último acceso de cada fila para poder
+    desalojar las menos usadas al superar el límite.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, normalize: bool,
+                 max_entries: int = 200_000):
+        namespace = hashlib.sha256(f"{model_name}|{normalize}".encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(cache_dir, namespace)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._rows: Dict[bytes, int] = {}
+        self._dim = 0
+        self._count = 0
+        self._capacity = 0
+        self._tick = 0
+        self._vectors = self._keys = self._ticks = None
+        os.makedirs(self.path, exist_ok=True)
+
+        meta_path = os.path.join(self.path, "meta.json")
+        if os.path.exists(meta_path):
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                self._dim, self._count = meta["dim"], meta["count"]
+                if meta["capacity"]:
+                    self._open(meta["capacity"])
+                if self._count:
+                    keys = self._keys[:self._count]
+                    self._rows = {keys[i].tobytes(): i for i in range(self._count)}
+                    self._tick = int(self._ticks[:self._count].max())
+            except Exception as e:
+                print(f"⚠️ Caché de embeddings ilegible, se empieza de cero: {str(e)}")
+                self._dim = self._count = self._capacity = 0
+                self._rows = {}
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _open(self, capacity: int):
+        """(Re)abre los ficheros mapeados con la capacidad indicada, ampliándolos si hace falta."""
+        for name, itemsize in (("vectors.f32", 4 * self._dim), ("keys.bin", _KEY_BYTES), ("ticks.bin", 8)):
+            with open(self._file(name), "ab") as f:
+                if f.tell() < capacity * itemsize:
+                    f.truncate(capacity * itemsize)
+        self._vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r+",
+                                  shape=(capacity, self._dim))
+        self._keys = np.memmap(self._file("keys.bin"), dtype=np.uint8, mode="r+",
+                               shape=(capacity, _KEY_BYTES))
+        self._ticks = np.memmap(self._file("ticks.bin"), dtype=np.uint64, mode="r+",
+                                shape=(capacity,))
+        self._capacity = capacity
+
+    def get_many(self, keys: List[bytes]) -> List[Optional[np.ndarray]]:
+        """Vectores cacheados (o None) para cada clave."""
+        with self._lock:
+            result = []
+            for key in keys:
+                row = self._rows.get(key)
+                if row is None:
+                    self.misses += 1
+                    result.append(None)
+                else:
+                    self.hits += 1
+                    self._tick += 1
+                    self._ticks[row] = self._tick
+                    result.append(np.array(self._vectors[row]))
+            return result
+
+    def put_many(self, keys: List[bytes], vectors: np.ndarray):
+        with self._lock:
+            vectors = np.asarray(vectors, dtype=np.float32)
+            if not self._dim:
+                self._dim = vectors.shape[1]
+            new_rows = sum(1 for key in set(keys) if key not in self._rows)
+            if self._count + new_rows > self._capacity:
+                self._grow(self._count + new_rows)
+            for key, vector in zip(keys, vectors):
+                if key in self._rows:
+                    continue
+                row = self._count
+                self._vectors[row] = vector
+                self._keys[row] = np.frombuffer(key, dtype=np.uint8)
+                self._tick += 1
+                self._ticks[row] = self._tick
+                self._rows[key] = row
+                self._count += 1
+            if self._count > self.max_entries:
+                self._evict(int(self.max_entries * 0.9))
+            self._flush()
+
+    def _grow(self, needed: int):
+        capacity = max(1024, self._capacity)
+        while capacity < needed:
+            capacity *= 2
+        self._close_maps()
+        self._open(capacity)
+
+    def _close_maps(self):
+        for array in (self._vectors, self._keys, self._ticks):
+            if array is not None:
+                array.flush()
+        self._vectors = self._keys = self._ticks = None
+
+    def _evict(self, keep: int):
+        """Compacta la matriz conservando las `keep` filas de uso más reciente."""
+        order = np.argsort(self._ticks[:self._count])[::-1][:keep]
+        order.sort()
+        # Si la compactación se interrumpe, la caché queda vacía en lugar de inconsistente
+        self._count = 0
+        self._flush()
+        vectors = np.array(self._vectors[order])
+        keys = np.array(self._keys[order])
+        ticks = np.array(self._ticks[order])
+        self._vectors[:len(order)] = vectors
+        self._keys[:len(order)] = keys
+        self._ticks[:len(order)] = ticks
+        self._count = len(order)
+        self._rows = {keys[i].tobytes(): i for i in range(self._count)}
+        print(f"🧹 Caché de embeddings reducida a {self._count} entradas")
+
+    def evict(self, max_entries: int):
+        """Reduce la caché a como mucho `max_entries` entradas."""
+        with self._lock:
+            if self._count > max_entries:
+                self._evict(max_entries)
+                self._flush()
+
+    def _flush(self):
+        # Primero los datos y después meta.json: las filas no confirmadas se ignoran al cargar
+        for array in (self._vectors, self._keys, self._ticks):
+            if array is not None:
+                array.flush()
+        tmp_path = self._file("meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self._dim, "count": self._count, "capacity": self._capacity}, f)
+        os.replace(tmp_path, self._file("meta.json"))
+
+    def __len__(self):
+        return self._count
+
+
+class CachedEmbeddings(Embeddings):
+    """Envuelve un modelo de embeddings y solo le pide los textos nunca vistos."""
+
+    def __init__(self, embeddings: Embeddings, cache_dir: str, model_name: str,
+                 normalize: bool, max_entries: int = 200_000, query_cache_size: int = 1024):
+        self.embeddings = embeddings
+        self.cache = EmbeddingCache(cache_dir, model_name, normalize, max_entries)
+        self.query_cache_size = query_cache_size
+        self.query_hits = 0
+        self.query_misses = 0
+        self._queries: "OrderedDict[bytes, List[float]]" = OrderedDict()
+        self._query_lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [EmbeddingCache.key(text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = np.asarray(
+                self.embeddings.embed_documents([texts[i] for i in missing]), dtype=np.float32
+            )
+            self.cache.put_many([keys[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+        return [vector.tolist() for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = EmbeddingCache.key(text)
+        with self._query_lock:
+            vector = self._queries.get(key)
+            if vector is not None:
+                self._queries.move_to_end(key)
+                self.query_hits += 1
+                return vector
+            self.query_misses += 1
+
+        cached = self.cache.get_many([key])[0]
+        if cached is not None:
+            vector = cached.tolist()
+        else:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put_many([key], np.asarray([vector], dtype=np.float32))
+
+        with self._query_lock:
+            self._queries[key] = vector
+            if len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
+        return vector
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "query_lru_hits": self.query_hits,
+            "query_lru_misses": self.query_misses,
+            "entries": len(self.cache),
+        }
@@ -0,0 +1,73 @@
+"""Paridad y rendimiento de los backends de embeddings sobre la base de conocimiento.
+
+Uso:
+    python embedding_report.py [--backends torch,onnx,onnx-int8] [--sample 500]
+                               [--texts textos.txt] [--json informe.json]
+
+Cada backend calcula los embeddings de los mismos fragmentos; se compara con
+el primero (torch) la deriva coseno y se mide cuántos textos por segundo
+procesa, para elegir EMBEDDING_BACKEND, EMBEDDING_THREADS y EMBEDDING_BATCH_SIZE
+en llm.py. Con una deriva de milésimas el índice existente sigue siendo válido.
+"""
+import os
+import json
+import random
+import argparse
+
+from llm import embedding_config
+
+
+def corpus_sample(docs_path: str, sample: int) -> list:
+    """Fragmentos de conocimiento_manual elegidos al azar (siempre los mismos)."""
+    from ingestion import make_splitter
+    splitter = make_splitter()
+    texts = []
+    for root, _, files in os.walk(docs_path):
+        for name in sorted(files):
+            if name.endswith(".txt"):
+                with open(os.path.join(root, name), "r", encoding="utf-8", errors="replace") as f:
+                    texts.extend(splitter.split_text(f.read()))
+    return random.Random(0).sample(texts, min(sample, len(texts)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deriva y rendimiento de los backends de embeddings")
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8",
+                        help="backends separados por comas; el primero es la referencia")
+    parser.add_argument("--sample", type=int, default=500,
+                        help="fragmentos del corpus si no se dan textos")
+    parser.add_argument("--texts", help="archivo con un texto por línea")
+    parser.add_argument("--json", help="guardar también las filas en este archivo")
+    args = parser.parse_args()
+
+    if args.texts:
+        with open(args.texts, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = corpus_sample("conocimiento_manual", args.sample)
+    if not texts:
+        print("⚠️ No hay textos con los que comparar")
+        return
+
+    from embedding_backends import parity_report
+    config = embedding_config()
+    print(f"📊 {len(texts)} textos con {config.model_name} "
+          f"(hilos: {config.threads or 'auto'}, tanda: {config.batch_size})")
+    rows = parity_report(config, texts, backends=args.backends.split(","))
+
+    print(f"\n{'backend':<10} {'dim':>5} {'textos/s':>9} {'x':>6} {'deriva media':>13} "
+          f"{'p99':>9} {'máx':>9} {'error norma':>12} {'carga s':>8}")
+    for row in rows:
+        drift = [f"{row[key]:.2e}" if row[key] is not None else "-"
+                 for key in ("drift_mean", "drift_p99", "drift_max")]
+        print(f"{row['backend']:<10} {row['dim']:>5} {row['texts_per_s']:>9.1f} {row['speedup']:>6.2f} "
+              f"{drift[0]:>13} {drift[1]:>9} {drift[2]:>9} {row['norm_error']:>12.1e} {row['load_s']:>8.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"\n💾 Informe guardado en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import AsyncIterator, Callable, Iterator, Optional
+
+from ollama_supervisor import STATE_DOWN
+from telemetry import metrics
+
+# Estados con los que termina una petición
+STATUS_OK = "ok"
+STATUS_BUSY = "busy"
+STATUS_TIMEOUT = "timeout"
+STATUS_CANCELLED = "cancelled"
+STATUS_ERROR = "error"
+
+MSG_EMPTY = "Lo siento, no he recibido ninguna pregunta. ¿Podrías reformularla?"
+MSG_BUSY = "Estoy atendiendo demasiadas preguntas a la vez. Por favor, inténtalo de nuevo en unos segundos."
+MSG_TIMEOUT = "Lo siento, la respuesta está tardando demasiado. Por favor, intenta de nuevo en unos minutos."
+MSG_NO_MODEL = "No se pudo inicializar el modelo. Por favor, verifica que Ollama esté funcionando."
+MSG_MODEL_ERROR = "Lo siento, hubo un error al procesar tu pregunta. Por favor, espera unos minutos e intenta de nuevo."
+MSG_INCOHERENT = "Lo siento, no he podido generar una respuesta coherente. ¿Podrías reformular tu pregunta?"
+MSG_CANCELLED = "Petición cancelada."
+MSG_DOWN = "El sistema necesita un descanso. Por favor, espera unos minutos antes de intentar de nuevo."
+
+
+class EngineResult:
+    """Resultado final de una petición: estado y texto completo mostrado al usuario."""
+
+    def __init__(self, status: str, text: str):
+        self.status = status
+        self.text = text
+
+    def __repr__(self):
+        return f"EngineResult({self.status!r}, {self.text[:40]!r})"
+
+
+class RequestHandle:
+    """Petición encolada; permite esperar su resultado o cancelarla desde cualquier hilo."""
+
+    def __init__(self, text: str, deadline: float, on_token: Optional[Callable[[str], None]],
+                 filters: Optional[dict] = None):
+        self.text = text
+        self.deadline = deadline  # en tiempo de time.monotonic()
+        self.on_token = on_token
+        self.filters = filters or {}  # topics, source_kinds, sources de KnowledgeManager.query
+        self.enqueued = time.perf_counter()
+        self.future: Future = Future()
+        self._parts = []
+        self._cancelled = False
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def emit(self, token: str):
+        self._parts.append(token)
+        if self.on_token:
+            self.on_token(token)
+
+    def cancel(self):
+        """Cancela la petición; si ya está en curso se aborta la llamada HTTP a Ollama."""
+        if self._loop is None:
+            self._cancelled = True
+        else:
+            # Se resuelve dentro del bucle para no competir con el worker que la toma
+            self._loop.call_soon_threadsafe(self._cancel_in_loop)
+
+    def _cancel_in_loop(self):
+        self._cancelled = True
+        if self._task is not None:
+            self._task.cancel()
+
+    def result(self, timeout: Optional[float] = None) -> EngineResult:
+        return self.future.result(timeout)
+
+    def _finish(self, status: str, message: Optional[str] = None):
+        # Los mensajes que no salieron del modelo también se entregan como tokens
+        if message:
+            self.emit(("\n\n" if self._parts else "") + message)
+        if not self.future.done():
+            self.future.set_result(EngineResult(status, "".join(self._parts)))
+
+
+class AssistantEngine:
+    """Motor asíncrono que atiende las preguntas con concurrencia limitada hacia Ollama.
+
+    Corre su propio bucle asyncio en un hilo de fondo; expone entradas asíncronas
+    (ask, ask_stream) y síncronas (submit, ask_sync, stream_sync).
+    """
+
+    def __init__(self, knowledge_provider: Callable, model_factory: Callable, build_prompt: Callable,
+                 supervisor=None, concurrency: int = 1,
+                 queue_size: int = 4, request_timeout: float = 120,
+                 context_k: int = 2,
+                 response_cache=None, prefetcher=None, router=None):
+        # Devuelve el KnowledgeManager, bloqueando si aún se está cargando
+        self.knowledge_provider = knowledge_provider
+        self._km = None
+        self.model_factory = model_factory
+        self.build_prompt = build_prompt
+        self.supervisor = supervisor
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.request_timeout = request_timeout
+        self.context_k = context_k
+        self.response_cache = response_cache
+        self.prefetcher = prefetcher  # RetrievalPrefetcher con lo recuperado mientras se escribía
+        self.router = router  # ModelRouter: modelo y presupuesto de cada pregunta (None: siempre el mismo)
+        self.counters = {STATUS_OK: 0, STATUS_BUSY: 0, STATUS_TIMEOUT: 0,
+                         STATUS_CANCELLED: 0, STATUS_ERROR: 0}
+
+        self._model = None
+        self._queued = 0
+        self._count_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    # ---- ciclo de vida ----
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run_loop, daemon=True, name="jarvis-engine")
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._model_lock = asyncio.Lock()
+        for i in range(self.concurrency):
+            self._loop.create_task(self._worker())
+        self._loop.call_soon(self._ready.set)
+        self._loop.run_forever()
+        # Tras stop(): se cancelan los workers y lo que estuviera en curso antes de cerrar el bucle
+        tasks = asyncio.all_tasks(self._loop)
+        for task in tasks:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self._loop.close()
+
+    # ---- entradas ----
+
+    def submit(self, text: str, on_token: Optional[Callable[[str], None]] = None,
+               timeout: Optional[float] = None, filters: Optional[dict] = None) -> RequestHandle:
+        """Encola una pregunta sin bloquear; si la cola está llena se rechaza al momento.
+
+        `filters` limita la búsqueda de contexto (ver KnowledgeManager.query).
+        """
+        timeout = self.request_timeout if timeout is None else timeout
+        request = RequestHandle(text, time.monotonic() + timeout, on_token, filters)
+        request._loop = self._loop
+
+        if not text or not text.strip():
+            request._finish(STATUS_ERROR, MSG_EMPTY)
+            return request
+
+        with self._count_lock:
+            if self._queued >= self.queue_size:
+                self.counters[STATUS_BUSY] += 1
+                busy = True
+            else:
+                self._queued += 1
+                busy = False
+        if busy:
+            print("⚠️ Cola de peticiones llena, se rechaza la pregunta")
+            request._finish(STATUS_BUSY, MSG_BUSY)
+            return request
+
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, request)
+        return request
+
+    def ask_sync(self, text: str, timeout: Optional[float] = None,
+                 filters: Optional[dict] = None) -> EngineResult:
+        return self.submit(text, timeout=timeout, filters=filters).result()
+
+    def stream_sync(self, text: str, timeout: Optional[float] = None,
+                    filters: Optional[dict] = None) -> Iterator[str]:
+        tokens = queue.Queue()
+        request = self.submit(text, on_token=tokens.put, timeout=timeout, filters=filters)
+        request.future.add_done_callback(lambda _: tokens.put(None))
+        try:
+            while True:
+                token = tokens.get()
+                if token is None:
+                    return
+                yield token
+        finally:
+            if not request.future.done():
+                request.cancel()
+
+    async def ask(self, text: str, timeout: Optional[float] = None,
+                  filters: Optional[dict] = None) -> EngineResult:
+        return await asyncio.wrap_future(self.submit(text, timeout=timeout, filters=filters).future)
+
+    async def ask_stream(self, text: str, timeout: Optional[float] = None,
+                         filters: Optional[dict] = None) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        tokens: asyncio.Queue = asyncio.Queue()
+        request = self.submit(text, timeout=timeout, filters=filters,
+                              on_token=lambda t: loop.call_soon_threadsafe(tokens.put_nowait, t))
+        request.future.add_done_callback(lambda _: loop.call_soon_threadsafe(tokens.put_nowait, None))
+        try:
+            while True:
+                token = await tokens.get()
+                if token is None:
+                    return
+                yield token
+        finally:
+            if not request.future.done():
+                request.cancel()
+
+    def stats(self) -> dict:
+        stats = dict(self.counters, queued=self._queued, concurrency=self.concurrency)
+        if self.response_cache is not None:
+            stats["response_cache"] = self.response_cache.stats()
+        if self.prefetcher is not None:
+            stats["prefetch"] = self.prefetcher.stats()
+        if self.router is not None:
+            stats["routing"] = self.router.stats()
+        if self.supervisor is not None:
+            stats["ollama"] = self.supervisor.status()
+        stats["latency"] = metrics.latencies()
+        return stats
+
+    # ---- procesamiento ----
+
+    async def _worker(self):
+        while True:
+            request = await self._queue.get()
+            with self._count_lock:
+                self._queued -= 1
+            if request._cancelled:
+                self._complete(request, STATUS_CANCELLED, MSG_CANCELLED)
+                continue
+
+            remaining = request.deadline - time.monotonic()
+            if remaining <= 0:
+                self._complete(request, STATUS_TIMEOUT, MSG_TIMEOUT)
+                continue
+
+            # La tarea hereda la traza, y con ella los hilos a los que delega trabajo
+            with metrics.trace("question") as trace:
+                metrics.record("queue_wait", time.perf_counter() - request.enqueued, request.enqueued)
+                request._task = asyncio.ensure_future(self._process(request))
+                try:
+                    status, message = await asyncio.wait_for(request._task, timeout=remaining)
+                except asyncio.TimeoutError:
+                    # wait_for cancela la tarea y con ella la conexión con Ollama
+                    print("\n⚠️ Respuesta demasiado lenta, se aborta la petición")
+                    self._report_failure("timeout")
+                    status, message = STATUS_TIMEOUT, MSG_TIMEOUT
+                except asyncio.CancelledError:
+                    if not request._cancelled or asyncio.current_task().cancelling():
+                        # Lo cancelado es el propio worker (stop()): se cierra la petición y se termina
+                        self._complete(request, STATUS_CANCELLED, MSG_CANCELLED)
+                        raise
+                    status, message = STATUS_CANCELLED, MSG_CANCELLED
+                except Exception as e:
+                    print(f"⚠️ Error al generar respuesta: {str(e)}")
+                    status, message = STATUS_ERROR, f"Lo siento, ha ocurrido un error: {str(e)}"
+                trace.attrs["status"] = status
+            self._complete(request, status, message)
+
+    def _complete(self, request: RequestHandle, status: str, message: Optional[str]):
+        # submit() también los cuenta, desde los hilos de quien pregunta
+        with self._count_lock:
+            self.counters[status] += 1
+        metrics.inc("requests_total", status=status)
+        request._finish(status, message)
+
+    async def _process(self, request: RequestHandle):
+        # Si Ollama está caído se responde al instante en lugar de esperar al timeout
+        if self.supervisor is not None and self.supervisor.state == STATE_DOWN:
+            return STATUS_ERROR, MSG_DOWN
+
+        # El modelo se prepara mientras se espera al conocimiento y se busca contexto
+        model_task = asyncio.ensure_future(self._ensure_model())
+        try:
+            return await self._answer(request, model_task)
+        finally:
+            # Respuesta de la caché, error o cancelación: la tarea no debe quedar huérfana
+            if not model_task.done():
+                model_task.cancel()
+            elif not model_task.cancelled():
+                model_task.exception()  # su error ya se informó o no importa; se da por recogido
+
+    async def _answer(self, request: RequestHandle, model_task: asyncio.Future):
+        with metrics.span("knowledge_wait"):
+            km = await self._knowledge()
+
+        # Si la pregunta se precargó mientras se escribía, embedding y contexto ya están hechos
+        version = km.knowledge_version()
+        prefetched = None
+        if self.prefetcher is not None:
+            with metrics.span("prefetch_wait") as span:
+                span["result"], prefetched = await asyncio.to_thread(
+                    self.prefetcher.take, request.text, request.filters, version)
+
+        # El embedding de la pregunta sirve tanto para la caché como para la búsqueda
+        if prefetched is not None:
+            question_vector = prefetched.vector
+        else:
+            with metrics.span("query_embedding"):
+                question_vector = await asyncio.to_thread(km.embeddings.embed_query, request.text)
+        if request.filters:
+            # Con otro alcance la misma pregunta puede tener otra respuesta
+            version += ":" + json.dumps(request.filters, sort_keys=True)
+        if self.response_cache is not None:
+            cached = self.response_cache.lookup(question_vector, version)
+            metrics.inc("response_cache_total", result="hit" if cached is not None else "miss")
+            if cached is not None:
+                request.emit(cached)
+                return STATUS_OK, None
+
+        # La recuperación de contexto corre en paralelo con la preparación del modelo
+        if prefetched is not None:
+            print("\n⚡ Usando el contexto precargado mientras escribías")
+            km.record_hits(prefetched.docs)
+            context_fragments, model = prefetched.docs, await model_task
+        else:
+            print("\n🔍 Buscando información relevante...")
+            context_fragments, model = await asyncio.gather(
+                asyncio.to_thread(km.query, request.text, self.context_k, question_vector,
+                                  **request.filters),
+                model_task
+            )
+        if model is None:
+            return STATUS_ERROR, MSG_NO_MODEL
+
+        # Con el contexto ya recuperado se decide qué modelo responde y cuánto puede generar
+        route, budget = None, {}
+        if self.router is not None:
+            with metrics.span("model_route") as span:
+                route = self.router.route(request.text, context_fragments)
+                span.update(tier=route.tier.name, reason=route.reason, num_predict=route.num_predict)
+            model = await asyncio.to_thread(self.router.client, route) or model
+            budget = {"num_ctx": route.num_ctx, "num_predict": route.num_predict}
+
+        with metrics.span("prompt_build"):
+            prompt = self.build_prompt(request.text, context_fragments, **budget)
+
+        if route is not None:
+            print(f"\n🧠 Consultando modelo {route.model} ({route.tier.name}, {route.reason})...")
+        else:
+            print("\n🧠 Consultando modelo Mistral...")
+        with metrics.span("llm_total") as span:
+            started = time.perf_counter()
+            first_token = False
+            if route is not None:
+                span["tier"] = route.tier.name
+            try:
+                async for chunk in model.astream(prompt):
+                    if chunk.content:
+                        if not first_token:
+                            first_token = True
+                            metrics.record("llm_first_token", time.perf_counter() - started, started)
+                            if route is not None:
+                                # Por nivel, para ajustar los umbrales del enrutado
+                                metrics.observe(f"llm_first_token.{route.tier.name}",
+                                                time.perf_counter() - started)
+                        request.emit(chunk.content)
+            except asyncio.CancelledError:
+                raise
+            except Exception as model_error:
+                print(f"\n⚠️ Error en el modelo: {str(model_error)}")
+                self._report_failure(str(model_error))
+                span["error"] = "model"
+                return STATUS_ERROR, MSG_MODEL_ERROR
+            span["chunks"] = len(request._parts)
+            if route is not None:
+                metrics.observe(f"llm_total.{route.tier.name}", time.perf_counter() - started)
+
+        response = "".join(request._parts)
+        if not response.strip():
+            return STATUS_ERROR, MSG_INCOHERENT
+
+        # 💾 Guardar interacción
+        with metrics.span("history_append"):
+            await asyncio.to_thread(km.add_interaction_to_history, request.text, response)
+        if self.response_cache is not None:
+            await asyncio.to_thread(self.response_cache.store, request.text,
+                                    question_vector, response, version)
+        return STATUS_OK, None
+
+    async def _knowledge(self):
+        """Espera, solo si hace falta, a que termine la carga en segundo plano del conocimiento."""
+        if self._km is None:
+            self._km = await asyncio.to_thread(self.knowledge_provider)
+        return self._km
+
+    async def _ensure_model(self):
+        async with self._model_lock:
+            if self._model is None:
+                self._model = await asyncio.to_thread(self.model_factory)
+            return self._model
+
+    def _report_failure(self, reason: str):
+        # El supervisor decide si hay que reiniciar; la petición no espera por ello
+        if self.supervisor is not None:
+            self.supervisor.report_failure(reason)
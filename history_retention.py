@@ -0,0 +1,376 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Cabecera de cada interacción; la clave tras '#' falta en los historiales antiguos
+INTERACTION_HEADER = re.compile(
+    r"--- Interacción (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})(?: #(\w+))? ---")
+SEGMENTS_DIR = "historial"  # carpeta de los segmentos compactados, dentro de docs_path
+SEGMENT_PREFIX = "segmento-"
+HITS_SAVE_INTERVAL = 60  # segundos mínimos entre escrituras de los aciertos
+
+
+def format_interaction(timestamp: str, key: str, user_input: str, response: str) -> str:
+    return f"\n--- Interacción {timestamp} #{key} ---\nPregunta: {user_input}\nRespuesta: {response}\n"
+
+
+def interaction_body(text: str) -> str:
+    """Pregunta y respuesta sin la cabecera, que cambia aunque el contenido se repita."""
+    return INTERACTION_HEADER.sub("", text, count=1).strip()
+
+
+def interaction_key(match: re.Match) -> str:
+    """Clave de una interacción: la de su cabecera o, en las antiguas, su fecha."""
+    return match.group(2) or re.sub(r"\D", "", match.group(1))
+
+
+class Interaction:
+    __slots__ = ("key", "timestamp", "text")
+
+    def __init__(self, key: str, timestamp: str, text: str):
+        self.key = key
+        self.timestamp = timestamp
+        self.text = text
+
+    @property
+    def size(self) -> int:
+        return len(self.text.encode("utf-8"))
+
+
+def parse_interactions(text: str, default_timestamp: str) -> List[Interaction]:
+    """Divide un archivo de historial en interacciones sin perder ni repetir caracteres."""
+    matches = list(INTERACTION_HEADER.finditer(text))
+    # Cada interacción empieza en el salto de línea que precede a su cabecera
+    cuts = [m.start() - 1 if m.start() and text[m.start() - 1] == "\n" else m.start()
+            for m in matches]
+    interactions = []
+    preamble = text[:cuts[0]] if cuts else text
+    if preamble.strip():
+        # Texto sin cabecera (escrito a mano): se conserva como una interacción más
+        digest = hashlib.sha256(preamble.encode("utf-8")).hexdigest()[:12]
+        interactions.append(Interaction(digest, default_timestamp, preamble))
+        preamble = ""
+    for i, match in enumerate(matches):
+        end = cuts[i + 1] if i + 1 < len(cuts) else len(text)
+        body = text[cuts[i]:end]
+        if i == 0:
+            body = preamble + body
+        interactions.append(Interaction(interaction_key(match), match.group(1), body))
+    return interactions
+
+
+class _Pack:
+    __slots__ = ("path", "items", "changed")
+
+    def __init__(self, path: Optional[str], items: List[Interaction], changed: bool):
+        self.path = path
+        self.items = items
+        self.changed = changed
+
+    @property
+    def size(self) -> int:
+        return sum(item.size for item in self.items)
+
+
+class HistoryRetention:
+    """Límites, desalojo y compactación del historial de conversaciones.
+
+    Las interacciones nuevas se añaden al archivo activo; al superar
+    `segment_bytes` su contenido pasa a un segmento en docs_path/historial/.
+    Las que superan `max_age_days`, y si aún sobran `max_interactions` o
+    `max_bytes` las menos recuperadas por las consultas, se eliminan al
+    compactar. Solo se reescriben los segmentos que pierden interacciones, y
+    los pequeños se unen al vecino, así que los demás no se vuelven a indexar.
+    Las de los últimos `grace_days` se desalojan solo si no queda otra.
+
+    Para detectar duplicados se guarda el embedding de la pregunta y la
+    respuesta de cada interacción, como hace SemanticResponseCache.
+    """
+
+    def __init__(self, docs_path: str, history_file: str, state_dir: str,
+                 dedup_similarity: float = 0.95, max_age_days: float = 365,
+                 max_interactions: int = 2000, max_bytes: int = 2 * 1024 * 1024,
+                 segment_bytes: int = 128 * 1024, grace_days: float = 7):
+        self.docs_path = docs_path
+        self.history_file = history_file
+        self.segments_dir = os.path.join(docs_path, SEGMENTS_DIR)
+        self.hits_path = os.path.join(state_dir, "history_hits.json")
+        self.vectors_path = os.path.join(state_dir, "history_vectors.npz")
+        self.dedup_similarity = dedup_similarity
+        self.max_age_days = max_age_days
+        self.max_interactions = max_interactions
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.grace_days = grace_days
+        self._lock = threading.Lock()
+        self._hits: Dict[str, list] = {}  # clave -> [veces recuperada, última vez]
+        self._hits_dirty = False
+        self._hits_saved = 0.0
+        self._vectors: Dict[str, np.ndarray] = {}  # clave -> embedding normalizado
+        self._vectors_dirty = False
+        self._matrix: Optional[Tuple[List[str], np.ndarray]] = None
+        self._pending: Dict[str, str] = {}  # interacciones sin embedding: clave -> texto
+        # Totales del historial para decidir sin leerlo si toca compactar
+        self.count = 0
+        self.bytes = 0
+        self.oldest: Optional[str] = None
+        try:
+            if os.path.exists(self.hits_path):
+                with open(self.hits_path, "r", encoding="utf-8") as f:
+                    self._hits = json.load(f)
+            if os.path.exists(self.vectors_path):
+                with np.load(self.vectors_path) as data:
+                    self._vectors = dict(zip(data["keys"].tolist(), data["vectors"]))
+        except Exception as e:
+            print(f"⚠️ Error al leer el estado del historial: {str(e)}")
+        self.refresh()
+
+    # ---- archivos ----
+
+    def is_history(self, rel_path: str) -> bool:
+        """Si una ruta relativa a docs_path es el historial activo o uno de sus segmentos."""
+        path = os.path.normpath(os.path.join(self.docs_path, rel_path))
+        return (path == os.path.normpath(self.history_file)
+                or os.path.dirname(path) == os.path.normpath(self.segments_dir))
+
+    def _segment_paths(self) -> List[str]:
+        if not os.path.isdir(self.segments_dir):
+            return []
+        names = sorted(name for name in os.listdir(self.segments_dir)
+                       if name.startswith(SEGMENT_PREFIX) and name.endswith(".txt"))
+        return [os.path.join(self.segments_dir, name) for name in names]
+
+    @staticmethod
+    def _read(path: str) -> List[Interaction]:
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        modified = datetime.fromtimestamp(os.path.getmtime(path)).strftime(TIMESTAMP_FORMAT)
+        return parse_interactions(text, modified)
+
+    @staticmethod
+    def _write(path: str, items: List[Interaction]):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("".join(item.text for item in items))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def refresh(self):
+        """Recalcula los totales leyendo todos los archivos del historial."""
+        items = [item for path in self._segment_paths() + [self.history_file]
+                 for item in self._read(path)]
+        self._set_totals(items)
+
+    def _set_totals(self, items: List[Interaction]):
+        self.count = len(items)
+        self.bytes = sum(item.size for item in items)
+        self.oldest = min((item.timestamp for item in items), default=None)
+        keys = {item.key for item in items}
+        with self._lock:
+            # Embeddings de interacciones que ya no existen y las que aún no lo tienen
+            for key in [key for key in self._vectors if key not in keys]:
+                del self._vectors[key]
+                self._vectors_dirty = True
+            self._matrix = None
+            self._pending = {item.key: interaction_body(item.text) for item in items
+                             if item.key not in self._vectors}
+
+    def note_added(self, interaction: Interaction, vector):
+        self.count += 1
+        self.bytes += interaction.size
+        self.oldest = min(self.oldest or interaction.timestamp, interaction.timestamp)
+        self._set_vectors([interaction.key], [vector])
+
+    # ---- política ----
+
+    def _set_vectors(self, keys: List[str], vectors):
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                vector = np.asarray(vector, dtype=np.float32)
+                norm = np.linalg.norm(vector)
+                self._vectors[key] = vector / norm if norm else vector
+                self._pending.pop(key, None)
+            self._matrix = None
+            self._vectors_dirty = True
+
+    def find_duplicate(self, vector, embed_documents: Callable[[List[str]], List[List[float]]]
+                       ) -> Optional[str]:
+        """Clave de una interacción guardada con similitud coseno >= dedup_similarity, o None.
+
+        Las interacciones sin embedding (historial antiguo) se calculan aquí con `embed_documents`.
+        """
+        with self._lock:
+            pending = dict(self._pending)
+        if pending:
+            keys = list(pending)
+            self._set_vectors(keys, embed_documents([pending[key] for key in keys]))
+        with self._lock:
+            if self._matrix is None and self._vectors:
+                keys = list(self._vectors)
+                self._matrix = keys, np.stack([self._vectors[key] for key in keys])
+            matrix = self._matrix
+        if matrix is None:
+            return None
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        scores = matrix[1] @ (query / norm if norm else query)
+        best = int(np.argmax(scores))
+        return matrix[0][best] if scores[best] >= self.dedup_similarity else None
+
+    def _cutoff(self, days: float, now: float) -> str:
+        return (datetime.fromtimestamp(now) - timedelta(days=days)).strftime(TIMESTAMP_FORMAT)
+
+    def due(self, now: Optional[float] = None) -> bool:
+        """Si hay que compactar: archivo activo lleno, límites superados o interacciones caducadas."""
+        now = now or time.time()
+        active = os.path.getsize(self.history_file) if os.path.exists(self.history_file) else 0
+        return (active >= self.segment_bytes
+                or self.count > self.max_interactions
+                or self.bytes > self.max_bytes
+                or (self.oldest is not None and self.oldest < self._cutoff(self.max_age_days, now)))
+
+    def record_hits(self, keys: Iterable[str]):
+        """Anota que las consultas han devuelto fragmentos de estas interacciones."""
+        now = time.time()
+        stamp = datetime.fromtimestamp(now).strftime(TIMESTAMP_FORMAT)
+        with self._lock:
+            for key in keys:
+                entry = self._hits.setdefault(key, [0, stamp])
+                entry[0] += 1
+                entry[1] = stamp
+                self._hits_dirty = True
+        if now - self._hits_saved >= HITS_SAVE_INTERVAL:
+            self.save()
+
+    def _evictions(self, items: List[Interaction], now: float) -> set:
+        """Interacciones (por id()) que hay que eliminar para cumplir la política."""
+        cutoff = self._cutoff(self.max_age_days, now)
+        evicted = {id(item) for item in items if item.timestamp < cutoff}
+        remaining = [item for item in items if id(item) not in evicted]
+        count = len(remaining)
+        size = sum(item.size for item in remaining)
+        if count <= self.max_interactions and size <= self.max_bytes:
+            return evicted
+
+        grace = self._cutoff(self.grace_days, now)
+        with self._lock:
+            hits = {key: tuple(entry) for key, entry in self._hits.items()}
+
+        def priority(item: Interaction):
+            times, last = hits.get(item.key, (0, ""))
+            # Primero las fuera del periodo de gracia, las menos recuperadas y las usadas hace más
+            return item.timestamp >= grace, times, max(item.timestamp, last)
+
+        for item in sorted(remaining, key=priority):
+            if count <= self.max_interactions and size <= self.max_bytes:
+                break
+            evicted.add(id(item))
+            count -= 1
+            size -= item.size
+        return evicted
+
+    def compact(self, now: Optional[float] = None) -> Tuple[List[str], int]:
+        """Aplica la política y rota el archivo activo; devuelve (archivos cambiados, desalojadas).
+
+        Los archivos cambiados incluyen los borrados; quien llama debe reindexarlos.
+        """
+        now = now or time.time()
+        segments = [(path, self._read(path)) for path in self._segment_paths()]
+        active = self._read(self.history_file)
+        evicted = self._evictions([item for _, items in segments for item in items] + active, now)
+
+        packs: List[_Pack] = []
+        removed: List[str] = []
+
+        def place(path: Optional[str], items: List[Interaction], changed: bool):
+            if not items:
+                if path:
+                    removed.append(path)
+                return
+            last = packs[-1] if packs else None
+            if last and (changed or last.changed) and last.size + sum(i.size for i in items) <= self.segment_bytes:
+                # Un segmento que ha encogido se une a su vecino en lugar de quedar pequeño
+                last.items.extend(items)
+                last.changed = True
+                if path:
+                    removed.append(path)
+                return
+            packs.append(_Pack(path, items, changed))
+
+        for path, items in segments:
+            kept = [item for item in items if id(item) not in evicted]
+            place(path, kept, len(kept) != len(items))
+
+        kept_active = [item for item in active if id(item) not in evicted]
+        active_changed = len(kept_active) != len(active)
+        if sum(item.size for item in kept_active) >= self.segment_bytes:
+            # Rotación: el contenido del archivo activo pasa a un segmento nuevo
+            place(None, kept_active, True)
+            kept_active, active_changed = [], True
+
+        changed: List[str] = []
+        if any(pack.changed for pack in packs) or active_changed:
+            os.makedirs(self.segments_dir, exist_ok=True)
+            numbers = [int(os.path.basename(p)[len(SEGMENT_PREFIX):-4]) for p in self._segment_paths()
+                       if os.path.basename(p)[len(SEGMENT_PREFIX):-4].isdigit()]
+            next_number = max(numbers, default=0) + 1
+            for pack in packs:
+                if not pack.changed:
+                    continue
+                if pack.path is None:
+                    pack.path = os.path.join(self.segments_dir, f"{SEGMENT_PREFIX}{next_number:06d}.txt")
+                    next_number += 1
+                self._write(pack.path, pack.items)
+                changed.append(pack.path)
+            if active_changed:
+                self._write(self.history_file, kept_active)
+                changed.append(self.history_file)
+            for path in removed:
+                os.remove(path)
+                changed.append(path)
+
+        kept = [item for pack in packs for item in pack.items] + kept_active
+        self._set_totals(kept)
+        evicted_count = len(evicted)
+        if evicted_count:
+            alive = {item.key for item in kept}
+            with self._lock:
+                for key in [key for key in self._hits if key not in alive]:
+                    del self._hits[key]
+                self._hits_dirty = True
+        self.save()
+        return changed, evicted_count
+
+    def save(self):
+        """Guarda los aciertos y los embeddings por interacción si han cambiado."""
+        with self._lock:
+            hits = json.dumps(self._hits) if self._hits_dirty else None
+            vectors = dict(self._vectors) if self._vectors_dirty else None
+            self._hits_dirty = self._vectors_dirty = False
+            self._hits_saved = time.time()
+        try:
+            if hits is not None:
+                tmp_path = self.hits_path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(hits)
+                os.replace(tmp_path, self.hits_path)
+            if vectors is not None:
+                tmp_path = self.vectors_path + ".tmp.npz"
+                keys = list(vectors)
+                np.savez(tmp_path, keys=np.array(keys, dtype=str),
+                         vectors=np.stack([vectors[key] for key in keys]) if keys
+                         else np.zeros((0, 0), dtype=np.float32))
+                os.replace(tmp_path, self.vectors_path)
+        except Exception as e:
+            print(f"⚠️ Error al guardar el estado del historial: {str(e)}")
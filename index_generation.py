@@ -0,0 +1,96 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+
+class IndexGeneration:
+    """Versión inmutable del índice publicada para los lectores."""
+
+    def __init__(self, number: int, seq: int, vectorstore):
+        self.number = number
+        self.seq = seq  # última secuencia del WAL incluida en esta generación
+        self.vectorstore = vectorstore
+        self._readers = 0
+        self._retired = False
+        self._lock = threading.Lock()  # solo protege el contador, nunca una búsqueda
+
+    @property
+    def readers(self) -> int:
+        return self._readers
+
+    def acquire(self) -> bool:
+        """Registra un lector; falla si la generación ya fue liberada."""
+        with self._lock:
+            if self.vectorstore is None:
+                return False
+            self._readers += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._readers -= 1
+            if self._retired and self._readers == 0:
+                self.vectorstore = None
+
+    def retire(self):
+        """Marca la generación como sustituida; se libera cuando salga su último lector."""
+        with self._lock:
+            self._retired = True
+            if self._readers == 0:
+                self.vectorstore = None
+
+
+class GenerationRegistry:
+    """Publica generaciones con un intercambio atómico y lleva la cuenta de sus lectores."""
+
+    def __init__(self):
+        self._current: Optional[IndexGeneration] = None
+        self._next_number = 1
+        self._retired: Dict[int, IndexGeneration] = {}
+        self._publish_lock = threading.Lock()
+
+    @property
+    def current(self) -> Optional[IndexGeneration]:
+        return self._current
+
+    def publish(self, seq: int, vectorstore) -> IndexGeneration:
+        with self._publish_lock:
+            generation = IndexGeneration(self._next_number, seq, vectorstore)
+            self._next_number += 1
+            previous, self._current = self._current, generation
+            if previous is not None:
+                previous.retire()
+                if previous.vectorstore is not None:
+                    self._retired[previous.number] = previous
+            # Olvidar las generaciones retiradas que ya no tienen lectores
+            for number in [n for n, g in self._retired.items() if g.vectorstore is None]:
+                del self._retired[number]
+            return generation
+
+    @contextmanager
+    def reading(self):
+        """Entrega la generación publicada sin bloquear a los escritores."""
+        while True:
+            generation = self._current
+            if generation is None:
+                raise RuntimeError("No hay ninguna generación del índice publicada")
+            if generation.acquire():
+                break
+        try:
+            yield generation
+        finally:
+            generation.release()
+
+    def live(self) -> List:
+        """Vectorstores de la generación actual y de las retiradas que aún tienen lectores."""
+        generations = list(self._retired.values())
+        if self._current is not None:
+            generations.append(self._current)
+        return [store for store in (g.vectorstore for g in generations) if store is not None]
+
+    def stats(self) -> Dict[int, int]:
+        """Lectores activos por número de generación (actual y retiradas aún vivas)."""
+        generations = list(self._retired.values())
+        if self._current is not None:
+            generations.append(self._current)
+        return {g.number: g.readers for g in generations if g.vectorstore is not None}
@@ -0,0 +1,54 @@
+"""Informe de recall frente a latencia de los tipos de índice sobre la base de conocimiento.
+
+Uso:
+    python index_report.py [-k 4] [--sample 200] [--questions preguntas.txt] [--json informe.json]
+
+Cada tipo (IVF, HNSW, IVF-PQ) se construye con los vectores actuales y se compara
+con la búsqueda exacta para elegir INDEX_TYPE, INDEX_NPROBE e INDEX_EF_SEARCH en llm.py.
+"""
+import argparse
+import json
+
+from llm import VECTORSTORE_PATH, index_config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k y latencia de cada tipo de índice")
+    parser.add_argument("-k", type=int, default=4, help="fragmentos por consulta")
+    parser.add_argument("--sample", type=int, default=200,
+                        help="consultas tomadas del propio corpus si no se dan preguntas")
+    parser.add_argument("--questions", help="archivo con una pregunta por línea")
+    parser.add_argument("--json", help="guardar también las filas en este archivo")
+    args = parser.parse_args()
+
+    questions = None
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    from knowledge import KnowledgeManager
+    km = KnowledgeManager(vectorstore_path=VECTORSTORE_PATH, index_config=index_config())
+    try:
+        store = km.vectorstore
+        print(f"📊 Índice actual: {len(store)} fragmentos en {len(store.shards)} particiones")
+        sizes = store.sizes()
+        for key, kind in store.kinds().items():
+            print(f"   {key:<24} {kind:<6} {sizes[key]:>8}")
+        rows = km.index_report(questions=questions, k=args.k, sample=args.sample)
+    finally:
+        km.close()
+
+    print(f"\n{'tipo':<7} {'parámetro':<10} {'valor':>6} {'recall@' + str(args.k):>9} "
+          f"{'media ms':>9} {'p95 ms':>8} {'build s':>8}")
+    for row in rows:
+        print(f"{row['kind']:<7} {row['param']:<10} {str(row['value']):>6} {row['recall']:>9.3f} "
+              f"{row['mean_ms']:>9.3f} {row['p95_ms']:>8.3f} {row['build_s']:>8.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"\n💾 Informe guardado en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+import os
+import mmap
+import time
+import codecs
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# Parámetros del divisor de fragmentos, compartidos con el historial de conversación
+SPLITTER_PARAMS = {
+    "chunk_size": 200,
+    "chunk_overlap": 20,
+    "separators": ["\n\n", "\n", ".", "!", "?", ",", " "],
+    "length_function": len,
+    "is_separator_regex": False,
+}
+
+_process_splitter: Optional[RecursiveCharacterTextSplitter] = None
+
+
+def make_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(**SPLITTER_PARAMS)
+
+
+def split_text(text: str) -> Tuple[List[str], float]:
+    """Divide un texto en fragmentos; se ejecuta en los procesos del pool de división."""
+    global _process_splitter
+    start = time.perf_counter()
+    if _process_splitter is None:
+        _process_splitter = make_splitter()
+    chunks = _process_splitter.split_text(text)
+    return chunks, time.perf_counter() - start
+
+
+class _InlineExecutor(Executor):
+    """Ejecuta en el hilo que llama; para corpus pequeños un pool de procesos no compensa."""
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def _bounded_map(executor: Executor, fn: Callable, items: Iterable, limit: int,
+                 arg: Optional[Callable] = None) -> Iterator:
+    """Como executor.map pero con como mucho `limit` tareas en vuelo; mantiene el orden.
+
+    Produce (item, resultado). `arg` extrae de cada item lo que recibe `fn`, que
+    así puede ser una función de módulo serializable para un pool de procesos.
+    """
+    pending = deque()
+    for item in items:
+        pending.append((item, executor.submit(fn, arg(item) if arg else item)))
+        if len(pending) >= limit:
+            item, future = pending.popleft()
+            yield item, future.result()
+    while pending:
+        item, future = pending.popleft()
+        yield item, future.result()
+
+
+def embed_batches(embeddings, batches: Iterable[dict], workers: int = 2) -> Iterator[dict]:
+    """Añade "vectors" a tandas {ids, texts, ...} calculándolos en paralelo; mantiene el orden."""
+    with ThreadPoolExecutor(workers, thread_name_prefix="jarvis-embed") as pool:
+        for batch, vectors in _bounded_map(pool, embeddings.embed_documents, batches, workers * 2,
+                                           arg=lambda b: b["texts"]):
+            batch["vectors"] = vectors
+            yield batch
+
+
+class StageStats:
+    """Elementos procesados y tiempo de trabajo acumulado de una etapa."""
+
+    def __init__(self, name: str, unit: str, workers: int):
+        self.name = name
+        self.unit = unit
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0  # suma de segundos de trabajo de todos los workers
+        self._lock = threading.Lock()
+
+    def record(self, items: int, seconds: float):
+        with self._lock:
+            self.items += items
+            self.busy += seconds
+
+    def as_dict(self, elapsed: float) -> dict:
+        return {
+            "items": self.items,
+            "workers": self.workers,
+            "busy_s": round(self.busy, 4),
+            # Ritmo real en el tiempo total y ritmo si la etapa tuviera sus workers siempre ocupados
+            "rate": round(self.items / elapsed, 1) if elapsed else 0.0,
+            "capacity": round(self.items * self.workers / self.busy, 1) if self.busy else 0.0,
+        }
+
+
+class StreamingChunker:
+    """Fragmentos de un archivo de cualquier tamaño con memoria acotada.
+
+    El archivo se mapea en memoria y se decodifica por ventanas de
+    `window_bytes`; cada ventana se corta en el último separador de su segunda
+    mitad y el resto pasa a la siguiente, así que la memoria no depende del
+    tamaño del archivo. `position` son los bytes ya leídos.
+    """
+
+    def __init__(self, path: str, window_bytes: int = 1024 * 1024,
+                 splitter: Optional[RecursiveCharacterTextSplitter] = None):
+        self.path = path
+        self.window_bytes = window_bytes
+        self.splitter = splitter or make_splitter()
+        self.size = os.path.getsize(path)
+        self.position = 0
+
+    def first_window(self) -> str:
+        """Texto del principio del archivo (p. ej. para clasificarlo por tema)."""
+        with open(self.path, "rb") as f:
+            return f.read(self.window_bytes).decode("utf-8", errors="ignore")
+
+    def chunks(self) -> Iterator[str]:
+        for chunks in self.windows():
+            yield from chunks
+
+    def windows(self) -> Iterator[List[str]]:
+        """Los fragmentos de cada ventana, en orden."""
+        if self.size == 0:
+            return  # mmap no admite archivos vacíos
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        carry = ""
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for offset in range(0, self.size, self.window_bytes):
+                end = min(offset + self.window_bytes, self.size)
+                # El decodificador guarda los bytes de un carácter partido entre ventanas
+                text = carry + decoder.decode(data[offset:end], final=end == self.size)
+                carry = ""
+                if end < self.size:
+                    for separator in SPLITTER_PARAMS["separators"]:
+                        cut = text.rfind(separator, len(text) // 2)
+                        if cut > 0:
+                            cut += len(separator)
+                            text, carry = text[:cut], text[cut:]
+                            break
+                self.position = end
+                yield self.splitter.split_text(text)
+
+
+class StreamProgress:
+    """Progreso y ritmo de una ingesta larga, impreso como mucho cada `interval` segundos."""
+
+    def __init__(self, label: str, total_bytes: int, interval: float = 2.0):
+        self.label = label
+        self.total_bytes = total_bytes
+        self.interval = interval
+        self.bytes = 0
+        self.chunks = 0
+        self.start = time.perf_counter()
+        self._last_print = self.start
+
+    def update(self, bytes_done: int, chunks: int):
+        self.bytes = bytes_done
+        self.chunks += chunks
+        now = time.perf_counter()
+        if now - self._last_print >= self.interval:
+            self._last_print = now
+            self.report()
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self.start
+        return {
+            "bytes": self.bytes,
+            "total_bytes": self.total_bytes,
+            "chunks": self.chunks,
+            "elapsed_s": round(elapsed, 4),
+            "mb_per_s": round(self.bytes / 1e6 / elapsed, 3) if elapsed else 0.0,
+            "chunks_per_s": round(self.chunks / elapsed, 1) if elapsed else 0.0,
+        }
+
+    def report(self, final: bool = False):
+        stats = self.stats()
+        percent = 100 * self.bytes / self.total_bytes if self.total_bytes else 100
+        icon = "✅" if final else "📥"
+        print(f"{icon} {self.label}: {percent:5.1f}% · {self.bytes / 1e6:.1f}/{self.total_bytes / 1e6:.1f} MB"
+              f" · {stats['mb_per_s']:.2f} MB/s · {self.chunks} fragmentos ({stats['chunks_per_s']:.0f}/s)")
+
+
+class IngestionPipeline:
+    """Lectura, división y embeddings del corpus en paralelo y por tandas acotadas.
+
+    Lectura en un pool de hilos, división en un pool de procesos (en línea si el
+    corpus es pequeño) y embeddings por tandas de `batch_size` en otro pool de
+    hilos. Cada etapa tiene un número limitado de tareas en vuelo, así que la
+    memoria depende del tamaño de tanda y no del corpus. Un archivo de más de
+    `window_bytes` no se lee entero: la lectura solo calcula su hash y después
+    se divide por ventanas con StreamingChunker. `run` produce tandas
+    {ids, texts, metadatas, vectors} listas para añadir al índice.
+
+    `tagger(ruta relativa, fragmentos, mtime_ns)` devuelve metadatos extra
+    (tema, tipo de fuente...) para cada fragmento de un archivo; con un archivo
+    grande se llama una vez por ventana.
+    """
+
+    def __init__(self, embeddings, batch_size: int = 64, read_workers: int = 4,
+                 split_workers: Optional[int] = None, embed_workers: int = 2,
+                 process_threshold: int = 2 * 1024 * 1024, window_bytes: int = 1024 * 1024,
+                 tagger: Optional[Callable[[str, List[str], int], List[dict]]] = None):
+        self.embeddings = embeddings
+        self.tagger = tagger
+        self.batch_size = batch_size
+        self.read_workers = read_workers
+        self.split_workers = split_workers or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.embed_workers = embed_workers
+        self.process_threshold = process_threshold  # bytes a partir de los que se usan procesos
+        self.window_bytes = window_bytes  # bytes máximos de un archivo en memoria a la vez
+        self.files: Dict[str, dict] = {}
+        self.stages: Dict[str, StageStats] = {}
+        self.elapsed = 0.0
+
+    def run(self, docs_path: str, sources: Dict[str, Tuple[int, int]]) -> Iterator[dict]:
+        """Procesa {ruta relativa: (tamaño, mtime_ns)}; al terminar, `files` tiene el manifiesto."""
+        self.files = {}
+        use_processes = self.split_workers > 1 and sum(size for size, _ in sources.values()) >= self.process_threshold
+        self.stages = {
+            "read": StageStats("lectura", "archivos/s", self.read_workers),
+            "split": StageStats("división", "fragmentos/s", self.split_workers if use_processes else 1),
+            "embed": StageStats("embeddings", "embeddings/s", self.embed_workers),
+        }
+        start = time.perf_counter()
+
+        def read(rel_path: str) -> Tuple[str, Optional[str]]:
+            """(sha256, texto); el texto es None si el archivo pasa de window_bytes."""
+            started = time.perf_counter()
+            digest = hashlib.sha256()
+            with open(os.path.join(docs_path, rel_path), "rb") as f:
+                data = f.read(self.window_bytes + 1)
+                digest.update(data)
+                if len(data) <= self.window_bytes:
+                    try:
+                        text = data.decode("utf-8")
+                    except UnicodeDecodeError:
+                        # Un .txt en Latin-1 no debe tumbar la ingesta entera; como StreamingChunker
+                        print(f"⚠️ {rel_path} no está en UTF-8; los caracteres no válidos se sustituyen")
+                        text = data.decode("utf-8", errors="replace")
+                else:
+                    # Archivo grande: aquí solo el hash; se divide por ventanas en _batches
+                    data = text = None
+                    for block in iter(lambda: f.read(self.window_bytes), b""):
+                        digest.update(block)
+            self.stages["read"].record(1, time.perf_counter() - started)
+            return digest.hexdigest(), text
+
+        def embed(batch: dict) -> List[List[float]]:
+            started = time.perf_counter()
+            vectors = self.embeddings.embed_documents(batch["texts"])
+            self.stages["embed"].record(len(vectors), time.perf_counter() - started)
+            return vectors
+
+        with ThreadPoolExecutor(self.read_workers, thread_name_prefix="jarvis-read") as readers, \
+                (ProcessPoolExecutor(self.split_workers) if use_processes else _InlineExecutor()) as splitters, \
+                ThreadPoolExecutor(self.embed_workers, thread_name_prefix="jarvis-embed") as embedders:
+            reads = _bounded_map(readers, read, sorted(sources), self.read_workers * 2)
+            splits = _bounded_map(splitters, split_text, reads, self.stages["split"].workers * 2,
+                                  arg=lambda item: item[1][1] or "")
+            batches = self._batches(docs_path, sources, splits)
+            for batch, vectors in _bounded_map(embedders, embed, batches, self.embed_workers * 2):
+                batch["vectors"] = vectors
+                yield batch
+        self.elapsed = time.perf_counter() - start
+
+    def _batches(self, docs_path: str, sources: Dict[str, Tuple[int, int]], splits) -> Iterator[dict]:
+        batch = {"ids": [], "texts": [], "metadatas": []}
+        for (rel_path, (sha256, text)), (chunks, seconds) in splits:
+            size, mtime_ns = sources[rel_path]
+            ids = []
+            self.files[rel_path] = {"size": size, "mtime_ns": mtime_ns, "sha256": sha256, "ids": ids}
+            source = os.path.join(docs_path, rel_path)
+            windows = [(chunks, seconds)] if text is not None else self._windows(source)
+            for chunks, seconds in windows:
+                self.stages["split"].record(len(chunks), seconds)
+                first = len(ids)
+                ids.extend(f"{rel_path}::{sha256[:16]}::{i}" for i in range(first, first + len(chunks)))
+                tags = self.tagger(rel_path, chunks, mtime_ns) if self.tagger else [{}] * len(chunks)
+                for doc_id, chunk, extra in zip(ids[first:], chunks, tags):
+                    batch["ids"].append(doc_id)
+                    batch["texts"].append(chunk)
+                    batch["metadatas"].append(dict(extra, source=source))
+                    if len(batch["ids"]) >= self.batch_size:
+                        yield batch
+                        batch = {"ids": [], "texts": [], "metadatas": []}
+        if batch["ids"]:
+            yield batch
+
+    def _windows(self, path: str) -> Iterator[Tuple[List[str], float]]:
+        """(fragmentos, segundos) de cada ventana de un archivo grande, en este hilo."""
+        windows = StreamingChunker(path, self.window_bytes).windows()
+        while True:
+            started = time.perf_counter()
+            chunks = next(windows, None)
+            if chunks is None:
+                return
+            yield chunks, time.perf_counter() - started
+
+    def stats(self) -> dict:
+        return {
+            "elapsed_s": round(self.elapsed, 4),
+            "batch_size": self.batch_size,
+            **{key: stage.as_dict(self.elapsed) for key, stage in self.stages.items()},
+        }
+
+    def report(self):
+        print(f"⏱️ Ingesta en {self.elapsed:.2f}s (tandas de {self.batch_size}):")
+        for stage in self.stages.values():
+            stats = stage.as_dict(self.elapsed)
+            print(f"   {stage.name:<11} {stats['items']:>7} · {stats['rate']:>9.1f} {stage.unit}"
+                  f" · capacidad {stats['capacity']:>9.1f} con {stage.workers} worker(s)")
@@ -1,44 +1,142 @@
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+import numpy as np
 
 import os
+import json
 import time
+import shutil
+import random
+import hashlib
 from functools import lru_cache
-from typing import List
+from typing import Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
+from contextlib import contextmanager
 import threading
 
+from wal import WriteAheadLog, Checkpointer
+from index_generation import GenerationRegistry
+from embedding_cache import CachedEmbeddings
+from embedding_backends import EmbeddingConfig, load_embeddings
+from vector_index import IndexConfig, VectorIndex, recall_report
+from partitioned_index import PartitionedIndex, SOURCE_HISTORY, SOURCE_MANUAL
+from topics import TOPIC_GENERAL, classify_topic
+from docstore import SQLiteDocstore
+from history_retention import (HistoryRetention, Interaction, INTERACTION_HEADER, TIMESTAMP_FORMAT,
+                               format_interaction, interaction_body, interaction_key)
+from ingestion import IngestionPipeline, StreamingChunker, StreamProgress, embed_batches, make_splitter
+from startup import profiler
+from telemetry import metrics
+
 class KnowledgeManager:
-    def __init__(self, 
+    def __init__(self,
                  docs_path: str = "conocimiento_manual",
                  vectorstore_path: str = "vector_store",
-                 embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"):
+                 embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 index_config: Optional[IndexConfig] = None,
+                 ingestion_options: Optional[dict] = None,
+                 embeddings: Optional[Embeddings] = None,
+                 history_options: Optional[dict] = None,
+                 injection_options: Optional[dict] = None,
+                 embedding_config: Optional[EmbeddingConfig] = None):
 
         self.docs_path = docs_path
         self.vectorstore_path = vectorstore_path
-        self.embedding_model = embedding_model
+        # Backend (torch, onnx, onnx-int8), hilos y tanda del modelo de embeddings
+        self.embedding_config = embedding_config or EmbeddingConfig(model_name=embedding_model)
+        self.embedding_model = self.embedding_config.model_name
+        # Tipo de índice FAISS; por defecto exacto que se vuelve aproximado al crecer
+        self.index_config = index_config or IndexConfig()
+        # batch_size y workers de cada etapa de la ingesta (ver IngestionPipeline)
+        self.ingestion_options = ingestion_options or {}
+        # window_bytes, publish_every y progress_interval de inject_source
+        self.injection_options = injection_options or {}
         self.conversation_history_file = os.path.join(docs_path, "conversacion_historial.txt")
+        # Límites del historial y compactación en segmentos (ver HistoryRetention)
+        self.history_options = history_options or {}
+        # Solo serializa a los escritores; las consultas leen la generación publicada
         self._lock = threading.Lock()
+        self._checkpoint_lock = threading.Lock()
         self._last_check = 0
         self._check_interval = 5  # segundos entre verificaciones
-        
+        # Manifiesto: ruta relativa -> {size, mtime_ns, sha256, ids}
+        self._manifest: Dict[str, dict] = {}
+        # Fuentes inyectadas: id -> {path, description, size, mtime_ns, topic, chunks, complete}
+        self._sources: Dict[str, dict] = {}
+        self._injecting = set()
+        self._inject_lock = threading.Lock()
+        self._snapshot_seq = 0
+        self._rebuilt = False  # índice reconstruido que aún no está en ningún snapshot
+        self._generations = GenerationRegistry()
+        self._draft = None  # copia privada del escritor hasta que se publica
+        self._sync_thread = None
+        self._compaction_thread = None
+        self._splitter = make_splitter()
+
         # Asegurar que los directorios existan
         os.makedirs(self.docs_path, exist_ok=True)
         os.makedirs(self.vectorstore_path, exist_ok=True)
-        
-        print(f"🤖 Inicializando modelo de embeddings {self.embedding_model}...")
-        print("⚠️ La primera vez puede tardar unos minutos en descargar el modelo...")
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=self.embedding_model,
-            encode_kwargs={'normalize_embeddings': True}
-        )
+        self.history = HistoryRetention(self.docs_path, self.conversation_history_file,
+                                        self.vectorstore_path,
+                                        **self.history_options)
+
+        print(f"🤖 Inicializando modelo de embeddings {self.embedding_model} "
+              f"({self.embedding_config.backend})...")
+        if embeddings is None:
+            print("⚠️ La primera vez puede tardar unos minutos en descargar el modelo...")
+        # Los fragmentos ya vistos no vuelven a pasar por el modelo
+        with profiler.phase("knowledge.embeddings", "Cargando modelo de embeddings"):
+            self.embeddings = CachedEmbeddings(
+                # Se puede pasar un modelo ya construido (p. ej. el falso de benchmark.py)
+                embeddings or load_embeddings(self.embedding_config),
+                cache_dir=os.path.join(self.vectorstore_path, "embedding_cache"),
+                model_name=self.embedding_config.cache_name(),
+                normalize=True
+            )
         print("✅ Modelo de embeddings cargado correctamente")
 
+        # Texto y metadatos de los fragmentos: en disco y leídos solo para los resultados
+        self.docstore = SQLiteDocstore(os.path.join(self.vectorstore_path, "docstore.sqlite3"))
+
+        # Cada mutación del índice se registra en el WAL; los snapshots van en segundo plano
+        self.wal = WriteAheadLog(os.path.join(self.vectorstore_path, "wal"))
+        self._checkpointer = Checkpointer(self.wal, self.checkpoint)
+
         # Inicializar vectorstore
-        self.load_or_create_vectorstore()
+        with profiler.phase("knowledge.index", "Cargando índice de conocimiento"):
+            self.load_or_create_vectorstore()
+        self._checkpointer.start()
+
+    @property
+    def vectorstore(self) -> PartitionedIndex:
+        """Vectorstore de la generación publicada actualmente."""
+        return self._generations.current.vectorstore
+
+    def generation_stats(self) -> Dict[int, int]:
+        """Lectores activos por generación del índice."""
+        return self._generations.stats()
+
+    def knowledge_version(self) -> str:
+        """Huella del conocimiento manual; no cambia con las altas del historial."""
+        digest = hashlib.sha256()
+        for rel_path, entry in sorted(dict(self._manifest).items()):
+            if not self.history.is_history(rel_path):
+                digest.update(f"{rel_path}:{entry['sha256']}\n".encode("utf-8"))
+        for source_id, entry in sorted(dict(self._sources).items()):
+            digest.update(f"{source_id}:{entry['size']}:{entry['mtime_ns']}:{entry['chunks']}\n".encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def _scan_sources(self) -> Dict[str, Tuple[int, int]]:
+        """Devuelve {ruta relativa: (tamaño, mtime_ns)} de los .txt de conocimiento."""
+        sources = {}
+        for root, _, filenames in os.walk(self.docs_path):
+            for filename in filenames:
+                if filename.endswith('.txt'):
+                    file_path = os.path.join(root, filename)
+                    stat = os.stat(file_path)
+                    rel_path = os.path.relpath(file_path, self.docs_path)
+                    sources[rel_path] = (stat.st_size, stat.st_mtime_ns)
+        return sources
 
     def check_for_updates(self):
         """Verifica si hay actualizaciones en los archivos de conocimiento."""
@@ -48,139 +146,699 @@ class KnowledgeManager:
 
         self._last_check = current_time
         try:
-            files = []
-            for root, _, filenames in os.walk(self.docs_path):
-                for filename in filenames:
-                    if filename.endswith('.txt'):
-                        file_path = os.path.join(root, filename)
-                        files.append((file_path, os.path.getmtime(file_path)))
-            
-            if not hasattr(self, '_last_files'):
-                self._last_files = files
-                return False
-
-            if files != self._last_files:
-                self._last_files = files
+            sources = self._scan_sources()
+            manifest = dict(self._manifest)
+            if set(sources) != set(manifest):
                 return True
-                
+            for rel_path, (size, mtime_ns) in sources.items():
+                entry = manifest[rel_path]
+                if entry["size"] != size or entry["mtime_ns"] != mtime_ns:
+                    return True
             return False
         except Exception as e:
             print(f"⚠️ Error al verificar actualizaciones: {str(e)}")
             return False
 
     def load_or_create_vectorstore(self):
-        """Carga o crea el vectorstore."""
-        with self._lock:
+        """Carga el último snapshot, aplica el WAL pendiente o crea el vectorstore."""
+        with self._mutation():
             try:
-                if os.path.exists(os.path.join(self.vectorstore_path, "index.faiss")):
+                snapshot_dir, seq = self._current_snapshot()
+                # Sin particiones los fragmentos no tienen tema ni tipo de fuente: se reindexa
+                unpartitioned = bool(snapshot_dir) and not PartitionedIndex.is_partitioned(snapshot_dir)
+                if unpartitioned:
+                    print("🔄 Snapshot sin particiones, reconstruyendo una única vez...")
+                elif snapshot_dir:
                     print("📥 Cargando vectorstore desde disco...")
-                    self.vectorstore = FAISS.load_local(
-                        self.vectorstore_path,
-                        self.embeddings,
-                        allow_dangerous_deserialization=True
-                    )
+                    # Puede estar mapeado en solo lectura: el WAL se aplica sobre una copia
+                    self._generations.publish(seq, PartitionedIndex.load(snapshot_dir, self.index_config,
+                                                                          self.docstore))
+                    with open(os.path.join(snapshot_dir, "manifest.json"), "r", encoding="utf-8") as f:
+                        self._manifest = json.load(f)
+                    sources_file = os.path.join(snapshot_dir, "sources.json")
+                    if os.path.exists(sources_file):
+                        with open(sources_file, "r", encoding="utf-8") as f:
+                            self._sources = json.load(f)
+                    self._snapshot_seq = seq
+
+                replayed = 0
+                for record in self.wal.replay(after_seq=seq):
+                    # Se recorre igualmente para no reutilizar secuencias ya escritas
+                    if not unpartitioned:
+                        self._apply_record(record)
+                        replayed += 1
+                self.wal.open(start_seq=seq)
+                if replayed:
+                    print(f"🔁 {replayed} operaciones recuperadas del registro")
+
+                if self._generations.current is not None or self._draft is not None:
+                    dim = len(self.embeddings.embed_query("Jarvis"))
+                    # Sin snapshot (caída antes del primero) solo existe el borrador del WAL
+                    store = self._draft if self._draft is not None else self.vectorstore
+                    if store.dim != dim:
+                        # Otro modelo: los vectores guardados no son comparables con las preguntas
+                        raise ValueError(f"el índice tiene vectores de dimensión {store.dim} "
+                                         f"y el modelo de embeddings produce {dim}")
+                    # Si cambió la configuración o el tamaño, _mutation() lo reconstruye al publicar
+                    if self._draft is None and self.vectorstore.needs_rebuild():
+                        self._draft_store()
                     print("✅ Vectorstore cargado correctamente")
                 else:
-                    print("🆕 Creando nuevo vectorstore...")
-                    self.vectorstore = self._create_vectorstore()
-                    self.save_vectorstore()
-                    print("✅ Vectorstore creado y guardado correctamente")
+                    if os.path.exists(os.path.join(self.vectorstore_path, "index.faiss")):
+                        # Índice sin manifiesto: no sabemos qué vectores pertenecen a cada archivo
+                        print("🔄 Vectorstore sin manifiesto, reconstruyendo una única vez...")
+                    else:
+                        print("🆕 Creando nuevo vectorstore...")
+                    self._create_vectorstore()
+                    print("✅ Vectorstore creado correctamente")
             except Exception as e:
                 print(f"⚠️ Error al cargar/crear vectorstore: {str(e)}")
                 print("🔄 Intentando crear nuevo vectorstore...")
-                self.vectorstore = self._create_vectorstore()
-                self.save_vectorstore()
+                self.wal.open()
+                self._create_vectorstore()
+        self._checkpointer.request()
+
+    def _current_snapshot(self) -> Tuple[str, int]:
+        """Devuelve el directorio del último snapshot y la secuencia del WAL que incluye."""
+        current_file = os.path.join(self.vectorstore_path, "CURRENT")
+        if os.path.exists(current_file):
+            with open(current_file, "r", encoding="utf-8") as f:
+                name = f.read().strip()
+            return os.path.join(self.vectorstore_path, name), int(name.rsplit("-", 1)[1])
+        # Formato anterior: índice y manifiesto directamente en vector_store/
+        if os.path.exists(os.path.join(self.vectorstore_path, "manifest.json")):
+            return self.vectorstore_path, 0
+        return "", 0
 
     def save_vectorstore(self):
         """Guarda el vectorstore en disco."""
-        with self._lock:
+        self.checkpoint()
+
+    def checkpoint(self):
+        """Escribe un snapshot completo y descarta los segmentos del WAL que ya incluye."""
+        with self._checkpoint_lock:
+            # Sin escritores activos, la generación publicada refleja la última secuencia
+            with self._lock:
+                seq = self.wal.last_seq
+                closed = self.wal.rotate()
+                if seq == self._snapshot_seq and not self._rebuilt:
+                    self.wal.purge(closed)
+                    return
+                rebuilt, self._rebuilt = self._rebuilt, False
+                generation = self._generations.current
+                generation.acquire()
+                manifest = json.loads(json.dumps(self._manifest))
+                sources = json.loads(json.dumps(self._sources))
+
+            # La generación es inmutable: se serializa sin bloquear consultas ni escritores
             try:
-                print("💾 Guardando vectorstore en disco...")
-                self.vectorstore.save_local(self.vectorstore_path)
-                print("✅ Vectorstore guardado correctamente")
+                print("💾 Guardando snapshot del vectorstore...")
+                store = generation.vectorstore
+                self._write_snapshot(seq, store, manifest, sources)
+                self.wal.purge(closed)
+                self._snapshot_seq = seq
+                # Filas de fragmentos borrados que el nuevo snapshot ya no referencia
+                purged = self.docstore.purge(store.labels.values(), store.next_label)
+                if purged:
+                    print(f"🧹 {purged} fragmentos eliminados del docstore")
+                print("✅ Snapshot guardado correctamente")
             except Exception as e:
                 print(f"⚠️ Error al guardar vectorstore: {str(e)}")
+                self._rebuilt = self._rebuilt or rebuilt
+            finally:
+                generation.release()
+
+    def _write_snapshot(self, seq: int, store: PartitionedIndex, manifest: dict, sources: dict):
+        name = f"snapshot-{seq:012d}"
+        final_dir = os.path.join(self.vectorstore_path, name)
+        tmp_dir = final_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        store.save(tmp_dir)
+        with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+            os.fsync(f.fileno())
+        with open(os.path.join(tmp_dir, "sources.json"), "w", encoding="utf-8") as f:
+            json.dump(sources, f, ensure_ascii=False)
+            os.fsync(f.fileno())
+
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(tmp_dir, final_dir)
+        # CURRENT apunta al snapshot válido; se reemplaza de forma atómica
+        current_tmp = os.path.join(self.vectorstore_path, "CURRENT.tmp")
+        with open(current_tmp, "w", encoding="utf-8") as f:
+            f.write(name)
+            os.fsync(f.fileno())
+        os.replace(current_tmp, os.path.join(self.vectorstore_path, "CURRENT"))
+
+        # Las particiones que no han cambiado desde el arranque siguen leyendo (mmap, etiquetas)
+        # del snapshot del que se cargaron: ese se conserva hasta que ninguna lo use
+        in_use = {os.path.normpath(path) for store in self._generations.live()
+                  for path in store.backing_dirs()}
+        # En Windows un snapshot aún mapeado en memoria no se puede borrar; se reintenta en el siguiente
+        for entry in os.listdir(self.vectorstore_path):
+            path = os.path.join(self.vectorstore_path, entry)
+            if entry.startswith("snapshot-") and entry != name and os.path.normpath(path) not in in_use:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def close(self):
+        """Detiene el hilo de snapshots y deja un snapshot final."""
+        self._checkpointer.stop()
+        self.checkpoint()
+        self.history.save()
+        self.wal.close()
+        self.docstore.close()
 
     def reload_knowledge(self):
         """Recarga la base de conocimiento."""
-        with self._lock:
+        with self._mutation(), metrics.span("reindex", kind="full"):
             try:
                 print("🔄 Recargando base de conocimiento...")
-                new_vectorstore = self._create_vectorstore()
-                self.vectorstore = new_vectorstore
-                self.save_vectorstore()
+                metrics.inc("reindex_total", kind="full")
+                self._create_vectorstore()
                 print("✅ Base de conocimiento actualizada")
             except Exception as e:
                 print(f"⚠️ Error al recargar base de conocimiento: {str(e)}")
+        self._checkpointer.request()
 
-    def add_interaction_to_history(self, user_input: str, response: str):
-        """Agrega una interacción a la historia y actualiza la base de conocimiento."""
-        with self._lock:
+    def sync_sources(self):
+        """Reindexa solo los archivos añadidos, modificados o eliminados."""
+        with self._mutation(), metrics.span("reindex", kind="sync") as span:
             try:
-                # Crear el texto de la interacción
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                interaction = f"\n--- Interacción {timestamp} ---\nPregunta: {user_input}\nRespuesta: {response}\n"
-                
+                sources = self._scan_sources()
+                changed = False
+
+                for rel_path in set(self._manifest) - set(sources):
+                    print(f"🗑️ Eliminando fragmentos de {rel_path}")
+                    self._delete_ids(self._manifest[rel_path]["ids"])
+                    self._log_and_apply("manifest_set", path=rel_path, entry=None)
+                    changed = True
+
+                to_index = {}
+                for rel_path, (size, mtime_ns) in sources.items():
+                    entry = self._manifest.get(rel_path)
+                    if entry and entry["size"] == size and entry["mtime_ns"] == mtime_ns:
+                        continue
+                    file_path = os.path.join(self.docs_path, rel_path)
+                    if entry and entry["sha256"] == self._hash_file(file_path):
+                        # Solo cambió la fecha; el contenido es el mismo
+                        self._log_and_apply("manifest_set", path=rel_path,
+                                            entry=dict(entry, size=size, mtime_ns=mtime_ns))
+                        changed = True
+                        continue
+
+                    print(f"♻️ Reindexando {rel_path}")
+                    if entry:
+                        self._delete_ids(entry["ids"])
+                    to_index[rel_path] = (size, mtime_ns)
+
+                if to_index:
+                    # Los ids nuevos que ya estén (de un guardado a medias) se omiten al añadir
+                    pipeline = self._ingest(to_index)
+                    for rel_path, entry in pipeline.files.items():
+                        self._log_and_apply("manifest_set", path=rel_path, entry=entry)
+                    changed = True
+
+                if changed:
+                    metrics.inc("reindex_total", kind="sync")
+                    span["files"] = len(to_index)
+                    print("✅ Base de conocimiento actualizada")
+            except Exception as e:
+                print(f"⚠️ Error al sincronizar base de conocimiento: {str(e)}")
+
+    def _start_background_sync(self):
+        if self._sync_thread is not None and self._sync_thread.is_alive():
+            return
+        self._sync_thread = threading.Thread(target=self.sync_sources, daemon=True,
+                                             name="jarvis-sync")
+        self._sync_thread.start()
+
+    def _start_background_compaction(self):
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        self._compaction_thread = threading.Thread(target=self.compact_history, daemon=True,
+                                                   name="jarvis-history")
+        self._compaction_thread.start()
+
+    def add_interaction_to_history(self, user_input: str, response: str):
+        """Agrega una interacción a la historia y actualiza la base de conocimiento.
+
+        Si ya hay una casi idéntica no se duplica: cuenta como uso de la existente.
+        """
+        try:
+            # Crear el texto de la interacción
+            timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+            key = hashlib.sha256(f"{timestamp}\n{user_input}\n{response}".encode("utf-8")).hexdigest()[:16]
+            interaction = format_interaction(timestamp, key, user_input, response)
+
+            # Dividir y calcular embeddings antes de tomar el lock de escritura
+            texts = self._splitter.split_text(interaction)
+            body_vector, *vectors = self.embeddings.embed_documents(
+                [interaction_body(interaction)] + texts)
+            duplicate = self.history.find_duplicate(body_vector, self.embeddings.embed_documents)
+            if duplicate is not None:
+                self.history.record_hits([duplicate])
+                metrics.inc("history_dedup_total")
+                print("♻️ Interacción casi idéntica a una ya guardada; no se duplica")
+                return
+
+            rel_path = os.path.relpath(self.conversation_history_file, self.docs_path)
+            ids = [f"{rel_path}::{key}::{i}" for i in range(len(texts))]
+            metadatas = [dict(tags, source=self.conversation_history_file)
+                         for tags in self._tag_chunks(rel_path, texts, time.time_ns())]
+
+            with self._mutation():
                 # Guardar en archivo de historia
                 os.makedirs(self.docs_path, exist_ok=True)
                 with open(self.conversation_history_file, "a", encoding="utf-8") as f:
                     f.write(interaction)
-                
+
                 # Actualizar vectorstore con la nueva interacción
-                doc = Document(page_content=interaction)
-                splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=200,
-                    chunk_overlap=20,
-                    separators=["\n\n", "\n", ".", "!", "?", ",", " "],
-                )
-                docs = splitter.split_documents([doc])
-                self.vectorstore.add_documents(docs)
-                print("✨ Nueva interacción agregada a la base de conocimiento")
+                self._log_and_apply("add", vectors=vectors, ids=ids, texts=texts,
+                                    metadatas=metadatas)
+
+                # El manifiesto refleja el nuevo estado del archivo para no reindexarlo
+                stat = os.stat(self.conversation_history_file)
+                self._log_and_apply("manifest_extend", path=rel_path, ids=ids,
+                                    size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                                    sha256=self._hash_file(self.conversation_history_file))
+                self.history.note_added(Interaction(key, timestamp, interaction), body_vector)
+            print("✨ Nueva interacción agregada a la base de conocimiento")
+            if self.history.due():
+                self._start_background_compaction()
+        except Exception as e:
+            print(f"⚠️ Error al agregar interacción: {str(e)}")
+
+    def compact_history(self):
+        """Aplica los límites del historial y reindexa solo los archivos que cambian."""
+        with self._mutation(), metrics.span("history_compaction") as span:
+            try:
+                # Si se corta a medias, los archivos ya no coinciden con el manifiesto y se
+                # reindexan en la siguiente sincronización
+                changed, evicted = self.history.compact()
+                if not changed:
+                    return
+                sources = {}
+                for path in changed:
+                    rel_path = os.path.relpath(path, self.docs_path)
+                    entry = self._manifest.get(rel_path)
+                    if entry:
+                        self._delete_ids(entry["ids"])
+                        self._log_and_apply("manifest_set", path=rel_path, entry=None)
+                    if os.path.exists(path):
+                        stat = os.stat(path)
+                        sources[rel_path] = (stat.st_size, stat.st_mtime_ns)
+                pipeline = self._ingest(sources)
+                for rel_path, entry in pipeline.files.items():
+                    self._log_and_apply("manifest_set", path=rel_path, entry=entry)
+                metrics.inc("history_evicted_total", evicted)
+                span.update(files=len(changed), evicted=evicted)
+                print(f"🗜️ Historial compactado: {evicted} interacciones desalojadas, "
+                      f"{len(changed)} archivos reescritos ({self.history.count} interacciones, "
+                      f"{self.history.bytes / 1024:.0f} KB)")
             except Exception as e:
-                print(f"⚠️ Error al agregar interacción: {str(e)}")
+                print(f"⚠️ Error al compactar el historial: {str(e)}")
+        self._checkpointer.request()
 
-    def _create_vectorstore(self) -> FAISS:
-        print(f"📂 Cargando documentos desde: {self.docs_path}")
-        
+    # ---- fuentes inyectadas ----
+
+    @staticmethod
+    def source_id_for(path: str) -> str:
+        """Id estable de una fuente: el mismo archivo siempre recibe el mismo id."""
+        normalized = os.path.normcase(os.path.abspath(path))
+        return "src-" + hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:12]
+
+    def injected_sources(self) -> Dict[str, dict]:
+        return json.loads(json.dumps(self._sources))
+
+    @staticmethod
+    def _source_ids(source_id: str, entry: dict) -> List[str]:
+        return [f"{source_id}::{i}" for i in range(entry["chunks"])]
+
+    def _source_entry(self, path: str, description: str) -> dict:
+        stat = os.stat(path)
+        # El tema se decide con la descripción y el principio del archivo, sin leerlo entero
+        sample = StreamingChunker(path, self.injection_options.get("window_bytes", 1024 * 1024))
+        topic = classify_topic(f"{description} {sample.first_window()}", path)
+        return {"path": path, "description": description, "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns, "topic": topic, "chunks": 0, "complete": False}
+
+    def _stream_source(self, source_id: str, entry: dict) -> Iterator[List[dict]]:
+        """Fragmentos de la fuente con sus embeddings, en grupos de ~publish_every.
+
+        El archivo se lee por ventanas y los embeddings se calculan por tandas en
+        paralelo con un número limitado en vuelo: la memoria no depende del tamaño.
+        """
+        chunker = StreamingChunker(entry["path"], self.injection_options.get("window_bytes", 1024 * 1024))
+        batch_size = self.ingestion_options.get("batch_size", 64)
+        embed_workers = self.ingestion_options.get("embed_workers", 2)
+        publish_every = self.injection_options.get("publish_every", 2048)
+        progress = StreamProgress(source_id, entry["size"],
+                                  self.injection_options.get("progress_interval", 2.0))
+        modified = datetime.fromtimestamp(entry["mtime_ns"] / 1e9).strftime(TIMESTAMP_FORMAT)
+        metadata = {"source_kind": SOURCE_MANUAL, "topic": entry["topic"], "timestamp": modified,
+                    "source": entry["path"], "source_id": source_id}
+        if entry["description"]:
+            metadata["description"] = entry["description"]
+
+        def batches() -> Iterator[dict]:
+            batch = {"ids": [], "texts": [], "metadatas": []}
+            for i, text in enumerate(chunker.chunks()):
+                batch["ids"].append(f"{source_id}::{i}")
+                batch["texts"].append(text)
+                batch["metadatas"].append(dict(metadata))
+                if len(batch["ids"]) >= batch_size:
+                    yield dict(batch, position=chunker.position)
+                    batch = {"ids": [], "texts": [], "metadatas": []}
+            if batch["ids"]:
+                yield dict(batch, position=chunker.position)
+
+        group, size = [], 0
+        for batch in embed_batches(self.embeddings, batches(), embed_workers):
+            progress.update(batch.pop("position"), len(batch["ids"]))
+            group.append(batch)
+            size += len(batch["ids"])
+            if size >= publish_every:
+                yield group
+                group, size = [], 0
+        if group:
+            yield group
+        progress.report(final=True)
+        metrics.observe("inject_mb_per_s", progress.stats()["mb_per_s"])
+
+    def _apply_source_batches(self, source_id: str, entry: dict, batches: List[dict]):
+        """Registra la fuente con su nuevo total antes de añadir: al borrarla no quedan huérfanos."""
+        entry["chunks"] += sum(len(batch["ids"]) for batch in batches)
+        self._log_and_apply("source_set", source_id=source_id, entry=dict(entry))
+        for batch in batches:
+            self._log_and_apply("add", **batch)
+
+    def inject_source(self, path: str, description: str = "") -> str:
+        """Indexa un archivo de cualquier tamaño y devuelve el id de la fuente.
+
+        Volver a inyectar el mismo archivo sustituye sus fragmentos. Lo indexado
+        se publica cada `publish_every` fragmentos, así que las consultas y el
+        historial no esperan al final de un archivo grande. Lanza una excepción
+        si el archivo no existe o ya se está inyectando.
+        """
+        path = os.path.abspath(path)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"No existe el archivo {path}")
+        source_id = self.source_id_for(path)
+        with self._inject_lock:
+            if source_id in self._injecting:
+                raise RuntimeError(f"{path} ya se está inyectando")
+            self._injecting.add(source_id)
         try:
-            loader = DirectoryLoader(
-                self.docs_path,
-                glob="**/*.txt",
-                loader_cls=TextLoader,
-                loader_kwargs={"encoding": "utf-8"}
-            )
-            raw_docs = loader.load()
+            with metrics.span("inject") as span:
+                print(f"💉 Inyectando {path} como {source_id}...")
+                entry = self._source_entry(path, description)
+                with self._mutation():
+                    previous = self._sources.get(source_id)
+                    if previous:
+                        self._delete_ids(self._source_ids(source_id, previous))
+                    self._log_and_apply("source_set", source_id=source_id, entry=dict(entry))
+                for batches in self._stream_source(source_id, entry):
+                    with self._mutation():
+                        self._apply_source_batches(source_id, entry, batches)
+                entry["complete"] = True
+                with self._mutation():
+                    self._log_and_apply("source_set", source_id=source_id, entry=dict(entry))
+                span.update(bytes=entry["size"], chunks=entry["chunks"])
+                metrics.inc("inject_total")
+        finally:
+            with self._inject_lock:
+                self._injecting.discard(source_id)
+        self._checkpointer.request()
+        return source_id
 
-            if not raw_docs:
-                print("⚠️ No se encontraron documentos. Creando vectorstore vacío...")
-                return FAISS.from_texts(["Bienvenido a Jarvis"], embedding=self.embeddings)
-
-            print(f"✂️ Dividiendo {len(raw_docs)} documentos...")
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=200,
-                chunk_overlap=20,
-                separators=["\n\n", "\n", ".", "!", "?", ",", " "],
-                length_function=len,
-                is_separator_regex=False
-            )
-            docs = splitter.split_documents(raw_docs)
-            print(f"✅ {len(docs)} fragmentos generados.")
+    def remove_source(self, source_id: str) -> int:
+        """Borra del índice todos los fragmentos de una fuente inyectada, sin reconstruirlo.
+
+        Devuelve cuántos había; lanza KeyError si el id no existe.
+        """
+        with self._mutation():
+            entry = self._sources.get(source_id)
+            if entry is None:
+                raise KeyError(source_id)
+            ids = self._source_ids(source_id, entry)
+            self._delete_ids(ids)
+            self._log_and_apply("source_set", source_id=source_id, entry=None)
+        metrics.inc("uninject_total")
+        print(f"🗑️ Fuente {source_id} eliminada ({len(ids)} fragmentos)")
+        self._checkpointer.request()
+        return len(ids)
+
+    @contextmanager
+    def _mutation(self):
+        """Serializa a los escritores y publica al final la generación que hayan construido."""
+        with self._lock:
+            self._draft = None
+            try:
+                yield
+            finally:
+                # Se publica incluso tras un error: lo aplicado ya está en el WAL
+                if self._draft is not None:
+                    self._maybe_upgrade()
+                    self._generations.publish(self.wal.last_seq, self._draft)
+                    self._draft = None
+
+    def _draft_store(self):
+        """Copia privada de la generación publicada sobre la que escribe el escritor actual."""
+        if self._draft is None and self._generations.current is not None:
+            self._draft = self._generations.current.vectorstore.clone()
+        return self._draft
+
+    def _maybe_upgrade(self):
+        """Reconstruye el borrador con el tipo de índice que corresponde a su tamaño.
+
+        Cambiar de tipo no altera el contenido, así que no pasa por el WAL: tras
+        reaplicarlo al arrancar se vuelve a decidir aquí.
+        """
+        store = self._draft
+        if not store.needs_rebuild():
+            return
+        try:
+            print("📈 Reconstruyendo particiones del índice...")
+            metrics.inc("index_rebuild_total")
+            start = time.time()
+            # Cada partición se reconstruye por separado; si una falla, las anteriores se conservan
+            for change in store.rebuild_shards(self._vectors_of):
+                print(f"   {change}")
+            # No pasa por el WAL: el siguiente snapshot debe escribirse aunque no haya mutaciones
+            self._rebuilt = True
+            self._checkpointer.request()
+            print(f"✅ Índice listo en {time.time() - start:.1f}s")
+        except Exception as e:
+            print(f"⚠️ Error al reconstruir el índice: {str(e)}")
+
+    def _vectors_of(self, store: VectorIndex) -> np.ndarray:
+        """Vectores de todos los fragmentos en el orden de store.ids()."""
+        vectors = store.reconstruct()
+        if vectors is None:
+            # IVF/PQ no guardan el vector original; la caché de embeddings sí
+            vectors = self.embeddings.embed_documents(store.texts())
+        return np.asarray(vectors, dtype=np.float32)
+
+    def _log_and_apply(self, op: str, **fields):
+        """Registra la mutación en el WAL antes de aplicarla; solo dentro de _mutation()."""
+        self._apply_record(self.wal.append(op, **fields))
+
+    def _apply_record(self, record: dict):
+        op = record["op"]
+        if op == "reset":
+            # Las etiquetas siguen a las ya usadas: las filas de snapshots anteriores no se pisan
+            self._draft = PartitionedIndex.create(self.index_config, record["dim"], self.docstore,
+                                                  next_label=self.docstore.next_label())
+            self._manifest = {}
+            self._sources = {}
+        elif op == "add":
+            store = self._draft_store()
+            if store is None:
+                return
+            # Idempotente: al reaplicar el WAL sobre un snapshot se omiten ids ya presentes
+            rows = [i for i, doc_id in enumerate(record["ids"]) if doc_id not in store]
+            if rows:
+                store.add(
+                    [record["ids"][i] for i in rows],
+                    [record["texts"][i] for i in rows],
+                    [record["metadatas"][i] for i in rows],
+                    record["vectors"][rows]
+                )
+        elif op == "delete":
+            store = self._draft_store()
+            if store is None:
+                return
+            store.delete(record["ids"])
+        elif op == "manifest_set":
+            if record["entry"] is None:
+                self._manifest.pop(record["path"], None)
+            else:
+                self._manifest[record["path"]] = record["entry"]
+        elif op == "source_set":
+            if record["entry"] is None:
+                self._sources.pop(record["source_id"], None)
+            else:
+                self._sources[record["source_id"]] = record["entry"]
+        elif op == "manifest_extend":
+            entry = self._manifest.setdefault(record["path"], {"ids": []})
+            entry.update(size=record["size"], mtime_ns=record["mtime_ns"], sha256=record["sha256"])
+            entry["ids"].extend(record["ids"])
+
+    def _delete_ids(self, ids: List[str]):
+        store = self._draft_store()
+        ids = [doc_id for doc_id in ids if doc_id in store]
+        if ids:
+            self._log_and_apply("delete", ids=ids)
+
+    def _hash_file(self, file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _tag_chunks(self, rel_path: str, chunks: List[str], mtime_ns: int) -> List[dict]:
+        """Tipo de fuente, tema y fecha de cada fragmento de un archivo.
+
+        En un archivo manual el tema es el de su carpeta o, si no está en la de
+        un tema, el de cada fragmento: un perfil personal tiene párrafos de
+        deportes y de tecnología, y así el resultado no depende de cómo se
+        trocee el archivo. La fecha es la de su última modificación; en el
+        historial cada interacción tiene las suyas.
+        """
+        modified = datetime.fromtimestamp(mtime_ns / 1e9).strftime(TIMESTAMP_FORMAT)
+        if not self.history.is_history(rel_path):
+            return [{"source_kind": SOURCE_MANUAL, "topic": classify_topic(chunk, rel_path),
+                     "timestamp": modified}
+                    for chunk in chunks]
+
+        # Fragmentos agrupados por la interacción en la que empiezan
+        groups: List[Tuple[str, Optional[str], List[int]]] = []
+        for i, chunk in enumerate(chunks):
+            match = INTERACTION_HEADER.search(chunk)
+            if match or not groups:
+                groups.append((match.group(1) if match else modified,
+                               interaction_key(match) if match else None, []))
+            groups[-1][2].append(i)
+        tags = [None] * len(chunks)
+        for timestamp, key, rows in groups:
+            topic = classify_topic(" ".join(chunks[i] for i in rows))
+            for i in rows:
+                tags[i] = {"source_kind": SOURCE_HISTORY, "topic": topic, "timestamp": timestamp}
+                if key:
+                    # Permite contar cuántas veces se recupera cada interacción
+                    tags[i]["interaction"] = key
+        return tags
+
+    def _ingest(self, sources: Dict[str, Tuple[int, int]]) -> IngestionPipeline:
+        """Indexa `sources` por tandas; cada tanda va al WAL y al índice según llega."""
+        pipeline = IngestionPipeline(self.embeddings, tagger=self._tag_chunks,
+                                     **self.ingestion_options)
+        for batch in pipeline.run(self.docs_path, sources):
+            self._log_and_apply("add", **batch)
+        pipeline.report()
+        return pipeline
 
-            return FAISS.from_documents(docs, self.embeddings)
+    def _create_vectorstore(self):
+        """Reconstruye todo el índice; queda registrado en el WAL como reset + altas por tandas."""
+        print(f"📂 Cargando documentos desde: {self.docs_path}")
+
+        injected = dict(self._sources)
+        self._log_and_apply("reset", dim=len(self.embeddings.embed_query("Jarvis")))
+        placeholder = "Bienvenido a Jarvis", "__bienvenida__"
+        try:
+            pipeline = self._ingest(self._scan_sources())
+            chunks = sum(len(entry["ids"]) for entry in pipeline.files.values())
+            if chunks:
+                print(f"✅ {chunks} fragmentos generados de {len(pipeline.files)} documentos.")
+            for rel_path, entry in pipeline.files.items():
+                self._log_and_apply("manifest_set", path=rel_path, entry=entry)
+            # Las fuentes inyectadas se vuelven a leer de su archivo original
+            for source_id, entry in injected.items():
+                if not os.path.isfile(entry["path"]):
+                    print(f"⚠️ {entry['path']} ya no existe; se descarta la fuente {source_id}")
+                    continue
+                entry = self._source_entry(entry["path"], entry["description"])
+                for batches in self._stream_source(source_id, entry):
+                    self._apply_source_batches(source_id, entry, batches)
         except Exception as e:
+            # Lo ya añadido se queda; los archivos sin manifiesto se reindexan al sincronizar
             print(f"⚠️ Error al crear vectorstore: {str(e)}")
-            return FAISS.from_texts(["Error al cargar documentos"], embedding=self.embeddings)
+            placeholder = "Error al cargar documentos", "__error__"
+
+        if len(self._draft) == 0:
+            if placeholder[1] == "__bienvenida__":
+                print("⚠️ No se encontraron documentos. Creando vectorstore vacío...")
+            text, doc_id = placeholder
+            self._log_and_apply("add", vectors=self.embeddings.embed_documents([text]),
+                                ids=[doc_id], texts=[text],
+                                metadatas=[{"source_kind": SOURCE_MANUAL, "topic": TOPIC_GENERAL}])
+
+    def query(self, question: str, k: int = 4,
+              embedding: Optional[List[float]] = None,
+              nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+              topics: Optional[List[str]] = None, source_kinds: Optional[List[str]] = None,
+              sources: Optional[List[str]] = None, record_hits: bool = True) -> List[Document]:
+        """Busca los fragmentos más relevantes para una pregunta.
 
-    def query(self, question: str, k: int = 4) -> List[Document]:
-        """Busca los fragmentos más relevantes para una pregunta."""
+        Si ya se calculó el embedding de la pregunta puede pasarse en `embedding`.
+        `nprobe` (IVF) y `ef_search` (HNSW) ajustan precisión frente a latencia
+        solo para esta consulta; por defecto se usan los de index_config.
+        `topics` y `source_kinds` ("manual", "history") limitan la búsqueda a
+        esas particiones y `sources` a los fragmentos de esos archivos (rutas
+        relativas a docs_path, o ids de fuentes inyectadas); None no filtra.
+        Con `record_hits=False` (precargas) los resultados no cuentan como usados
+        para el historial hasta que se pasen a `record_hits`.
+        """
         try:
-            # Verificar actualizaciones antes de cada consulta
-            if self.check_for_updates():
-                self.reload_knowledge()
-                
+            # Los cambios se reindexan en segundo plano; la consulta no los espera
+            with metrics.span("update_check"):
+                if self.check_for_updates():
+                    self._start_background_sync()
+
             print(f"🔎 Buscando respuesta para: {question}")
-            with self._lock:
-                return self.vectorstore.similarity_search(question, k=k)
+            if embedding is None:
+                with metrics.span("query_embedding"):
+                    embedding = self.embeddings.embed_query(question)
+            ids = None
+            if sources is not None:
+                manifest = dict(self._manifest)
+                injected = dict(self._sources)
+                ids = [doc_id for source in sources
+                       for doc_id in (self._source_ids(source, injected[source]) if source in injected
+                                      else manifest.get(source, {}).get("ids", []))]
+            with self._generations.reading() as generation, metrics.span("faiss_search", k=k):
+                docs = generation.vectorstore.search(embedding, k=k, nprobe=nprobe,
+                                                     ef_search=ef_search, source_kinds=source_kinds,
+                                                     topics=topics, ids=ids)
+            if record_hits:
+                self.record_hits(docs)
+            return docs
         except Exception as e:
             print(f"⚠️ Error en la búsqueda: {str(e)}")
             return []
+
+    def record_hits(self, docs: List[Document]):
+        # Las interacciones que nunca se recuperan son las primeras en desalojarse
+        self.history.record_hits({doc.metadata["interaction"] for doc in docs
+                                  if "interaction" in doc.metadata})
+
+    def index_report(self, questions: Optional[List[str]] = None, k: int = 4,
+                     sample: int = 200, **sweep) -> List[dict]:
+        """Recall@k y latencia de cada tipo de índice sobre el corpus actual.
+
+        Sin `questions` se usan como consultas fragmentos del propio corpus
+        elegidos al azar. `sweep` admite kinds, nprobes y ef_searches.
+        """
+        with self._generations.reading() as generation:
+            # Todas las particiones juntas: el informe compara tipos sobre el corpus entero
+            vectors = np.concatenate([self._vectors_of(shard)
+                                      for shard in generation.vectorstore.shards.values()])
+        if questions:
+            queries = self.embeddings.embed_documents(questions)
+        else:
+            rows = random.Random(0).sample(range(len(vectors)), min(sample, len(vectors)))
+            queries = vectors[rows]
+        return recall_report(vectors, queries, self.index_config, k=k, **sweep)
@@ -1,34 +1,85 @@
-from langchain_ollama import ChatOllama
-from knowledge import KnowledgeManager
-from langchain_community.cache import InMemoryCache
-from langchain_core.globals import set_llm_cache
-import langchain_core as langchain
+from startup import profiler, Bootstrap
+from engine import AssistantEngine
+from response_cache import SemanticResponseCache
+from prefetch import RetrievalPrefetcher
+from model_router import ModelRouter, ModelTier, TIER_FAST, TIER_FULL, detect_threads
+from ollama_supervisor import OllamaSupervisor
+from prompt_builder import PromptBuilder, load_token_counter
+from telemetry import metrics
 import time
 import subprocess
+import threading
 import os
+import re
 
-# Activar caché para respuestas repetidas
-langchain.llm_cache = InMemoryCache()
-set_llm_cache(langchain.llm_cache)
-
-# Variables globales
-model_instance = None
-last_request_time = 0
-last_restart_time = 0
+LAZY_STARTUP = True  # la interfaz aparece ya; modelo e índice se cargan en segundo plano
+STARTUP_PROFILE_FILE = "startup_times.jsonl"  # histórico del desglose de arranque
+VECTORSTORE_PATH = "vector_store"
+OLLAMA_URL = "http://localhost:11434"
+MODEL_NAME = "mistral:7b-instruct"
+FAST_MODEL_NAME = "qwen2.5:1.5b-instruct"  # nivel rápido; si no está instalado se usa MODEL_NAME
+MODEL_ROUTING = True  # elegir modelo y presupuesto por pregunta (False: siempre MODEL_NAME)
+OLLAMA_NUM_THREAD = None  # hilos de Ollama por petición (None: núcleos físicos del equipo)
+KEEP_ALIVE = "30m"  # tiempo que Ollama mantiene el modelo cargado sin uso
 REQUEST_TIMEOUT = 120  # aumentado a 2 minutos
-RESTART_COOLDOWN = 300  # 5 minutos entre reinicios
-STARTUP_WAIT = 10  # segundos de espera tras inicio
+RESTART_BACKOFF = 10  # segundos antes del primer reintento; se duplica en cada fallo
+RESTART_BACKOFF_MAX = 600  # espera máxima entre reinicios
+MAX_CONCURRENT_REQUESTS = 1  # peticiones simultáneas hacia Ollama (CPU)
+REQUEST_QUEUE_SIZE = 4  # peticiones en espera antes de rechazar nuevas
+CACHE_SIMILARITY_THRESHOLD = 0.92  # similitud coseno mínima para reutilizar una respuesta
+CACHE_TTL = 24 * 3600  # segundos de vida de una respuesta cacheada
+CACHE_CAPACITY = 256  # respuestas cacheadas como máximo
+INDEX_TYPE = "auto"  # flat, ivf, hnsw, ivfpq o auto (flat que pasa a IVF al crecer)
+INDEX_UPGRADE_THRESHOLD = 20_000  # fragmentos a partir de los que "auto" usa IVF
+INDEX_NPROBE = 8  # listas IVF visitadas por consulta
+INDEX_EF_SEARCH = 64  # candidatos explorados por consulta en HNSW
+INDEX_MMAP = True  # mapear index.faiss en memoria en lugar de leerlo entero
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BACKEND = "torch"  # torch, onnx u onnx-int8 (varias veces más rápido en CPU)
+EMBEDDING_THREADS = None  # hilos intra-op del modelo de embeddings (None: los del backend)
+EMBEDDING_BATCH_SIZE = 32  # textos por pasada del modelo de embeddings
+EMBEDDING_ONNX_DIR = "onnx_models"  # modelos ONNX descargados o cuantizados
+INGEST_BATCH_SIZE = 64  # fragmentos por tanda de embeddings al indexar
+INGEST_READ_WORKERS = 4  # hilos que leen archivos
+INGEST_SPLIT_WORKERS = None  # procesos que dividen en fragmentos (None: núcleos - 1, máx. 4)
+INGEST_EMBED_WORKERS = 2  # hilos que calculan embeddings
+INGEST_WINDOW_BYTES = 1024 * 1024  # archivos mayores se leen y dividen por ventanas de este tamaño
+INJECT_WINDOW_BYTES = 1024 * 1024  # bytes de cada ventana al leer un archivo inyectado
+INJECT_PUBLISH_EVERY = 2048  # fragmentos inyectados que se hacen visibles de una vez
+INJECT_PROGRESS_INTERVAL = 2  # segundos entre líneas de progreso de una inyección
+HISTORY_DEDUP_SIMILARITY = 0.95  # similitud a partir de la que una interacción ya está guardada
+HISTORY_MAX_AGE_DAYS = 365  # interacciones más antiguas se eliminan del historial
+HISTORY_MAX_INTERACTIONS = 2000  # interacciones guardadas como máximo
+HISTORY_MAX_BYTES = 2 * 1024 * 1024  # tamaño máximo del historial completo
+HISTORY_SEGMENT_BYTES = 128 * 1024  # tamaño al que el historial activo pasa a un segmento
+HISTORY_GRACE_DAYS = 7  # las interacciones recientes se desalojan solo si no queda otra
+NUM_CTX = 2048  # ventana de contexto del modelo en tokens
+NUM_PREDICT = 256  # tokens máximos de cada respuesta
+FAST_NUM_CTX = 2048  # ventana de contexto del modelo rápido
+FAST_NUM_PREDICT = 160  # tokens de una respuesta corta con el contexto claro
+GREETING_NUM_PREDICT = 64  # tokens de la respuesta a un saludo
+DETAIL_NUM_PREDICT = 512  # tokens cuando la pregunta pide explicación o detalle
+ROUTE_SHORT_WORDS = 12  # palabras hasta las que una pregunta cuenta como corta
+ROUTE_LONG_WORDS = 40  # palabras a partir de las que se usa el modelo completo
+ROUTE_STRONG_HIT = 0.6  # similitud del mejor fragmento para confiar la respuesta al modelo rápido
+CONTEXT_K = 6  # fragmentos candidatos; el prompt se queda con los que quepan
+CONTEXT_TOKEN_BUDGET = 768  # tokens máximos de contexto en el prompt
+PREFETCH_MIN_CHARS = 8  # caracteres escritos a partir de los que se precarga el contexto
+PREFETCH_NEAR_MATCH = 0.9  # parecido (0-1) con lo precargado para reutilizarlo
+PREFETCH_MAX_AGE = 60  # segundos que sirve una precarga
+PROMPT_TOKENIZER = None  # tokenizador de Hugging Face para contar tokens exactos (None: estimación)
+METRICS_FILE = os.path.join("metrics", "traces.jsonl")  # una línea por pregunta con sus etapas
+METRICS_MAX_BYTES = 5 * 1024 * 1024  # tamaño al que rota el JSONL de trazas
+METRICS_BACKUPS = 3  # archivos rotados que se conservan
+METRICS_PORT = 9464  # endpoint /metrics para Prometheus (None: desactivado)
+SERVER_HOST = "127.0.0.1"  # server.py solo atiende a clientes locales
+SERVER_PORT = 8765  # puerto de server.py
+SERVER_TOKEN = None  # si se define, server.py exige 'Authorization: Bearer <token>'; sin él no hay /admin/
+SERVER_IDLE_TIMEOUT = 60  # segundos que una conexión persistente inactiva sigue abierta
+RSS_SAMPLE_INTERVAL = 15  # segundos entre mediciones de memoria del proceso
 
 def restart_ollama():
-    """Reinicia el servicio de Ollama."""
-    global last_restart_time
-    current_time = time.time()
-    
-    # Evitar reinicios muy frecuentes
-    if current_time - last_restart_time < RESTART_COOLDOWN:
-        print("⚠️ Reinicio de Ollama solicitado muy pronto, esperando...")
-        return False
-        
+    """Reinicia el servicio de Ollama. El supervisor decide cuándo y comprueba si arrancó."""
     try:
         print("\n🔄 Reiniciando servicio Ollama...")
         if os.name == 'nt':  # Windows
@@ -45,118 +96,274 @@ def restart_ollama():
         else:  # Linux/Mac
             subprocess.run(['ollama', 'stop'], check=True)
             time.sleep(5)
-            subprocess.run(['ollama', 'start'], check=True)
-        
-        time.sleep(STARTUP_WAIT)  # Esperar más tiempo para inicio completo
-        last_restart_time = current_time
-        print("✅ Servicio Ollama reiniciado")
+            # 'ollama start' no termina mientras el servidor esté vivo
+            subprocess.Popen(['ollama', 'start'],
+                           stdout=subprocess.PIPE,
+                           stderr=subprocess.PIPE)
+
+        print("✅ Servicio Ollama relanzado")
         return True
     except Exception as e:
         print(f"⚠️ Error al reiniciar Ollama: {str(e)}")
         print("Por favor, reinicia Ollama manualmente con el comando: ollama start")
         return False
 
-def get_model():
-    """Obtiene una nueva instancia del modelo."""
-    global model_instance
+def get_model(base_url=None, model=None, num_ctx=None, num_predict=None):
+    """Obtiene una nueva instancia del modelo (en `base_url` o, por defecto, OLLAMA_URL).
+
+    Sin más argumentos es MODEL_NAME con NUM_CTX y NUM_PREDICT; el enrutador
+    pide otros modelos y presupuestos y guarda cada instancia para reutilizarla.
+    """
     try:
-        model_instance = ChatOllama(
-            model="mistral:7b-instruct",
+        # Importación diferida: langchain_ollama no hace falta hasta la primera pregunta
+        from langchain_ollama import ChatOllama
+        return ChatOllama(
+            model=model or MODEL_NAME,
+            base_url=base_url or OLLAMA_URL,
+            keep_alive=KEEP_ALIVE,
             temperature=0.7,
-            num_ctx=2048,
-            num_predict=256,
-            num_thread=6,
+            num_ctx=num_ctx or NUM_CTX,
+            num_predict=num_predict or NUM_PREDICT,
+            num_thread=OLLAMA_NUM_THREAD or detect_threads(),
             timeout=30,
             mirostat=2,
             top_k=40,
             top_p=0.9,
-            repeat_penalty=1.1,
-            num_gpu=1
+            repeat_penalty=1.1
         )
-        return model_instance
     except Exception as e:
         print(f"⚠️ Error al crear instancia del modelo: {str(e)}")
         return None
 
-# Cargar gestor de conocimiento
-try:
-    km = KnowledgeManager()
-    model_instance = get_model()
-except Exception as e:
-    print(f"⚠️ Error al inicializar el gestor de conocimiento: {str(e)}")
-    raise
-
-def generate_response(user_input):
-    global model_instance, last_request_time
-    current_time = time.time()
-    
+# Las instrucciones fijas van primero para que Ollama reutilice su caché KV entre preguntas
+prompt_builder = PromptBuilder(
+    num_ctx=NUM_CTX,
+    num_predict=NUM_PREDICT,
+    context_budget=CONTEXT_TOKEN_BUDGET,
+    count_tokens=load_token_counter(PROMPT_TOKENIZER)
+)
+
+def build_prompt(user_input, context_fragments, num_ctx=None, num_predict=None):
+    """Construye el prompt a partir de la pregunta y los fragmentos recuperados.
+
+    `num_ctx` y `num_predict` son los del modelo elegido para esta pregunta.
+    """
+    prompt = prompt_builder.build(user_input, context_fragments, num_ctx, num_predict)
+    stats = prompt_builder.last_stats
+    print(f"🧾 Prompt de ~{stats['prompt_tokens']} tokens: {stats['selected']} de {stats['blocks']} "
+          f"bloques ({stats['fragments']} fragmentos), {stats['context_tokens']}/{stats['budget']} de contexto")
+    return prompt
+
+def index_config():
+    """Configuración del índice FAISS a partir de las constantes del módulo."""
+    from vector_index import IndexConfig
+    return IndexConfig(
+        index_type=INDEX_TYPE,
+        upgrade_threshold=INDEX_UPGRADE_THRESHOLD,
+        nprobe=INDEX_NPROBE,
+        ef_search=INDEX_EF_SEARCH,
+        mmap=INDEX_MMAP
+    )
+
+def embedding_config():
+    """Backend de embeddings a partir de las constantes del módulo."""
+    from embedding_backends import EmbeddingConfig
+    return EmbeddingConfig(
+        backend=EMBEDDING_BACKEND,
+        model_name=EMBEDDING_MODEL,
+        threads=EMBEDDING_THREADS,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        onnx_dir=EMBEDDING_ONNX_DIR
+    )
+
+def _load_knowledge():
+    with profiler.phase("knowledge.imports", "Importando librerías de conocimiento"):
+        from knowledge import KnowledgeManager
+    return KnowledgeManager(
+        vectorstore_path=VECTORSTORE_PATH,
+        index_config=index_config(),
+        embedding_config=embedding_config(),
+        ingestion_options={
+            "batch_size": INGEST_BATCH_SIZE,
+            "read_workers": INGEST_READ_WORKERS,
+            "split_workers": INGEST_SPLIT_WORKERS,
+            "embed_workers": INGEST_EMBED_WORKERS,
+            "window_bytes": INGEST_WINDOW_BYTES,
+        },
+        history_options={
+            "dedup_similarity": HISTORY_DEDUP_SIMILARITY,
+            "max_age_days": HISTORY_MAX_AGE_DAYS,
+            "max_interactions": HISTORY_MAX_INTERACTIONS,
+            "max_bytes": HISTORY_MAX_BYTES,
+            "segment_bytes": HISTORY_SEGMENT_BYTES,
+            "grace_days": HISTORY_GRACE_DAYS,
+        },
+        injection_options={
+            "window_bytes": INJECT_WINDOW_BYTES,
+            "publish_every": INJECT_PUBLISH_EVERY,
+            "progress_interval": INJECT_PROGRESS_INTERVAL,
+        }
+    )
+
+def _warm_up_model():
+    # El supervisor ya precarga el modelo; aquí solo se mide cuánto tarda en estar listo
+    if not supervisor.wait_ready(timeout=REQUEST_TIMEOUT):
+        raise TimeoutError(f"Ollama no está listo: {supervisor.detail}")
+    if router is not None:
+        router.warm()
+
+def _on_startup_complete():
+    profiler.mark("startup.complete")
+    profiler.report()
     try:
-        if not user_input or not user_input.strip():
-            return "Lo siento, no he recibido ninguna pregunta. ¿Podrías reformularla?"
-
-        # Solo reiniciar si el modelo está realmente inactivo
-        if current_time - last_request_time > REQUEST_TIMEOUT and model_instance is None:
-            print("\n⚠️ Modelo no disponible, intentando reiniciar...")
-            if restart_ollama():
-                model_instance = get_model()
-            else:
-                return "El sistema necesita un descanso. Por favor, espera unos minutos antes de intentar de nuevo."
-
-        # Asegurarse de que tenemos una instancia válida del modelo
-        if model_instance is None:
-            model_instance = get_model()
-            if model_instance is None:
-                return "No se pudo inicializar el modelo. Por favor, verifica que Ollama esté funcionando."
-
-        # Actualizar tiempo de última petición
-        last_request_time = current_time
-
-        # 🔍 Buscar contexto relevante
-        print("\n🔍 Buscando información relevante...")
-        context_fragments = km.query(user_input, k=2)
-        
-        if not context_fragments:
-            context_text = "No hay información específica sobre esto en mi base de conocimiento."
-        else:
-            context_text = "\n".join([doc.page_content for doc in context_fragments])
-        
-        # 🧠 Crear prompt
-        prompt = f"""Eres Jarvis, un asistente personal. Estás hablando con Victor (el padre). 
-Usa este contexto para responder: {context_text}
-Pregunta de Victor: {user_input}
-Responde de forma breve y precisa, manteniendo en mente que hablas con Victor, no con sus hijos."""
-        
-        # 📡 Consultar modelo con timeout
-        print("\n🧠 Consultando modelo Mistral...")
-        start_time = time.time()
-        
-        try:
-            response = model_instance.invoke(prompt).content
-            
-            # Verificar timeout
-            if time.time() - start_time > REQUEST_TIMEOUT:
-                print("\n⚠️ Respuesta demasiado lenta, intentando reiniciar...")
-                if restart_ollama():
-                    model_instance = get_model()
-                return "Lo siento, la respuesta está tardando demasiado. Por favor, intenta de nuevo en unos minutos."
-                
-            if response and response.strip():
-                # 💾 Guardar interacción
-                km.add_interaction_to_history(user_input, response)
-                return response
-            else:
-                return "Lo siento, no he podido generar una respuesta coherente. ¿Podrías reformular tu pregunta?"
-                
-        except Exception as model_error:
-            print(f"\n⚠️ Error en el modelo: {str(model_error)}")
-            if "timeout" in str(model_error).lower():
-                print("Detectado timeout, esperando antes de reiniciar...")
-                time.sleep(10)  # Esperar antes de reiniciar
-            if restart_ollama():
-                model_instance = get_model()
-            return "Lo siento, hubo un error al procesar tu pregunta. Por favor, espera unos minutos e intenta de nuevo."
-            
+        profiler.save(STARTUP_PROFILE_FILE)
     except Exception as e:
-        error_msg = f"Lo siento, ha ocurrido un error: {str(e)}"
-        print(f"⚠️ Error al generar respuesta: {str(e)}")
-        return error_msg
+        print(f"⚠️ No se pudo guardar el desglose de arranque: {str(e)}")
+
+# Supervisor de Ollama: sondeo, precarga y reinicios fuera del camino de las peticiones
+supervisor = OllamaSupervisor(
+    base_url=OLLAMA_URL,
+    model=MODEL_NAME,
+    keep_alive=KEEP_ALIVE,
+    extra_models=(FAST_MODEL_NAME,) if MODEL_ROUTING else (),
+    restart=restart_ollama,
+    backoff_base=RESTART_BACKOFF,
+    backoff_max=RESTART_BACKOFF_MAX
+)
+
+# Componentes pesados: se inicializan en segundo plano y se esperan solo cuando hacen falta
+bootstrap = Bootstrap(profiler)
+bootstrap.add("knowledge", _load_knowledge, "Cargando base de conocimiento")
+bootstrap.add("model", _warm_up_model, "Preparando modelo Mistral")
+bootstrap.on_complete(_on_startup_complete)
+
+def get_knowledge_manager():
+    """Devuelve el gestor de conocimiento, esperando a que termine de cargarse."""
+    return bootstrap.wait("knowledge")
+
+# Modelo y presupuesto de generación de cada pregunta, con un cliente ya creado por combinación
+router = ModelRouter(
+    lambda model, num_ctx, num_predict: get_model(model=model, num_ctx=num_ctx, num_predict=num_predict),
+    fast=ModelTier(TIER_FAST, FAST_MODEL_NAME, FAST_NUM_CTX, FAST_NUM_PREDICT),
+    full=ModelTier(TIER_FULL, MODEL_NAME, NUM_CTX, NUM_PREDICT),
+    greeting_predict=GREETING_NUM_PREDICT,
+    detail_predict=DETAIL_NUM_PREDICT,
+    short_words=ROUTE_SHORT_WORDS,
+    long_words=ROUTE_LONG_WORDS,
+    strong_hit=ROUTE_STRONG_HIT,
+    available=lambda: supervisor.available
+) if MODEL_ROUTING else None
+
+# Embedding y búsqueda de lo que se está escribiendo, antes de enviarlo
+prefetcher = RetrievalPrefetcher(
+    get_knowledge_manager,
+    k=CONTEXT_K,
+    min_chars=PREFETCH_MIN_CHARS,
+    near_match=PREFETCH_NEAR_MATCH,
+    max_age=PREFETCH_MAX_AGE
+)
+
+engine = AssistantEngine(
+    get_knowledge_manager,
+    model_factory=get_model,
+    build_prompt=build_prompt,
+    context_k=CONTEXT_K,
+    supervisor=supervisor,
+    concurrency=MAX_CONCURRENT_REQUESTS,
+    queue_size=REQUEST_QUEUE_SIZE,
+    request_timeout=REQUEST_TIMEOUT,
+    # Caché de respuestas para preguntas equivalentes
+    response_cache=SemanticResponseCache(
+        threshold=CACHE_SIMILARITY_THRESHOLD,
+        ttl=CACHE_TTL,
+        capacity=CACHE_CAPACITY,
+        persist_path=os.path.join(VECTORSTORE_PATH, "response_cache.json")
+    ),
+    prefetcher=prefetcher,
+    router=router
+)
+
+_start_lock = threading.Lock()
+_started = False
+
+def start(lazy=LAZY_STARTUP):
+    """Arranca supervisor, carga en segundo plano y motor; con lazy=False espera a que todo esté listo."""
+    global _started
+    with _start_lock:
+        if not _started:
+            _started = True
+            metrics.configure(METRICS_FILE, max_bytes=METRICS_MAX_BYTES, backups=METRICS_BACKUPS)
+            metrics.start(port=METRICS_PORT, rss_interval=RSS_SAMPLE_INTERVAL)
+            supervisor.start()
+            bootstrap.start()
+            engine.start()
+    if not lazy:
+        try:
+            bootstrap.wait_all()
+        except Exception as e:
+            print(f"⚠️ Error al inicializar el gestor de conocimiento: {str(e)}")
+            raise
+
+def generate_response(user_input, filters=None):
+    """Responde a una pregunta de forma síncrona a través del motor compartido.
+
+    `filters` (topics, source_kinds, sources) limita el contexto a esas particiones.
+    """
+    start()
+    return engine.ask_sync(user_input, filters=filters).text
+
+def generate_response_stream(user_input, filters=None):
+    """Versión en streaming de generate_response: produce los tokens según llegan de Ollama."""
+    start()
+    yield from engine.stream_sync(user_input, filters=filters)
+
+def prefetch(partial_input, filters=None):
+    """Precarga en segundo plano el contexto de una pregunta a medio escribir."""
+    start()
+    prefetcher.schedule(partial_input, filters)
+
+def cancel_prefetch():
+    prefetcher.cancel()
+
+# Comandos del README que no pasan por el modelo; solo en mayúsculas, como en el README,
+# para que una pregunta que empiece por "Inyectar..." siga llegando al modelo
+_INJECT_COMMAND = re.compile(r'^INYECTAR\s+(?:"([^"]+)"|(\S+))(?:\s+(.*))?$', re.DOTALL)
+_UNINJECT_COMMAND = re.compile(r"^DESINYECTAR\s+(\S+)$")
+
+def is_command(text):
+    text = text.strip()
+    return bool(_INJECT_COMMAND.match(text) or _UNINJECT_COMMAND.match(text))
+
+def run_command(text):
+    """Ejecuta INYECTAR <archivo> [descripción] o DESINYECTAR <id_fuente>.
+
+    Devuelve el texto para el usuario, o None si no es un comando. Inyectar un
+    archivo grande tarda: conviene llamarla fuera del hilo de la interfaz.
+    """
+    text = text.strip()
+    match = _INJECT_COMMAND.match(text)
+    if match:
+        path = match.group(1) or match.group(2)
+        start()
+        km = get_knowledge_manager()
+        try:
+            source_id = km.inject_source(path, (match.group(3) or "").strip())
+        except Exception as e:
+            print(f"⚠️ Error al inyectar {path}: {str(e)}")
+            return f"⚠️ No se pudo inyectar {path}: {str(e)}"
+        chunks = km.injected_sources()[source_id]["chunks"]
+        return (f"✅ {path} inyectado como {source_id} ({chunks} fragmentos).\n"
+                f"Para quitarlo: DESINYECTAR {source_id}")
+
+    match = _UNINJECT_COMMAND.match(text)
+    if match:
+        source_id = match.group(1)
+        start()
+        km = get_knowledge_manager()
+        try:
+            removed = km.remove_source(source_id)
+        except KeyError:
+            available = ", ".join(km.injected_sources()) or "ninguna"
+            return f"⚠️ No hay ninguna fuente {source_id}. Fuentes inyectadas: {available}"
+        return f"🗑️ Fuente {source_id} eliminada ({removed} fragmentos)"
+    return None
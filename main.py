@@ -1,6 +1,17 @@
+from startup import profiler
 import customtkinter as ctk
-from llm import generate_response
+import llm
+import queue
 import threading
+from topics import topic_labels
+from transcript import TranscriptView
+
+profiler.mark("main.imports")
+
+UI_POLL_MS = 50  # cada cuánto se aplican en la interfaz los eventos llegados de otros hilos
+PREFETCH_DEBOUNCE_MS = 350  # pausa al escribir tras la que se precarga el contexto
+TOPIC_OFF_COLOR = "#404040"
+TOPIC_ON_COLOR = "#0086D4"
 
 class ModernJarvisUI:
     def __init__(self):
@@ -17,10 +28,25 @@ class ModernJarvisUI:
         # Grid layout para mejor control
         self.window.grid_rowconfigure(1, weight=1)  # Chat area expands
         self.window.grid_columnconfigure(0, weight=1)
-        
+
+        # Tk solo se toca desde su hilo: los demás encolan aquí y drain_ui lo aplica
+        self.ui_events = queue.Queue()
+        self.responses = {}  # índice de la burbuja -> tokens recibidos
+        self.changed_responses = set()
+        self.pending_phases = set()
+        self.ready = False
+        self.typed_text = ""  # texto de la caja en la última tecla, para ignorar las que no lo cambian
+        self.prefetch_job = None
+
         # Crear el layout
         self.create_widgets()
-        
+
+        # Modelo e índice se cargan en segundo plano; la ventana no los espera
+        profiler.subscribe(lambda *event: self.post(self.on_progress, *event))
+        llm.start()
+        self.window.after(UI_POLL_MS, self.drain_ui)
+        self.window.after(0, profiler.mark, "gui.visible")
+
     def create_widgets(self):
         # Header minimalista
         header = ctk.CTkLabel(
@@ -30,6 +56,15 @@ class ModernJarvisUI:
             text_color="#00A3FF"
         )
         header.grid(row=0, column=0, pady=5, sticky="ew")  # Minimal padding
+
+        # Estado de la carga en segundo plano, en la misma fila que el título
+        self.status_label = ctk.CTkLabel(
+            self.window,
+            text="",
+            font=("Segoe UI", 12),
+            text_color="#A0A0A0"
+        )
+        self.status_label.grid(row=0, column=0, padx=20, sticky="e")
         
         # Frame principal que contiene el chat (eliminamos el status_label para ahorrar espacio)
         main_frame = ctk.CTkFrame(self.window, fg_color="#2D2D2D", corner_radius=15)
@@ -37,13 +72,9 @@ class ModernJarvisUI:
         main_frame.grid_rowconfigure(0, weight=1)
         main_frame.grid_columnconfigure(0, weight=1)
         
-        # Área de chat con scroll
-        self.chat_frame = ctk.CTkScrollableFrame(
-            main_frame,
-            fg_color="transparent",
-            corner_radius=15
-        )
-        self.chat_frame.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
+        # Área de chat con scroll; solo las burbujas visibles existen como widgets
+        self.transcript = TranscriptView(main_frame, font=("Segoe UI", 14), bg_color="#2D2D2D")
+        self.transcript.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
         
         # Frame inferior para controles
         controls_container = ctk.CTkFrame(self.window, fg_color="transparent")
@@ -54,20 +85,34 @@ class ModernJarvisUI:
         topics_frame = ctk.CTkFrame(controls_container, fg_color="transparent")
         topics_frame.grid(row=0, column=0, columnspan=2, pady=(0, 10), sticky="ew")
         
-        topics = ["🎵 Música", "🎬 Películas", "💻 Tecnología", "✈️ Viajes", "⚽ Deportes"]
-        for i, topic in enumerate(topics):
+        # Cada tema activo limita la búsqueda de contexto a su partición del índice
+        self.selected_topics = set()
+        self.topic_buttons = {}
+        for topic, label in topic_labels():
             btn = ctk.CTkButton(
                 topics_frame,
-                text=topic,
+                text=label,
                 width=120,
                 height=32,
                 corner_radius=8,
                 font=("Segoe UI", 13),
-                fg_color="#404040",
+                fg_color=TOPIC_OFF_COLOR,
                 hover_color="#505050",
-                command=lambda t=topic: self.insert_topic(t)
+                command=lambda t=topic: self.toggle_topic(t)
             )
             btn.pack(side="left", padx=5)
+            self.topic_buttons[topic] = btn
+
+        # Sin el historial solo se busca en el conocimiento manual
+        self.include_history = ctk.BooleanVar(value=True)
+        history_switch = ctk.CTkSwitch(
+            topics_frame,
+            text="Historial",
+            font=("Segoe UI", 13),
+            variable=self.include_history,
+            command=self.prefetch_input
+        )
+        history_switch.pack(side="right", padx=5)
         
         # Área de entrada de texto
         self.input_text = ctk.CTkTextbox(
@@ -105,85 +150,137 @@ class ModernJarvisUI:
         # Bindings
         self.input_text.bind("<Return>", self.handle_return)
         self.input_text.bind("<Shift-Return>", self.handle_shift_return)
+        self.input_text.bind("<KeyRelease>", self.on_input_changed)
         
         # Foco inicial
         self.input_text.focus()
 
     def update_status(self, message):
-        # Método mantenido por compatibilidad pero sin funcionalidad
-        pass
+        self.status_label.configure(text=message)
+
+    def post(self, callback, *args):
+        """Encola una llamada para el hilo de Tk; se puede usar desde cualquier hilo."""
+        self.ui_events.put((callback, args))
+
+    def drain_ui(self):
+        """Aplica de una vez los eventos llegados de otros hilos desde la última pasada."""
+        while True:
+            try:
+                callback, args = self.ui_events.get_nowait()
+            except queue.Empty:
+                break
+            callback(*args)
+
+        # Los tokens se acumulan por mensaje: una sola actualización de cada burbuja por pasada
+        for index in self.changed_responses:
+            self.transcript.set_text(index, "".join(self.responses[index]))
+        self.changed_responses.clear()
+
+        if not self.ready and llm.bootstrap.is_ready("knowledge") and llm.bootstrap.is_ready("model"):
+            if not self.pending_phases:
+                self.ready = True
+                self.update_status("✅ Listo")
+        self.window.after(UI_POLL_MS, self.drain_ui)
+
+    def on_progress(self, event, name, label, seconds):
+        """Refleja en la cabecera el progreso de la inicialización en segundo plano."""
+        if event == "start":
+            self.pending_phases.add(name)
+            self.update_status(f"⏳ {label}...")
+        else:
+            self.pending_phases.discard(name)
+            icon = "✅" if event == "end" else "⚠️"
+            self.update_status(f"{icon} {label} ({seconds:.1f}s)")
 
     def add_message(self, message, sender):
-        # Contenedor para el mensaje
-        container = ctk.CTkFrame(self.chat_frame, fg_color="transparent")
-        container.pack(fill="x", pady=5)
-        
-        # Frame del mensaje
-        frame = ctk.CTkFrame(
-            container,
-            fg_color="#404040" if sender == "assistant" else "#00A3FF",
-            corner_radius=12
-        )
-        frame.pack(
-            side="left" if sender == "assistant" else "right",
-            padx=20,
-            anchor="w" if sender == "assistant" else "e"
-        )
-        
-        # Texto del mensaje
-        msg = ctk.CTkLabel(
-            frame,
-            text=message,
-            justify="left",
-            font=("Segoe UI", 14),
-            text_color="#FFFFFF"
-        )
-        msg.pack(padx=15, pady=10)
-        
-        def update_wraplength(event=None):
-            if event is not None:  # Solo actualizar si el evento es de resize
-                window_width = self.window.winfo_width()
-                max_width = min(int(window_width * 0.6), 800)  # 60% del ancho, máximo 800px
-                msg.configure(wraplength=max_width)
-        
-        # Aplicar wrapping inicial y vincular al resize
-        update_wraplength()
-        self.window.bind('<Configure>', update_wraplength)
-        
-        # Auto-scroll
-        self.window.after(10, self.chat_frame._parent_canvas.yview_moveto, 1.0)
+        """Añade una burbuja a la conversación y devuelve su índice."""
+        return self.transcript.append(message, sender)
 
     def send_message(self):
         message = self.input_text.get("1.0", "end-1c").strip()
         if not message:
             return
             
-        # Limpiar el texto antes de procesar
+        # Limpiar el texto antes de procesar; la precarga en curso la aprovecha el motor
+        if self.prefetch_job is not None:
+            self.window.after_cancel(self.prefetch_job)
+            self.prefetch_job = None
+        self.typed_text = ""
         self.input_text.delete("1.0", "end")
         self.input_text.configure(state="disabled")
         
         # Mostrar mensaje del usuario
         self.add_message(message, "user")
-        
-        # Procesar en thread separado
-        def process():
-            try:
-                response = generate_response(message)
-                self.add_message(response, "assistant")
-            except Exception as e:
-                self.add_message(f"❌ Lo siento, ocurrió un error: {str(e)}", "error")
-            finally:
-                self.input_text.configure(state="normal")
-                self.input_text.focus()
-        
-        threading.Thread(target=process).start()
+        index = self.add_message("…", "assistant")
 
-    def insert_topic(self, topic):
-        current = self.input_text.get("1.0", "end-1c")
-        self.input_text.delete("1.0", "end")
-        self.input_text.insert("1.0", current + topic.split(" ", 1)[1] + " ")
+        if llm.is_command(message):
+            # INYECTAR puede tardar minutos con un archivo grande: se ejecuta fuera del hilo de Tk
+            threading.Thread(target=lambda: self.post(self.on_command_done, index, llm.run_command(message)),
+                             daemon=True, name="jarvis-command").start()
+            return
+        self.responses[index] = []
+
+        # El motor procesa la pregunta en su propio bucle; la interfaz solo se toca desde el hilo de Tk
+        request = llm.engine.submit(message, on_token=lambda token: self.post(self.on_token, index, token),
+                                    filters=self.search_filters())
+        request.future.add_done_callback(lambda _: self.post(self.on_response_done, index))
+
+    def on_token(self, index, token):
+        self.responses[index].append(token)
+        self.changed_responses.add(index)
+
+    def on_command_done(self, index, text):
+        self.transcript.set_text(index, text)
+        self.input_text.configure(state="normal")
         self.input_text.focus()
 
+    def on_response_done(self, index):
+        parts = self.responses.pop(index)
+        self.changed_responses.discard(index)
+        if parts:
+            self.transcript.set_text(index, "".join(parts))
+        self.input_text.configure(state="normal")
+        self.input_text.focus()
+
+    def toggle_topic(self, topic):
+        if topic in self.selected_topics:
+            self.selected_topics.discard(topic)
+        else:
+            self.selected_topics.add(topic)
+        color = TOPIC_ON_COLOR if topic in self.selected_topics else TOPIC_OFF_COLOR
+        self.topic_buttons[topic].configure(fg_color=color)
+        self.input_text.focus()
+        # Con otros filtros lo precargado ya no sirve
+        self.prefetch_input()
+
+    def search_filters(self):
+        """Filtros de KnowledgeManager.query según los temas y el interruptor del historial."""
+        filters = {}
+        if self.selected_topics:
+            filters["topics"] = sorted(self.selected_topics)
+        if not self.include_history.get():
+            filters["source_kinds"] = ["manual"]
+        return filters
+
+    def on_input_changed(self, event):
+        """Precarga el contexto cuando el usuario deja de escribir un momento."""
+        text = self.input_text.get("1.0", "end-1c")
+        if text == self.typed_text:
+            return  # flechas, mayúsculas...
+        self.typed_text = text
+        llm.cancel_prefetch()
+        if self.prefetch_job is not None:
+            self.window.after_cancel(self.prefetch_job)
+        self.prefetch_job = self.window.after(PREFETCH_DEBOUNCE_MS, self.prefetch_input)
+
+    def prefetch_input(self):
+        self.prefetch_job = None
+        text = self.input_text.get("1.0", "end-1c")
+        if llm.is_command(text):
+            llm.cancel_prefetch()
+            return
+        llm.prefetch(text, self.search_filters())
+
     def handle_return(self, event):
         if not event.state & 0x1:  # No Shift pressed
             self.send_message()
@@ -196,5 +293,6 @@ class ModernJarvisUI:
         self.window.mainloop()
 
 if __name__ == "__main__":
-    app = ModernJarvisUI()
+    with profiler.phase("gui.build", "Construyendo interfaz"):
+        app = ModernJarvisUI()
     app.run()
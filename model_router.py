@@ -0,0 +1,157 @@
+import os
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Set
+
+from telemetry import metrics
+
+# Niveles de modelo
+TIER_FAST = "rapido"  # modelo pequeño para saludos y preguntas cortas con el contexto claro
+TIER_FULL = "completo"  # el 7B para todo lo demás
+
+GREETINGS = ("hola", "buenas", "buenos dias", "buenos días", "buenas tardes", "buenas noches",
+             "hey", "gracias", "muchas gracias", "adios", "adiós", "hasta luego", "ok", "vale",
+             "perfecto", "genial", "que tal", "qué tal")
+# Palabras que piden una respuesta elaborada
+DETAIL_KEYWORDS = ("explica", "explícame", "explicame", "detalla", "detalle", "compara", "analiza",
+                   "resume", "resumen", "por qué", "por que", "cómo funciona", "como funciona",
+                   "paso a paso", "ventajas", "desventajas", "diferencia", "código", "codigo",
+                   "escribe", "redacta", "plan", "lista")
+_DETAIL = re.compile(r"\b(?:" + "|".join(re.escape(k) for k in DETAIL_KEYWORDS) + r")\b")
+
+
+def detect_threads(reserve: int = 0) -> int:
+    """Hilos para la inferencia en CPU: los núcleos físicos, menos `reserve`.
+
+    Los hilos de hyperthreading no aceleran la generación y compiten con la
+    interfaz y los embeddings.
+    """
+    try:
+        import psutil
+        cores = psutil.cpu_count(logical=False)
+    except Exception:
+        cores = None
+    cores = cores or os.cpu_count() or 1
+    return max(1, cores - reserve)
+
+
+class ModelTier:
+    """Un modelo de Ollama con su presupuesto de generación por defecto.
+
+    `num_ctx` es fijo por nivel: si cambia entre peticiones, Ollama recarga el modelo.
+    """
+
+    def __init__(self, name: str, model: str, num_ctx: int = 2048, num_predict: int = 256):
+        self.name = name
+        self.model = model
+        self.num_ctx = num_ctx
+        self.num_predict = num_predict
+
+
+class Route:
+    """Decisión para una pregunta: nivel, modelo efectivo, presupuesto y motivo."""
+
+    def __init__(self, tier: ModelTier, model: str, num_predict: int, reason: str):
+        self.tier = tier
+        self.model = model
+        self.num_ctx = tier.num_ctx
+        self.num_predict = num_predict
+        self.reason = reason
+
+    @property
+    def key(self) -> tuple:
+        return (self.model, self.num_ctx, self.num_predict)
+
+    def __repr__(self):
+        return f"Route({self.tier.name!r}, {self.model!r}, num_predict={self.num_predict}, {self.reason!r})"
+
+
+class ModelRouter:
+    """Elige modelo y presupuesto de cada pregunta con reglas baratas, sin llamar a ningún modelo.
+
+    Se miran la longitud de la pregunta, la similitud del mejor fragmento
+    recuperado (metadata "score") y palabras clave. Un saludo o una pregunta
+    corta cuya respuesta está claramente en el contexto va al nivel rápido con
+    pocos tokens; lo largo o lo que pide detalle, al completo con más. Si el
+    modelo rápido no está instalado (`available`) se usa el completo con el
+    mismo presupuesto. Los clientes de cada (modelo, num_ctx, num_predict) se
+    crean una vez y se reutilizan.
+    """
+
+    def __init__(self, client_factory: Callable, fast: ModelTier, full: ModelTier,
+                 greeting_predict: int = 64, detail_predict: int = 512,
+                 short_words: int = 12, long_words: int = 40, strong_hit: float = 0.6,
+                 available: Optional[Callable[[], Optional[Set[str]]]] = None):
+        # client_factory(model, num_ctx, num_predict) construye un cliente ya configurado
+        self.client_factory = client_factory
+        self.tiers = {fast.name: fast, full.name: full}
+        self.fast = fast
+        self.full = full
+        self.greeting_predict = greeting_predict
+        self.detail_predict = detail_predict
+        self.short_words = short_words
+        self.long_words = long_words
+        self.strong_hit = strong_hit  # similitud coseno del mejor fragmento para fiarse del contexto
+        self.available = available  # modelos instalados en Ollama (None: se desconoce)
+        self.counters: Dict[str, int] = {fast.name: 0, full.name: 0}
+        self._pool: Dict[tuple, object] = {}
+        self._pool_lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return re.sub(r"\s+", " ", text.strip().lower()).strip("¿?¡!.,;: ")
+
+    def route(self, text: str, fragments: Optional[List] = None) -> Route:
+        normalized = self._normalize(text)
+        tokens = re.findall(r"\w+", normalized)
+        words = len(tokens)
+        scores = [doc.metadata.get("score") for doc in fragments or []
+                  if doc.metadata.get("score") is not None]
+        best = max(scores) if scores else 0.0
+
+        if normalized in GREETINGS or (0 < words <= 4 and tokens[0] in GREETINGS
+                                       and best < self.strong_hit):
+            tier, num_predict, reason = self.fast, self.greeting_predict, "saludo"
+        elif _DETAIL.search(normalized) or words >= self.long_words:
+            tier, num_predict, reason = self.full, self.detail_predict, "detalle"
+        elif words <= self.short_words and best >= self.strong_hit:
+            tier, num_predict, reason = self.fast, self.fast.num_predict, "corta_con_contexto"
+        else:
+            tier, num_predict, reason = self.full, self.full.num_predict, "general"
+
+        model = tier.model
+        if tier is not self.full and not self._installed(tier.model):
+            # Sin el modelo pequeño se ahorra al menos en tokens generados
+            tier, model, reason = self.full, self.full.model, reason + "_sin_modelo_rapido"
+        self.counters[tier.name] += 1
+        metrics.inc("model_route_total", tier=tier.name, reason=reason)
+        return Route(tier, model, num_predict, reason)
+
+    def _installed(self, model: str) -> bool:
+        available = self.available() if self.available is not None else None
+        return available is None or model in available
+
+    def client(self, route: Route):
+        """Cliente del pool para la ruta; se crea la primera vez."""
+        with self._pool_lock:
+            client = self._pool.get(route.key)
+        if client is None:
+            client = self.client_factory(route.model, route.num_ctx, route.num_predict)
+            if client is not None:
+                with self._pool_lock:
+                    client = self._pool.setdefault(route.key, client)
+        return client
+
+    def warm(self):
+        """Crea de antemano los clientes de los presupuestos habituales de cada nivel."""
+        budgets = {(self.fast, self.greeting_predict), (self.fast, self.fast.num_predict),
+                   (self.full, self.full.num_predict), (self.full, self.detail_predict)}
+        for tier, num_predict in budgets:
+            self.client(Route(tier, tier.model, num_predict, "precarga"))
+
+    def stats(self) -> dict:
+        latencies = metrics.latencies()
+        return {name: {"requests": count,
+                       "llm_first_token": latencies.get(f"llm_first_token.{name}"),
+                       "llm_total": latencies.get(f"llm_total.{name}")}
+                for name, count in self.counters.items()}
@@ -0,0 +1,179 @@
+import time
+import threading
+from typing import Callable, Optional
+
+import requests
+
+from telemetry import metrics
+
+# Estados del servicio, consultables al instante desde las peticiones
+STATE_STARTING = "starting"
+STATE_READY = "ready"
+STATE_DEGRADED = "degraded"
+STATE_DOWN = "down"
+
+
+class OllamaSupervisor(threading.Thread):
+    """Vigila Ollama en segundo plano: sondea su API, precarga el modelo y lo reinicia si cae.
+
+    Ningún sondeo ni reinicio ocurre en el camino de una petición; las peticiones
+    solo consultan `state` o `is_ready()`.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:11434",
+                 model: str = "mistral:7b-instruct", keep_alive: str = "30m",
+                 extra_models: tuple = (),
+                 restart: Optional[Callable[[], bool]] = None,
+                 probe_interval: float = 15, probe_timeout: float = 3,
+                 warmup_timeout: float = 300, failures_before_restart: int = 2,
+                 backoff_base: float = 10, backoff_max: float = 600):
+        super().__init__(daemon=True, name="jarvis-ollama-supervisor")
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.extra_models = extra_models  # se precargan si están instalados; su falta no degrada
+        self.available: Optional[set] = None  # modelos instalados en el último sondeo
+        self.keep_alive = keep_alive
+        self.restart = restart
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.warmup_timeout = warmup_timeout
+        self.failures_before_restart = failures_before_restart
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.state = STATE_STARTING
+        self.detail = ""
+        self.restarts = 0
+        self.last_probe = 0.0
+        self._failures = 0
+        self._restart_attempts = 0  # reinicios seguidos sin recuperación
+        self._next_restart = 0.0
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._ready = threading.Event()
+        self._session = requests.Session()
+        self._warming: set = set()  # modelos extra que se están precargando en su propio hilo
+        self._warming_lock = threading.Lock()
+
+    def is_ready(self) -> bool:
+        return self.state == STATE_READY
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def report_failure(self, reason: str = ""):
+        """Una petición falló: se marca degradado y se adelanta el próximo sondeo."""
+        if self.state == STATE_READY:
+            self._set_state(STATE_DEGRADED, reason or "fallo informado por una petición")
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        self.join()
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "detail": self.detail,
+            "restarts": self.restarts,
+            "last_probe": self.last_probe,
+        }
+
+    def _set_state(self, state: str, detail: str = ""):
+        if state != self.state:
+            icon = {STATE_READY: "✅", STATE_DEGRADED: "⚠️", STATE_DOWN: "❌"}.get(state, "⏳")
+            print(f"{icon} Ollama: {state} {detail}".rstrip())
+        self.state = state
+        self.detail = detail
+        if state == STATE_READY:
+            self._ready.set()
+        else:
+            self._ready.clear()
+
+    def run(self):
+        while not self._stopped.is_set():
+            self.check()
+            self._wakeup.wait(self.probe_interval)
+            self._wakeup.clear()
+
+    def check(self):
+        """Un ciclo de supervisión: sondeo, precarga si hace falta y reinicio con backoff."""
+        self.last_probe = time.time()
+        try:
+            tags = self._get("/api/tags")
+            available = {m.get("name") for m in tags.get("models", [])}
+            self.available = available
+            if self.model not in available:
+                self._failures = 0
+                self._set_state(STATE_DEGRADED, f"modelo {self.model} no instalado")
+                return
+            loaded = {m.get("name") for m in self._get("/api/ps").get("models", [])}
+            if self.model not in loaded:
+                self.warm_up()
+            for model in self.extra_models:
+                if model in available and model not in loaded:
+                    self._warm_up_in_background(model)
+            self._failures = 0
+            self._restart_attempts = 0
+            self._set_state(STATE_READY)
+        except Exception as e:
+            self._failures += 1
+            state = STATE_DOWN if self._failures >= self.failures_before_restart else STATE_DEGRADED
+            self._set_state(state, str(e))
+            if state == STATE_DOWN:
+                self._maybe_restart()
+
+    def warm_up(self, model: Optional[str] = None, session: Optional[requests.Session] = None):
+        """Carga el modelo en memoria y lo mantiene cargado `keep_alive`."""
+        model = model or self.model
+        print(f"🔥 Precargando {model} en Ollama...")
+        start = time.time()
+        response = (session or self._session).post(
+            f"{self.base_url}/api/generate",
+            json={"model": model, "prompt": "", "keep_alive": self.keep_alive, "stream": False},
+            timeout=self.warmup_timeout
+        )
+        response.raise_for_status()
+        print(f"✅ Modelo precargado en {time.time() - start:.1f}s")
+
+    def _warm_up_in_background(self, model: str):
+        """Precarga un modelo extra sin bloquear el sondeo: cargarlo puede tardar minutos."""
+        with self._warming_lock:
+            if model in self._warming:
+                return
+            self._warming.add(model)
+
+        def warm():
+            try:
+                # Sesión propia: la del supervisor la usan los sondeos a la vez
+                with requests.Session() as session:
+                    self.warm_up(model, session)
+            except Exception as e:
+                print(f"⚠️ No se pudo precargar {model}: {str(e)}")
+            finally:
+                with self._warming_lock:
+                    self._warming.discard(model)
+
+        threading.Thread(target=warm, daemon=True, name=f"jarvis-warmup-{model}").start()
+
+    def _maybe_restart(self):
+        if self.restart is None or time.time() < self._next_restart:
+            return
+        delay = min(self.backoff_max, self.backoff_base * (2 ** self._restart_attempts))
+        self._restart_attempts += 1
+        self._next_restart = time.time() + delay
+        self.restarts += 1
+        metrics.inc("ollama_restarts_total")
+        print(f"🔄 Reiniciando Ollama (intento {self._restart_attempts}, siguiente en {delay:.0f}s)")
+        try:
+            self.restart()
+        except Exception as e:
+            print(f"⚠️ Error al reiniciar Ollama: {str(e)}")
+        # Tras reiniciar se vuelve a sondear pronto
+        self._wakeup.set()
+
+    def _get(self, path: str) -> dict:
+        response = self._session.get(f"{self.base_url}{path}", timeout=self.probe_timeout)
+        response.raise_for_status()
+        return response.json()
@@ -0,0 +1,188 @@
+import os
+import json
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from topics import TOPIC_GENERAL
+from vector_index import IndexConfig, VectorIndex
+
+# Tipos de fuente de un fragmento
+SOURCE_MANUAL = "manual"
+SOURCE_HISTORY = "history"
+
+
+def partition_key(metadata: dict) -> str:
+    """Partición de un fragmento: '<tipo de fuente>/<tema>'."""
+    return f"{metadata.get('source_kind', SOURCE_MANUAL)}/{metadata.get('topic', TOPIC_GENERAL)}"
+
+
+class PartitionedIndex:
+    """Un VectorIndex por partición (tipo de fuente y tema) con etiquetas únicas entre todas.
+
+    Una consulta con filtros solo recorre las particiones que los cumplen y
+    mezcla sus resultados por distancia. Las particiones se comparten entre
+    generaciones y un escritor solo copia las que modifica.
+    """
+
+    def __init__(self, config: IndexConfig, dim: int, docstore,
+                 shards: Optional[Dict[str, VectorIndex]] = None, next_label: int = 0,
+                 shared: Optional[set] = None):
+        self.config = config
+        self.dim = dim
+        self.docstore = docstore
+        self.shards: Dict[str, VectorIndex] = shards if shards is not None else {}
+        self.next_label = next_label
+        self._shared = shared if shared is not None else set()  # aún de la generación publicada
+
+    @classmethod
+    def create(cls, config: IndexConfig, dim: int, docstore, next_label: int = 0) -> "PartitionedIndex":
+        return cls(config, dim, docstore, next_label=next_label)
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards.values())
+
+    def __contains__(self, doc_id: str) -> bool:
+        return any(doc_id in shard for shard in self.shards.values())
+
+    @property
+    def labels(self) -> Dict[str, int]:
+        labels = {}
+        for shard in self.shards.values():
+            labels.update(shard.labels)
+        return labels
+
+    def kinds(self) -> Dict[str, str]:
+        """Tipo de índice FAISS de cada partición."""
+        return {key: shard.kind for key, shard in sorted(self.shards.items())}
+
+    def sizes(self) -> Dict[str, int]:
+        return {key: len(shard) for key, shard in sorted(self.shards.items())}
+
+    def backing_dirs(self) -> set:
+        """Snapshots que las particiones aún necesitan en disco; no se pueden borrar."""
+        return {os.path.dirname(shard.backing_dir) for shard in self.shards.values()
+                if shard.backing_dir}
+
+    def clone(self) -> "PartitionedIndex":
+        """Copia para un escritor; las particiones se copian solo cuando se modifican."""
+        return PartitionedIndex(self.config, self.dim, self.docstore, dict(self.shards),
+                                self.next_label, set(self.shards))
+
+    def _writable(self, key: str) -> VectorIndex:
+        if key not in self.shards:
+            self.shards[key] = VectorIndex.create(self.config, self.dim, self.docstore)
+        elif key in self._shared:
+            self.shards[key] = self.shards[key].clone()
+        self._shared.discard(key)
+        return self.shards[key]
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[dict], vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+        groups: Dict[str, List[int]] = {}
+        for row, metadata in enumerate(metadatas):
+            groups.setdefault(partition_key(metadata or {}), []).append(row)
+        for key, rows in groups.items():
+            shard = self._writable(key)
+            # Las etiquetas son globales: cada partición continúa el contador común
+            shard.next_label = self.next_label
+            shard.add([ids[i] for i in rows], [texts[i] for i in rows],
+                      [metadatas[i] for i in rows], vectors[rows])
+            self.next_label = shard.next_label
+
+    def delete(self, ids: Iterable[str]):
+        ids = list(ids)
+        for key in list(self.shards):
+            present = [doc_id for doc_id in ids if doc_id in self.shards[key]]
+            if present:
+                self._writable(key).delete(present)
+
+    def needs_rebuild(self) -> bool:
+        return any(shard.needs_rebuild() for shard in self.shards.values())
+
+    def rebuild_shards(self, vectors_of: Callable[[VectorIndex], np.ndarray]) -> List[str]:
+        """Reconstruye las particiones que lo necesiten; devuelve una línea por cambio."""
+        changes = []
+        for key in list(self.shards):
+            shard = self.shards[key]
+            if not shard.needs_rebuild():
+                continue
+            if len(shard) == 0:
+                del self.shards[key]
+                self._shared.discard(key)
+                changes.append(f"{key}: vacía, eliminada")
+                continue
+            self.shards[key] = shard.rebuild(vectors_of(shard))
+            self._shared.discard(key)
+            changes.append(f"{key}: {shard.kind} → {self.shards[key].kind} ({len(shard)} fragmentos)")
+        return changes
+
+    def select(self, source_kinds: Optional[Iterable[str]] = None,
+               topics: Optional[Iterable[str]] = None) -> List[str]:
+        """Particiones que cumplen los filtros (None: sin filtrar por ese campo)."""
+        source_kinds = set(source_kinds) if source_kinds is not None else None
+        topics = set(topics) if topics is not None else None
+        keys = []
+        for key in self.shards:
+            kind, topic = key.split("/", 1)
+            if (source_kinds is None or kind in source_kinds) and (topics is None or topic in topics):
+                keys.append(key)
+        return keys
+
+    def search(self, vector, k: int = 4, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None, source_kinds: Optional[Iterable[str]] = None,
+               topics: Optional[Iterable[str]] = None,
+               ids: Optional[Iterable[str]] = None) -> List[Document]:
+        """Los k fragmentos más cercanos entre las particiones que cumplen los filtros.
+
+        `ids` restringe además la búsqueda a esos fragmentos (p. ej. los de un archivo).
+        Cada documento lleva en metadata["score"] su similitud coseno con la consulta.
+        """
+        ids = set(ids) if ids is not None else None
+        hits = []
+        for key in self.select(source_kinds, topics):
+            shard = self.shards[key]
+            allowed = None
+            if ids is not None:
+                allowed = {shard.labels[doc_id] for doc_id in ids if doc_id in shard.labels}
+                if not allowed:
+                    continue
+            distances, labels = shard.search_labels(vector, k, nprobe, ef_search, allowed=allowed)
+            hits.extend((d, label) for d, label in zip(distances[0].tolist(), labels[0].tolist())
+                        if label != -1)
+        hits.sort()
+        hits = hits[:k]
+        docs = self.docstore.get_many([label for _, label in hits])
+        for (distance, _), doc in zip(hits, docs):
+            if doc is not None:
+                # Vectores normalizados: distancia L2² = 2 - 2·coseno
+                doc.metadata["score"] = round(1 - distance / 2, 4)
+        return [doc for doc in docs if doc is not None]
+
+    # ---- disco ----
+
+    @staticmethod
+    def is_partitioned(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, "partitions.json"))
+
+    def save(self, directory: str):
+        """Una subcarpeta por partición y partitions.json con la correspondencia."""
+        folders = {}
+        for i, (key, shard) in enumerate(sorted(self.shards.items())):
+            folder = f"part-{i:03d}"
+            os.makedirs(os.path.join(directory, folder))
+            shard.save(os.path.join(directory, folder))
+            folders[key] = folder
+        with open(os.path.join(directory, "partitions.json"), "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "next_label": self.next_label, "partitions": folders},
+                      f, ensure_ascii=False)
+            os.fsync(f.fileno())
+
+    @classmethod
+    def load(cls, directory: str, config: IndexConfig, docstore) -> "PartitionedIndex":
+        with open(os.path.join(directory, "partitions.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        shards = {key: VectorIndex.load(os.path.join(directory, folder), config, docstore)
+                  for key, folder in meta["partitions"].items()}
+        return cls(config, meta["dim"], docstore, shards, meta["next_label"])
@@ -0,0 +1,180 @@
+import re
+import time
+import threading
+from difflib import SequenceMatcher
+from typing import Callable, List, Optional
+
+from telemetry import metrics
+
+# Resultado de RetrievalPrefetcher.take
+PREFETCH_HIT = "hit"  # mismo texto que el precargado
+PREFETCH_NEAR = "near"  # texto casi igual: se reutiliza lo precargado
+PREFETCH_MISS = "miss"  # no había nada aprovechable
+
+
+class Prefetched:
+    """Embedding y fragmentos recuperados para un texto a medio escribir (`text` normalizado)."""
+
+    def __init__(self, text: str, filters: dict, version: str, vector, docs: List):
+        self.text = text
+        self.filters = filters
+        self.version = version
+        self.vector = vector
+        self.docs = docs
+        self.created = time.monotonic()
+
+
+class RetrievalPrefetcher:
+    """Adelanta el embedding y la búsqueda de contexto mientras el usuario escribe.
+
+    La interfaz llama a `schedule` tras una pausa al teclear; un hilo de fondo
+    atiende solo la última petición y descarta las que se quedan viejas. Al
+    enviar la pregunta, el motor llama a `take`, que devuelve lo precargado si
+    el texto coincide o se parece al menos `near_match` (difflib), con los
+    mismos filtros y la misma versión del conocimiento. Si la precarga de ese
+    texto sigue en curso, `take` la espera en lugar de repetirla.
+    """
+
+    def __init__(self, knowledge_provider: Callable, k: int = 2, min_chars: int = 8,
+                 near_match: float = 0.9, max_age: float = 60):
+        # Devuelve el KnowledgeManager, bloqueando si aún se está cargando
+        self.knowledge_provider = knowledge_provider
+        self.k = k
+        self.min_chars = min_chars
+        self.near_match = near_match
+        self.max_age = max_age
+        self.counters = {PREFETCH_HIT: 0, PREFETCH_NEAR: 0, PREFETCH_MISS: 0,
+                         "scheduled": 0, "completed": 0, "stale": 0}
+
+        self._seq = 0  # cada schedule/cancel invalida lo anterior
+        self._pending = None  # (seq, texto normalizado, filtros, texto) aún no atendido
+        self._running = None  # (seq, texto normalizado, filtros) en curso
+        self._claimed = None  # seq en curso que espera una pregunta ya enviada
+        self._latest: Optional[Prefetched] = None
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Sin mayúsculas, espacios repetidos ni signos de interrogación o exclamación."""
+        text = re.sub(r"\s+", " ", text.strip().lower())
+        return text.strip("¿?¡!. ")
+
+    # ---- desde la interfaz ----
+
+    def schedule(self, text: str, filters: Optional[dict] = None):
+        """Precarga `text` en segundo plano; sustituye a cualquier precarga anterior."""
+        key = self.normalize(text)
+        if len(key) < self.min_chars:
+            self.cancel()
+            return
+        filters = filters or {}
+        with self._cond:
+            latest = self._latest
+            if latest is not None and latest.text == key and latest.filters == filters:
+                return  # ya está precargado
+            if self._in_flight(key, filters) is not None:
+                return  # ya se está precargando
+            self._seq += 1
+            self._pending = (self._seq, key, filters, text)
+            self.counters["scheduled"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True,
+                                                name="jarvis-prefetch")
+                self._thread.start()
+            self._cond.notify_all()
+
+    def cancel(self):
+        """El texto cambió: lo pendiente ya no se atiende y lo que esté en curso no se guarda."""
+        with self._cond:
+            self._seq += 1
+            if self._pending is not None and self._pending[0] != self._claimed:
+                self._pending = None
+
+    def _in_flight(self, key: str, filters: dict) -> Optional[int]:
+        """seq de la precarga pendiente o en curso de ese texto, si la hay."""
+        for job in (self._running, self._pending):
+            if job is not None and job[1:3] == (key, filters):
+                return job[0]
+        return None
+
+    # ---- desde el motor ----
+
+    def take(self, text: str, filters: Optional[dict], version: str,
+             wait: float = 5) -> tuple:
+        """(resultado, Prefetched o None) para la pregunta enviada.
+
+        Lo usado se consume: una segunda pregunta igual vuelve a buscar.
+        """
+        text = self.normalize(text)
+        filters = filters or {}
+        deadline = time.monotonic() + wait
+        with self._cond:
+            # Si se está precargando justo esto, sale más barato esperar que repetirlo
+            while True:
+                seq = self._in_flight(text, filters)
+                if seq is None:
+                    break
+                # Al enviar se vacía la caja de texto; eso no debe cancelar esta precarga
+                self._claimed = seq
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            latest, self._latest = self._latest, None
+            result = PREFETCH_MISS
+            if latest is not None and latest.filters == filters and latest.version == version \
+                    and time.monotonic() - latest.created <= self.max_age:
+                if latest.text == text:
+                    result = PREFETCH_HIT
+                elif SequenceMatcher(None, latest.text, text).ratio() >= self.near_match:
+                    result = PREFETCH_NEAR
+            self.counters[result] += 1
+        metrics.inc("prefetch_total", result=result)
+        return result, (latest if result != PREFETCH_MISS else None)
+
+    def stats(self) -> dict:
+        used = self.counters[PREFETCH_HIT] + self.counters[PREFETCH_NEAR]
+        asked = used + self.counters[PREFETCH_MISS]
+        return dict(self.counters, hit_rate=used / asked if asked else 0.0)
+
+    # ---- hilo de fondo ----
+
+    def _is_current(self, seq: int) -> bool:
+        with self._cond:
+            return seq in (self._seq, self._claimed)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                seq, key, filters, text = self._pending
+                self._pending = None
+                self._running = (seq, key, filters)
+            try:
+                prefetched = self._prefetch(seq, key, filters, text)
+            except Exception as e:
+                print(f"⚠️ Error en la precarga: {str(e)}")
+                prefetched = None
+            with self._cond:
+                if prefetched is not None:
+                    self._latest = prefetched
+                    self.counters["completed"] += 1
+                self._running = None
+                self._cond.notify_all()
+
+    def _prefetch(self, seq: int, key: str, filters: dict, text: str) -> Optional[Prefetched]:
+        km = self.knowledge_provider()
+        # Entre etapas se comprueba si el usuario siguió escribiendo
+        if not self._is_current(seq):
+            self.counters["stale"] += 1
+            return None
+        with metrics.span("prefetch_embedding"):
+            vector = km.embeddings.embed_query(text)
+        if not self._is_current(seq):
+            self.counters["stale"] += 1
+            return None
+        version = km.knowledge_version()
+        docs = km.query(text, self.k, vector, record_hits=False, **filters)
+        return Prefetched(key, filters, version, vector, docs)
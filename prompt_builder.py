@@ -0,0 +1,159 @@
+import re
+import math
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    # Solo para las anotaciones: llm importa este módulo antes de que haga falta langchain
+    from langchain_core.documents import Document
+
+# Instrucciones fijas: van siempre al principio y sin variaciones, de modo que
+# Ollama reutiliza su caché KV para estos tokens en todas las preguntas
+SYSTEM_PREAMBLE = (
+    "Eres Jarvis, un asistente personal. Estás hablando con Victor (el padre), no con sus hijos.\n"
+    "Responde de forma breve y precisa usando el contexto cuando sea relevante.\n"
+)
+NO_CONTEXT = "No hay información específica sobre esto en mi base de conocimiento."
+
+_WORD = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación del tokenizador de Mistral: ~4 caracteres por token en cada palabra.
+
+    Tiende a pasarse un poco, que es lo seguro para no desbordar num_ctx.
+    """
+    return sum(math.ceil(len(piece) / 4) for piece in _WORD.findall(text))
+
+
+def load_token_counter(tokenizer_name: Optional[str] = None) -> Callable[[str], int]:
+    """Contador exacto con un tokenizador de Hugging Face si está disponible; si no, la estimación."""
+    if not tokenizer_name:
+        return estimate_tokens
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+    except Exception as e:
+        print(f"⚠️ Tokenizador {tokenizer_name} no disponible, se estiman los tokens: {str(e)}")
+        return estimate_tokens
+
+
+def _chunk_position(doc: "Document") -> Optional[Tuple[str, int]]:
+    """(archivo y versión, posición) a partir del id '<ruta>::<hash>::<i>' del fragmento."""
+    doc_id = getattr(doc, "id", None) or ""
+    prefix, _, index = doc_id.rpartition("::")
+    if not prefix or not index.isdigit():
+        return None
+    return prefix, int(index)
+
+
+def _overlap(left: str, right: str, limit: int) -> int:
+    """Longitud del final de `left` que se repite al principio de `right`."""
+    for size in range(min(limit, len(left), len(right)), 0, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _index_of(items: list, item) -> int:
+    """Posición por identidad: dos bloques distintos pueden tener el mismo contenido."""
+    return next(i for i, candidate in enumerate(items) if candidate is item)
+
+
+class PromptBuilder:
+    """Prompt con un prefijo fijo y el contexto que cabe en el presupuesto de tokens.
+
+    El orden es: instrucciones fijas, contexto y pregunta. Los fragmentos
+    consecutivos de un mismo archivo se unen quitando el solapamiento que deja
+    el divisor, y se añaden por orden de relevancia mientras quepan en
+    `context_budget` y en lo que deja libre num_ctx tras la respuesta.
+    """
+
+    def __init__(self, num_ctx: int = 2048, num_predict: int = 256, context_budget: int = 1024,
+                 max_overlap: int = 40, count_tokens: Callable[[str], int] = estimate_tokens,
+                 preamble: str = SYSTEM_PREAMBLE):
+        self.num_ctx = num_ctx
+        self.num_predict = num_predict
+        self.context_budget = context_budget
+        self.max_overlap = max_overlap  # caracteres de solapamiento buscados al unir fragmentos
+        self.count_tokens = count_tokens
+        self.preamble = preamble
+        self.preamble_tokens = count_tokens(preamble)
+        self.last_stats: dict = {}
+
+    def merge(self, fragments: List["Document"]) -> List[str]:
+        """Une los fragmentos contiguos de un mismo archivo; mantiene el orden de relevancia.
+
+        Cada bloque ocupa el puesto de su fragmento más relevante.
+        """
+        blocks: List[List[Tuple[int, str]]] = []  # bloques de (posición, texto)
+        owner = {}  # (archivo, posición) -> bloque
+        seen = set()
+        for doc in fragments:
+            text = doc.page_content.strip()
+            if not text or text in seen:
+                continue
+            seen.add(text)
+            position = _chunk_position(doc)
+            if position is None:
+                blocks.append([(0, text)])
+                continue
+            prefix, index = position
+            block = owner.get((prefix, index - 1)) or owner.get((prefix, index + 1))
+            if block is None:
+                block = []
+                blocks.append(block)
+            block.append((index, text))
+            owner[(prefix, index)] = block
+            neighbour = owner.get((prefix, index + 1))
+            if neighbour is not None and neighbour is not block:
+                # Este fragmento une dos bloques: queda el del puesto más relevante
+                first, second = sorted((block, neighbour), key=lambda b: _index_of(blocks, b))
+                first.extend(second)
+                for key, value in list(owner.items()):
+                    if value is second:
+                        owner[key] = first
+                del blocks[_index_of(blocks, second)]
+
+        merged = []
+        for block in blocks:
+            block.sort()
+            text = block[0][1]
+            for (previous, _), (index, part) in zip(block, block[1:]):
+                if index == previous + 1:
+                    # El divisor repite hasta chunk_overlap caracteres y deja su separador al principio
+                    part = part[_overlap(text, part, self.max_overlap):]
+                    text += (" " if part[:1].isalnum() else "") + part
+                else:
+                    text += "\n" + part
+            merged.append(text)
+        return merged
+
+    def build(self, user_input: str, context_fragments: List["Document"],
+              num_ctx: Optional[int] = None, num_predict: Optional[int] = None) -> str:
+        """`num_ctx` y `num_predict` sustituyen a los del constructor para esta pregunta."""
+        num_ctx = num_ctx or self.num_ctx
+        num_predict = num_predict or self.num_predict
+        question = f"Pregunta de Victor: {user_input.strip()}\n"
+        fixed = self.preamble_tokens + self.count_tokens(question) + self.count_tokens("Contexto:\n")
+        budget = min(self.context_budget, num_ctx - num_predict - fixed)
+
+        selected, used = [], 0
+        blocks = self.merge(context_fragments or [])
+        for text in blocks:
+            tokens = self.count_tokens(text) + 1  # salto de línea
+            if used + tokens > budget:
+                continue  # puede caber otro más corto y menos relevante
+            selected.append(text)
+            used += tokens
+
+        context = "\n".join(selected) if selected else NO_CONTEXT
+        self.last_stats = {
+            "fragments": len(context_fragments or []),
+            "blocks": len(blocks),
+            "selected": len(selected),
+            "context_tokens": used,
+            "prompt_tokens": fixed + (used or self.count_tokens(NO_CONTEXT)),
+            "budget": budget,
+        }
+        return f"{self.preamble}Contexto:\n{context}\n{question}"
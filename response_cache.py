@@ -0,0 +1,109 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+
+class SemanticResponseCache:
+    """Caché de respuestas indexada por el embedding de la pregunta.
+
+    Una pregunta acierta si su similitud coseno con otra ya respondida supera
+    `threshold` y ambas se respondieron con la misma versión del conocimiento.
+    Las entradas caducan por TTL y se desalojan por LRU al superar `capacity`.
+    """
+
+    def __init__(self, threshold: float = 0.92, ttl: float = 24 * 3600,
+                 capacity: int = 256, persist_path: Optional[str] = None):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.capacity = capacity
+        self.persist_path = persist_path
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, dict]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        if persist_path and os.path.exists(persist_path):
+            self._load()
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, vector: List[float], version: str) -> Optional[str]:
+        """Devuelve la respuesta cacheada más parecida o None."""
+        query = self._normalize(vector)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            candidates = [(entry_id, entry) for entry_id, entry in self._entries.items()
+                          if entry["version"] == version]
+            if candidates:
+                matrix = np.stack([entry["vector"] for _, entry in candidates])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id, entry = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    print(f"⚡ Respuesta desde caché (similitud {scores[best]:.3f})")
+                    return entry["answer"]
+            self.misses += 1
+            return None
+
+    def store(self, question: str, vector: List[float], answer: str, version: str):
+        with self._lock:
+            self._entries[self._next_id] = {
+                "question": question,
+                "vector": self._normalize(vector),
+                "answer": answer,
+                "version": version,
+                "created": time.time(),
+            }
+            self._next_id += 1
+            self._expire(time.time())
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+            if self.persist_path:
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self.persist_path:
+                self._save()
+
+    def _expire(self, now: float):
+        expired = [entry_id for entry_id, entry in self._entries.items()
+                   if now - entry["created"] > self.ttl]
+        for entry_id in expired:
+            del self._entries[entry_id]
+
+    def _save(self):
+        data = [dict(entry, vector=entry["vector"].tolist()) for entry in self._entries.values()]
+        tmp_path = self.persist_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.persist_path)
+
+    def _load(self):
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for entry in data:
+                entry["vector"] = np.asarray(entry["vector"], dtype=np.float32)
+                self._entries[self._next_id] = entry
+                self._next_id += 1
+            self._expire(time.time())
+        except Exception as e:
+            print(f"⚠️ No se pudo cargar la caché de respuestas: {str(e)}")
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
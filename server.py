@@ -0,0 +1,405 @@
+"""Servidor local sin interfaz: carga una vez el conocimiento y el modelo y atiende a varios clientes.
+
+Uso:
+    python server.py [--host 127.0.0.1] [--port 8765] [--token secreto]
+
+Endpoints (cuerpos en JSON):
+    GET  /health          estado de la carga y de Ollama
+    POST /ask             {"question", "filters"?, "timeout"?} -> {"status", "text"}
+    POST /ask/stream      igual, con los tokens como server-sent events
+    POST /query           {"question", "k"?, "filters"?} -> fragmentos, sin pasar por el modelo
+    GET  /admin/stats     motor, índice, historial y arranque
+    POST /admin/reindex   {"full"?: false} reindexa en segundo plano
+    GET  /admin/sources   fuentes inyectadas
+    POST /admin/inject    {"path", "description"?} inyecta un archivo en segundo plano
+    POST /admin/uninject  {"source_id"} quita todos los fragmentos de una fuente
+
+Las conexiones son HTTP/1.1 persistentes; el streaming usa transfer-encoding
+chunked para que la conexión siga sirviendo después. client.py es el cliente.
+
+Los POST exigen "Content-Type: application/json": así una página web no puede
+llamarlos con un formulario o un POST text/plain entre orígenes sin que el
+navegador pida permiso antes (y este servidor no lo concede). Las rutas
+/admin/* leen archivos del equipo y solo existen si se define un token.
+"""
+import os
+import json
+import queue
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from telemetry import metrics
+
+MAX_BODY_BYTES = 1024 * 1024  # tamaño máximo del cuerpo de una petición
+FILTER_KEYS = ("topics", "source_kinds", "sources")  # filtros de KnowledgeManager.query
+
+
+class BadRequest(Exception):
+    pass
+
+
+class JarvisServer(ThreadingHTTPServer):
+    """Servidor HTTP sobre el motor compartido; un hilo por conexión.
+
+    `knowledge_provider` devuelve el KnowledgeManager esperando a que cargue,
+    como en AssistantEngine. Con `token`, todo salvo /health exige la
+    cabecera "Authorization: Bearer <token>"; sin él, /admin/* responde 403.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, engine, knowledge_provider: Callable, bootstrap=None,
+                 profiler=None, token: Optional[str] = None, idle_timeout: float = 60,
+                 sse_ping: float = 15):
+        self.engine = engine
+        self.knowledge_provider = knowledge_provider
+        self.bootstrap = bootstrap
+        self.profiler = profiler
+        self.token = token
+        self.idle_timeout = idle_timeout  # segundos que una conexión inactiva sigue abierta
+        self.sse_ping = sse_ping  # comentario SSE enviado si pasa este tiempo sin tokens
+        self._reindex_thread: Optional[threading.Thread] = None
+        self._reindex_lock = threading.Lock()
+        super().__init__(address, JarvisRequestHandler)
+
+    def knowledge_ready(self) -> bool:
+        return self.bootstrap is None or self.bootstrap.is_ready("knowledge")
+
+    def start_reindex(self, full: bool) -> bool:
+        """Lanza el reindexado en segundo plano; False si ya hay uno en curso."""
+        with self._reindex_lock:
+            if self._reindex_thread is not None and self._reindex_thread.is_alive():
+                return False
+            km = self.knowledge_provider()
+            target = km.reload_knowledge if full else km.sync_sources
+            self._reindex_thread = threading.Thread(target=target, daemon=True,
+                                                    name="jarvis-server-reindex")
+            self._reindex_thread.start()
+            return True
+
+    def start_inject(self, path: str, description: str) -> bool:
+        """Lanza la inyección en segundo plano; False si ya hay una en curso.
+
+        Comparte el hilo con el reindexado: las dos escriben en el mismo índice.
+        """
+        with self._reindex_lock:
+            if self._reindex_thread is not None and self._reindex_thread.is_alive():
+                return False
+            km = self.knowledge_provider()
+
+            def inject():
+                try:
+                    km.inject_source(path, description)
+                except Exception as e:
+                    print(f"⚠️ Error al inyectar {path}: {str(e)}")
+
+            self._reindex_thread = threading.Thread(target=inject, daemon=True,
+                                                    name="jarvis-server-inject")
+            self._reindex_thread.start()
+            return True
+
+
+class JarvisRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # conexiones persistentes por defecto
+    server: JarvisServer
+
+    ROUTES = {
+        ("GET", "/health"): "health",
+        ("POST", "/ask"): "ask",
+        ("POST", "/ask/stream"): "ask_stream",
+        ("POST", "/query"): "query",
+        ("GET", "/admin/stats"): "admin_stats",
+        ("POST", "/admin/reindex"): "admin_reindex",
+        ("GET", "/admin/sources"): "admin_sources",
+        ("POST", "/admin/inject"): "admin_inject",
+        ("POST", "/admin/uninject"): "admin_uninject",
+    }
+
+    def setup(self):
+        # Timeout del socket: una conexión persistente sin peticiones se cierra al vencer
+        self.timeout = self.server.idle_timeout
+        super().setup()
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method: str):
+        path = self.path.split("?", 1)[0].rstrip("/") or "/"
+        name = self.ROUTES.get((method, path))
+        code = 200
+        self._streaming = False
+        try:
+            if name is None:
+                known = any(route_path == path for _, route_path in self.ROUTES)
+                code = 405 if known else 404
+                self._read_body()
+                self._send_json(code, {"error": "Método no permitido" if known else "No encontrado"})
+                return
+            if path.startswith("/admin/") and not self.server.token:
+                code = 403
+                self._read_body()
+                self._send_json(code, {"error": "Las rutas /admin/ necesitan un token "
+                                                "(SERVER_TOKEN o --token)"})
+                return
+            if self.server.token and path != "/health" and \
+                    self.headers.get("Authorization") != f"Bearer {self.server.token}":
+                code = 401
+                self._read_body()
+                self._send_json(code, {"error": "Token no válido"})
+                return
+            if method == "POST" and self.headers.get_content_type() != "application/json":
+                code = 415
+                self._read_body()
+                self._send_json(code, {"error": "Se esperaba Content-Type: application/json"})
+                return
+            code = getattr(self, f"_{name}")() or 200
+        except BadRequest as e:
+            code = 400
+            self._send_json(code, {"error": str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            code = 499  # el cliente cerró la conexión
+            self.close_connection = True
+        except Exception as e:
+            code = 500
+            print(f"⚠️ Error en {method} {path}: {str(e)}")
+            if self._streaming:
+                # La respuesta ya empezó: solo queda cortar la conexión
+                self.close_connection = True
+            else:
+                self._send_json(code, {"error": str(e)})
+        finally:
+            metrics.inc("http_requests_total", endpoint=path if name else "other", code=code)
+
+    # ---- entrada y salida ----
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            # Sin leerlo, lo que sigue en la conexión ya no sería una petición
+            self.close_connection = True
+            raise BadRequest("Cuerpo demasiado grande")
+        # Se lee siempre para que la siguiente petición de la conexión empiece en su sitio
+        return self.rfile.read(length) if length else b""
+
+    def _read_json(self) -> dict:
+        raw = self._read_body()
+        if not raw:
+            return {}
+        try:
+            body = json.loads(raw.decode("utf-8"))
+        except ValueError:
+            raise BadRequest("JSON no válido")
+        if not isinstance(body, dict):
+            raise BadRequest("Se esperaba un objeto JSON")
+        return body
+
+    @staticmethod
+    def _question(body: dict) -> str:
+        question = body.get("question")
+        if not isinstance(question, str) or not question.strip():
+            raise BadRequest("Falta 'question'")
+        return question
+
+    @staticmethod
+    def _filters(body: dict) -> dict:
+        filters = body.get("filters") or {}
+        if not isinstance(filters, dict) or set(filters) - set(FILTER_KEYS):
+            raise BadRequest(f"'filters' admite solo {', '.join(FILTER_KEYS)}")
+        for key, values in filters.items():
+            if values is not None and (not isinstance(values, list)
+                                       or not all(isinstance(v, str) for v in values)):
+                raise BadRequest(f"'{key}' debe ser una lista de textos")
+        return filters
+
+    @staticmethod
+    def _timeout(body: dict) -> Optional[float]:
+        timeout = body.get("timeout")
+        if timeout is not None and (not isinstance(timeout, (int, float)) or timeout <= 0):
+            raise BadRequest("'timeout' debe ser un número de segundos positivo")
+        return timeout
+
+    def _send_json(self, code: int, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, text: str):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_event(self, event: str, payload: dict):
+        self._write_chunk(f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n")
+
+    def log_message(self, format, *args):
+        pass  # las peticiones quedan en los contadores de métricas
+
+    # ---- endpoints ----
+
+    def _health(self):
+        bootstrap = self.server.bootstrap
+        engine = self.server.engine
+        self._send_json(200, {
+            "knowledge": self.server.knowledge_ready(),
+            "model": bootstrap is None or bootstrap.is_ready("model"),
+            "ollama": engine.supervisor.status() if engine.supervisor is not None else None,
+        })
+
+    def _ask(self):
+        body = self._read_json()
+        result = self.server.engine.ask_sync(self._question(body), timeout=self._timeout(body),
+                                             filters=self._filters(body))
+        self._send_json(200, {"status": result.status, "text": result.text})
+
+    def _ask_stream(self):
+        body = self._read_json()
+        question, filters = self._question(body), self._filters(body)
+        tokens = queue.Queue()
+        request = self.server.engine.submit(question, on_token=tokens.put,
+                                            timeout=self._timeout(body), filters=filters)
+        request.future.add_done_callback(lambda _: tokens.put(None))
+
+        self._streaming = True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            while True:
+                try:
+                    token = tokens.get(timeout=self.server.sse_ping)
+                except queue.Empty:
+                    # Mantiene viva la conexión mientras el modelo piensa
+                    self._write_chunk(": ping\n\n")
+                    continue
+                if token is None:
+                    break
+                self._send_event("token", {"token": token})
+            result = request.result()
+            self._send_event("done", {"status": result.status, "text": result.text})
+            self._write_chunk("")  # fin del cuerpo chunked
+        finally:
+            if not request.future.done():
+                # El cliente se fue: se libera el hueco hacia Ollama
+                request.cancel()
+
+    def _query(self):
+        body = self._read_json()
+        k = body.get("k", 4)
+        if not isinstance(k, int) or not 0 < k <= 100:
+            raise BadRequest("'k' debe ser un entero entre 1 y 100")
+        km = self.server.knowledge_provider()
+        docs = km.query(self._question(body), k=k, **self._filters(body))
+        self._send_json(200, {"results": [
+            {"id": doc.id, "text": doc.page_content, "metadata": doc.metadata} for doc in docs
+        ]})
+
+    def _admin_stats(self):
+        stats = {"engine": self.server.engine.stats(), "knowledge": None}
+        if self.server.knowledge_ready():
+            km = self.server.knowledge_provider()
+            store = km.vectorstore
+            stats["knowledge"] = {
+                "chunks": len(store),
+                "partitions": store.sizes(),
+                "index_types": store.kinds(),
+                "generations": km.generation_stats(),
+                "history": {"interactions": km.history.count, "bytes": km.history.bytes},
+            }
+        if self.server.profiler is not None:
+            stats["startup"] = self.server.profiler.summary()
+        self._send_json(200, stats)
+
+    def _admin_reindex(self):
+        body = self._read_json()
+        full = bool(body.get("full", False))
+        if not self.server.knowledge_ready():
+            self._send_json(503, {"error": "La base de conocimiento aún se está cargando"})
+            return 503
+        if not self.server.start_reindex(full):
+            self._send_json(409, {"error": "Ya hay un reindexado en curso"})
+            return 409
+        self._send_json(202, {"started": True, "kind": "full" if full else "sync"})
+        return 202
+
+    def _admin_sources(self):
+        if not self.server.knowledge_ready():
+            self._send_json(503, {"error": "La base de conocimiento aún se está cargando"})
+            return 503
+        self._send_json(200, {"sources": self.server.knowledge_provider().injected_sources()})
+
+    def _admin_inject(self):
+        body = self._read_json()
+        path = body.get("path")
+        description = body.get("description") or ""
+        if not isinstance(path, str) or not path.strip():
+            raise BadRequest("Falta 'path'")
+        if not isinstance(description, str):
+            raise BadRequest("'description' debe ser un texto")
+        if not self.server.knowledge_ready():
+            self._send_json(503, {"error": "La base de conocimiento aún se está cargando"})
+            return 503
+        km = self.server.knowledge_provider()
+        if not os.path.isfile(path):
+            raise BadRequest(f"No existe el archivo {path}")
+        if not self.server.start_inject(path, description):
+            self._send_json(409, {"error": "Ya hay un reindexado o una inyección en curso"})
+            return 409
+        # El id no depende del contenido: el cliente puede consultar /admin/sources con él
+        self._send_json(202, {"started": True, "source_id": km.source_id_for(path)})
+        return 202
+
+    def _admin_uninject(self):
+        body = self._read_json()
+        source_id = body.get("source_id")
+        if not isinstance(source_id, str) or not source_id:
+            raise BadRequest("Falta 'source_id'")
+        if not self.server.knowledge_ready():
+            self._send_json(503, {"error": "La base de conocimiento aún se está cargando"})
+            return 503
+        try:
+            removed = self.server.knowledge_provider().remove_source(source_id)
+        except KeyError:
+            self._send_json(404, {"error": f"No hay ninguna fuente {source_id}"})
+            return 404
+        self._send_json(200, {"source_id": source_id, "removed": removed})
+
+
+def main():
+    import llm
+
+    parser = argparse.ArgumentParser(description="Servidor HTTP local de Jarvis")
+    parser.add_argument("--host", default=llm.SERVER_HOST, help="dirección en la que escuchar")
+    parser.add_argument("--port", type=int, default=llm.SERVER_PORT, help="puerto")
+    parser.add_argument("--token", default=llm.SERVER_TOKEN,
+                        help="exigir 'Authorization: Bearer <token>' salvo en /health; "
+                             "sin token no hay rutas /admin/")
+    args = parser.parse_args()
+
+    llm.start()
+    server = JarvisServer((args.host, args.port), llm.engine, llm.get_knowledge_manager,
+                          bootstrap=llm.bootstrap, profiler=llm.profiler, token=args.token,
+                          idle_timeout=llm.SERVER_IDLE_TIMEOUT)
+    print(f"🌐 Servidor de Jarvis en http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Deteniendo servidor...")
+    finally:
+        server.server_close()
+        llm.engine.stop()
+        if llm.bootstrap.is_ready("knowledge"):
+            llm.get_knowledge_manager().close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+
+class StartupProfiler:
+    """Mide cuánto tarda cada fase del arranque y avisa del progreso a quien escuche.
+
+    Los oyentes reciben (evento, nombre, etiqueta, segundos) donde evento es
+    "start", "end" o "error"; se llaman desde el hilo que ejecuta la fase.
+    """
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.phases: List[dict] = []
+        self.marks: Dict[str, float] = {}
+        self._listeners: List[Callable] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, listener: Callable):
+        self._listeners.append(listener)
+
+    def _notify(self, event: str, name: str, label: str, seconds: Optional[float] = None):
+        for listener in list(self._listeners):
+            try:
+                listener(event, name, label, seconds)
+            except Exception as e:
+                print(f"⚠️ Error al notificar progreso de arranque: {str(e)}")
+
+    @contextmanager
+    def phase(self, name: str, label: Optional[str] = None):
+        label = label or name
+        self._notify("start", name, label)
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self._record(name, start)
+            self._notify("error", name, label, time.perf_counter() - start)
+            raise
+        seconds = self._record(name, start)
+        self._notify("end", name, label, seconds)
+
+    def _record(self, name: str, start: float) -> float:
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self.phases.append({
+                "name": name,
+                "start": round(start - self.t0, 4),
+                "seconds": round(seconds, 4),
+                "thread": threading.current_thread().name,
+            })
+        return seconds
+
+    def mark(self, name: str):
+        """Registra un instante (segundos desde el inicio del proceso)."""
+        with self._lock:
+            self.marks[name] = round(time.perf_counter() - self.t0, 4)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "phases": list(self.phases),
+                "marks": dict(self.marks),
+                "elapsed": round(time.perf_counter() - self.t0, 4),
+            }
+
+    def report(self):
+        summary = self.summary()
+        print("⏱️ Desglose del arranque:")
+        for phase in sorted(summary["phases"], key=lambda p: p["start"]):
+            print(f"   {phase['name']:<28} +{phase['start']:7.2f}s  {phase['seconds']:7.2f}s  [{phase['thread']}]")
+        for name, at in sorted(summary["marks"].items(), key=lambda m: m[1]):
+            print(f"   {name:<28} @{at:7.2f}s")
+
+    def save(self, path: str):
+        """Añade el desglose a un JSONL para comparar arranques entre versiones."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(dict(self.summary(), timestamp=time.time())) + "\n")
+
+
+# Perfilador del proceso; se crea al importar para que t0 sea lo más temprano posible
+profiler = StartupProfiler()
+
+
+class Bootstrap:
+    """Inicializa componentes pesados en hilos de fondo; cada uno puede esperarse por separado."""
+
+    def __init__(self, profiler: StartupProfiler):
+        self.profiler = profiler
+        self._components: Dict[str, dict] = {}
+        self._started = False
+        self._completed = False
+        self._lock = threading.Lock()
+        self._on_complete: List[Callable] = []
+
+    def add(self, name: str, factory: Callable, label: str):
+        self._components[name] = {
+            "factory": factory, "label": label, "event": threading.Event(),
+            "result": None, "error": None,
+        }
+
+    def on_complete(self, callback: Callable):
+        """Se llama una vez cuando todos los componentes han terminado (bien o mal)."""
+        self._on_complete.append(callback)
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for name in self._components:
+            threading.Thread(target=self._run, args=(name,), daemon=True,
+                             name=f"jarvis-init-{name}").start()
+
+    def _run(self, name: str):
+        component = self._components[name]
+        try:
+            with self.profiler.phase(name, component["label"]):
+                component["result"] = component["factory"]()
+        except Exception as e:
+            print(f"⚠️ Error al inicializar {name}: {str(e)}")
+            component["error"] = e
+        finally:
+            component["event"].set()
+            with self._lock:
+                finished = (not self._completed
+                            and all(c["event"].is_set() for c in self._components.values()))
+                if finished:
+                    self._completed = True
+            if finished:
+                for callback in self._on_complete:
+                    callback()
+
+    def is_ready(self, name: str) -> bool:
+        return self._components[name]["event"].is_set()
+
+    def retry(self, name: str) -> bool:
+        """Vuelve a lanzar un componente que falló; False si no falló o ya se está reintentando."""
+        component = self._components[name]
+        with self._lock:
+            if component["error"] is None or not component["event"].is_set():
+                return False
+            component["error"] = None
+            component["event"].clear()
+        threading.Thread(target=self._run, args=(name,), daemon=True,
+                         name=f"jarvis-init-{name}").start()
+        return True
+
+    def wait(self, name: str, timeout: Optional[float] = None):
+        """Espera a un componente; arranca la inicialización si nadie lo hizo antes.
+
+        Si falló (p. ej. Ollama aún no estaba arrancado), se reintenta una vez
+        en esta llamada en lugar de devolver para siempre el mismo error.
+        """
+        self.start()
+        component = self._components[name]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for attempt in range(2):
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not component["event"].wait(remaining):
+                raise TimeoutError(f"{name} no terminó de inicializarse a tiempo")
+            error = component["error"]
+            if error is None:
+                return component["result"]
+            if attempt == 0:
+                self.retry(name)
+        raise error
+
+    def wait_all(self, timeout: Optional[float] = None):
+        for name in self._components:
+            self.wait(name, timeout)
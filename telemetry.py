@@ -0,0 +1,282 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional, Tuple
+
+import psutil
+
+# Límites (segundos) de los buckets de los histogramas, del estilo de Prometheus
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0, 120.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Traza de la pregunta en curso; asyncio.to_thread la hereda, así que los
+# spans medidos dentro del gestor de conocimiento se asocian a su pregunta
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("jarvis_trace", default=None)
+
+
+class Histogram:
+    """Buckets acumulados desde el arranque y las últimas muestras para los percentiles."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS, window: int = 2048):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # el último es +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def quantiles(self, quantiles: Tuple[float, ...] = QUANTILES) -> Dict[float, float]:
+        values = sorted(self.recent)
+        if not values:
+            return {}
+        return {q: values[min(len(values) - 1, int(q * len(values)))] for q in quantiles}
+
+
+class _Trace:
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.start = time.perf_counter()
+        self.attrs = attrs
+        self.spans: List[dict] = []
+
+
+class Telemetry:
+    """Spans, histogramas de latencia por etapa, contadores y memoria del proceso.
+
+    Cada traza (una pregunta) se escribe como una línea de un JSONL rotativo
+    con sus spans; los agregados se exponen en formato de texto de Prometheus.
+    """
+
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[Tuple[str, tuple], float] = {}
+        self.gauges: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._logger: Optional[logging.Logger] = None
+        self._process = psutil.Process()
+        self._sampler: Optional[threading.Thread] = None
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._stop = threading.Event()
+
+    # ---- registro ----
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def record(self, name: str, seconds: float, start: Optional[float] = None, **attrs):
+        """Registra un span ya medido; `start` es su time.perf_counter() inicial."""
+        self.observe(name, seconds)
+        trace = _current_trace.get()
+        span = {"name": name, "seconds": round(seconds, 6), **attrs}
+        if trace is not None:
+            span["start"] = round((start if start is not None else time.perf_counter() - seconds)
+                                  - trace.start, 6)
+            trace.spans.append(span)
+        else:
+            # Fuera de una pregunta (p. ej. reindexado en segundo plano) va suelto al JSONL
+            self._export(dict(span, type="span", timestamp=time.time()))
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        start = time.perf_counter()
+        try:
+            yield attrs  # quien mide puede añadir atributos durante el span
+        except BaseException as e:
+            attrs["error"] = type(e).__name__
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, start, **attrs)
+
+    @contextmanager
+    def trace(self, name: str, **attrs):
+        """Agrupa los spans de una pregunta; al terminar se exporta como una línea."""
+        trace = _Trace(name, attrs)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            seconds = time.perf_counter() - trace.start
+            self.observe(name, seconds)
+            self._export({
+                "type": "trace",
+                "name": name,
+                "trace_id": trace.trace_id,
+                "timestamp": time.time(),
+                "seconds": round(seconds, 6),
+                "rss_bytes": self.sample_rss(),
+                **trace.attrs,
+                "spans": trace.spans,
+            })
+
+    def sample_rss(self) -> int:
+        rss = self._process.memory_info().rss
+        with self._lock:
+            self.gauges["process_rss_bytes"] = rss
+            self.gauges["process_rss_max_bytes"] = max(rss, self.gauges.get("process_rss_max_bytes", 0))
+        return rss
+
+    # ---- exportación ----
+
+    def configure(self, jsonl_path: Optional[str] = None, max_bytes: int = 5 * 1024 * 1024,
+                  backups: int = 3):
+        """Activa el JSONL rotativo: al pasar de `max_bytes` se renombra y se guardan `backups`."""
+        if not jsonl_path:
+            return
+        directory = os.path.dirname(jsonl_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handler = RotatingFileHandler(jsonl_path, maxBytes=max_bytes, backupCount=backups,
+                                      encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger = logging.getLogger("jarvis.telemetry")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        for old in list(logger.handlers):
+            logger.removeHandler(old)
+            old.close()
+        logger.addHandler(handler)
+        self._logger = logger
+
+    def _export(self, record: dict):
+        if self._logger is not None:
+            try:
+                self._logger.info(json.dumps(record, ensure_ascii=False))
+            except Exception as e:
+                print(f"⚠️ Error al exportar métricas: {str(e)}")
+
+    def start(self, port: Optional[int] = None, host: str = "127.0.0.1",
+              rss_interval: float = 15.0):
+        """Arranca el muestreo de memoria y, si hay puerto, el endpoint /metrics."""
+        if self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample_loop, args=(rss_interval,),
+                                             daemon=True, name="jarvis-rss")
+            self._sampler.start()
+        if port and self._server is None:
+            try:
+                self._server = ThreadingHTTPServer((host, port), _handler_for(self))
+            except OSError as e:
+                print(f"⚠️ No se pudo abrir el endpoint de métricas en {host}:{port}: {str(e)}")
+                return
+            threading.Thread(target=self._server.serve_forever, daemon=True,
+                             name="jarvis-metrics").start()
+            print(f"📈 Métricas en http://{host}:{port}/metrics")
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _sample_loop(self, interval: float):
+        while not self._stop.is_set():
+            try:
+                self.sample_rss()
+            except Exception as e:
+                print(f"⚠️ Error al medir la memoria: {str(e)}")
+            self._stop.wait(interval)
+
+    def latencies(self) -> Dict[str, dict]:
+        """{etapa: {count, mean, p50, p95, p99}} en segundos."""
+        with self._lock:
+            result = {}
+            for stage, histogram in sorted(self.histograms.items()):
+                quantiles = histogram.quantiles()
+                result[stage] = {
+                    "count": histogram.count,
+                    "mean": round(histogram.sum / histogram.count, 6) if histogram.count else 0.0,
+                    **{f"p{int(q * 100)}": round(value, 6) for q, value in quantiles.items()},
+                }
+            return result
+
+    def report(self):
+        print("⏱️ Latencia por etapa (s):")
+        for stage, stats in self.latencies().items():
+            print(f"   {stage:<20} n={stats['count']:<6} p50 {stats.get('p50', 0):8.3f}"
+                  f"  p95 {stats.get('p95', 0):8.3f}  p99 {stats.get('p99', 0):8.3f}")
+
+    def prometheus(self) -> str:
+        """Métricas en el formato de texto de Prometheus."""
+        lines = [
+            "# HELP jarvis_stage_seconds Duración de cada etapa de la pregunta.",
+            "# TYPE jarvis_stage_seconds histogram",
+        ]
+        with self._lock:
+            histograms = {stage: (list(h.counts), h.sum, h.count, h.quantiles(), h.buckets)
+                          for stage, h in sorted(self.histograms.items())}
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+        for stage, (counts, total, count, _, buckets) in histograms.items():
+            cumulative = 0
+            for bound, bucket_count in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f'jarvis_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'jarvis_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'jarvis_stage_seconds_count{{stage="{stage}"}} {count}')
+        lines += [
+            "# HELP jarvis_stage_recent_seconds Percentiles de las últimas muestras de cada etapa.",
+            "# TYPE jarvis_stage_recent_seconds summary",
+        ]
+        for stage, (_, _, _, quantiles, _) in histograms.items():
+            for q, value in quantiles.items():
+                lines.append(f'jarvis_stage_recent_seconds{{stage="{stage}",quantile="{q}"}} {value:.6f}')
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE jarvis_{name} counter")
+                declared.add(name)
+            label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+            lines.append(f"jarvis_{name}{{{label_text}}} {value}" if label_text else f"jarvis_{name} {value}")
+        for name, value in gauges:
+            lines.append(f"# TYPE jarvis_{name} gauge")
+            lines.append(f"jarvis_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _handler_for(telemetry: Telemetry):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = telemetry.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # sin una línea por cada petición del scraper
+
+    return MetricsHandler
+
+
+# Métricas del proceso, compartidas por todos los módulos como el perfilador de arranque
+metrics = Telemetry()
@@ -0,0 +1,136 @@
+import asyncio
+import gc
+import threading
+import time
+import types
+
+import pytest
+
+from engine import AssistantEngine, STATUS_CANCELLED, STATUS_ERROR, STATUS_OK
+
+
+class StubKnowledge:
+    def __init__(self):
+        self.embeddings = types.SimpleNamespace(embed_query=lambda text: [0.0, 1.0])
+
+    def knowledge_version(self):
+        return "v1"
+
+
+class StubCache:
+    def lookup(self, vector, version):
+        return "respuesta guardada"
+
+    def stats(self):
+        return {}
+
+
+@pytest.fixture
+def engines():
+    started = []
+    yield started
+    for engine in started:
+        engine.stop()
+
+
+def start(engines, **options):
+    engine = AssistantEngine(build_prompt=lambda *args, **kwargs: "", **options)
+    engine.start()
+    engines.append(engine)
+    errors = []
+    engine._loop.call_soon_threadsafe(engine._loop.set_exception_handler,
+                                      lambda loop, context: errors.append(context))
+    return engine, errors
+
+
+def pending_tasks(engine):
+    """Tareas del bucle del motor que no son sus workers."""
+    tasks = asyncio.run_coroutine_threadsafe(_tasks(), engine._loop).result()
+    return [task for task in tasks if "_worker" not in repr(task.get_coro())]
+
+
+async def _tasks():
+    return asyncio.all_tasks() - {asyncio.current_task()}
+
+
+def test_cache_hit_does_not_leave_model_task(engines):
+    release = threading.Event()
+    engine, errors = start(engines, knowledge_provider=StubKnowledge,
+                           model_factory=lambda: release.wait(5) and None,
+                           response_cache=StubCache())
+    result = engine.ask_sync("¿Qué hotel reservé?")
+    assert result.status == STATUS_OK
+    assert result.text == "respuesta guardada"
+    assert pending_tasks(engine) == []
+    release.set()
+    assert errors == []
+
+
+def test_error_does_not_leave_model_task(engines):
+    release = threading.Event()
+
+    def broken_knowledge():
+        raise RuntimeError("índice roto")
+
+    engine, errors = start(engines, knowledge_provider=broken_knowledge,
+                           model_factory=lambda: release.wait(5) and None)
+    result = engine.ask_sync("hola")
+    assert result.status == STATUS_ERROR
+    assert "índice roto" in result.text
+    assert pending_tasks(engine) == []
+    release.set()
+    assert errors == []
+
+
+def test_failed_model_task_is_retrieved(engines):
+    def model_fails_first():
+        raise RuntimeError("sin Ollama")
+
+    def slow_knowledge():
+        time.sleep(0.05)  # el modelo ya ha fallado cuando llega la respuesta de la caché
+        return StubKnowledge()
+
+    engine, errors = start(engines, knowledge_provider=slow_knowledge,
+                           model_factory=model_fails_first, response_cache=StubCache())
+    assert engine.ask_sync("hola").status == STATUS_OK
+    gc.collect()
+    assert not [e for e in errors if "never retrieved" in e.get("message", "")]
+
+
+def test_stop_with_request_in_flight(engines):
+    release = threading.Event()
+
+    def slow_knowledge():
+        release.wait(5)
+        return StubKnowledge()
+
+    engine = AssistantEngine(slow_knowledge, model_factory=lambda: None,
+                             build_prompt=lambda *args, **kwargs: "")
+    engine.start()
+    request = engine.submit("hola")
+    time.sleep(0.1)  # el worker ya la está atendiendo
+
+    stopper = threading.Thread(target=engine.stop)
+    stopper.start()
+    stopper.join(timeout=3)
+    release.set()
+    assert not stopper.is_alive()
+    assert request.result(timeout=1).status == STATUS_CANCELLED
+
+
+def test_cancelled_request_keeps_worker_alive(engines):
+    release = threading.Event()
+
+    def slow_knowledge():
+        release.wait(5)
+        return StubKnowledge()
+
+    engine, _ = start(engines, knowledge_provider=slow_knowledge, model_factory=lambda: None,
+                      response_cache=StubCache())
+    request = engine.submit("hola")
+    time.sleep(0.1)
+    request.cancel()
+    assert request.result(timeout=1).status == STATUS_CANCELLED
+    release.set()
+    # El worker sigue atendiendo la cola
+    assert engine.ask_sync("otra", timeout=2).status == STATUS_OK
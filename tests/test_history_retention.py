@@ -0,0 +1,113 @@
+import os
+from datetime import datetime, timedelta
+
+from history_retention import (HistoryRetention, SEGMENT_PREFIX, TIMESTAMP_FORMAT, format_interaction,
+                               parse_interactions)
+
+NOW = datetime(2026, 6, 1, 12, 0, 0)
+
+
+def stamp(days_ago: float) -> str:
+    return (NOW - timedelta(days=days_ago)).strftime(TIMESTAMP_FORMAT)
+
+
+def write_history(path, entries):
+    """entries: (clave, días de antigüedad, pregunta)."""
+    with open(path, "w", encoding="utf-8") as f:
+        for key, days_ago, question in entries:
+            f.write(format_interaction(stamp(days_ago), key, question, f"Respuesta a {question}"))
+
+
+def keys_in(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [item.key for item in parse_interactions(f.read(), stamp(0))]
+
+
+def make_retention(tmp_path, **options):
+    docs = tmp_path / "docs"
+    state = tmp_path / "state"
+    docs.mkdir(exist_ok=True)
+    state.mkdir(exist_ok=True)
+    return HistoryRetention(str(docs), str(docs / "historial.txt"), str(state), **options)
+
+
+def test_duplicate_is_found_also_for_old_interactions(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    write_history(docs / "historial.txt", [("antigua", 2, "¿Qué tiempo hace?")])
+    retention = make_retention(tmp_path, dedup_similarity=0.95)
+    embedded = []
+
+    def embed_documents(texts):
+        # Las interacciones sin embedding se calculan al buscar el primer duplicado
+        embedded.extend(texts)
+        return [[1.0, 0.0, 0.0] for _ in texts]
+
+    retention.note_added(parse_interactions(
+        format_interaction(stamp(0), "nueva", "¿Dónde vivo?", "En Madrid"), stamp(0))[0], [0.0, 1.0, 0.0])
+    assert retention.find_duplicate([0.99, 0.05, 0.0], embed_documents) == "antigua"
+    assert retention.find_duplicate([0.0, 2.0, 0.1], embed_documents) == "nueva"
+    assert retention.find_duplicate([0.0, 0.0, 1.0], embed_documents) is None
+    assert len(embedded) == 1 and "¿Qué tiempo hace?" in embedded[0]
+
+
+def test_compact_enforces_age_and_count_caps(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    write_history(docs / "historial.txt", [
+        ("caducada", 400, "pregunta caducada"),
+        ("vieja", 30, "pregunta vieja"),
+        ("usada", 20, "pregunta usada"),
+        ("media", 10, "pregunta media"),
+        ("reciente", 1, "pregunta reciente"),
+    ])
+    retention = make_retention(tmp_path, max_age_days=365, max_interactions=3, grace_days=7,
+                               segment_bytes=1024 * 1024)
+    assert retention.count == 5
+    assert retention.due(NOW.timestamp())
+    retention.record_hits(["usada"])
+
+    changed, evicted = retention.compact(NOW.timestamp())
+    # Cae la caducada y, para quedar en tres, la menos recuperada fuera del periodo de gracia
+    assert evicted == 2
+    assert changed == [retention.history_file]
+    assert keys_in(retention.history_file) == ["usada", "media", "reciente"]
+    assert retention.count == 3
+    assert not retention.due(NOW.timestamp())
+
+
+def test_compact_enforces_byte_cap_sparing_grace_period(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    write_history(docs / "historial.txt", [("vieja", 30, "a" * 200), ("reciente", 1, "b" * 200)])
+    retention = make_retention(tmp_path, max_bytes=600, grace_days=7, segment_bytes=1024 * 1024)
+    assert retention.bytes > 600
+
+    _, evicted = retention.compact(NOW.timestamp())
+    assert evicted == 1
+    assert keys_in(retention.history_file) == ["reciente"]
+    assert retention.bytes <= 600
+
+
+def test_full_active_file_rolls_over_into_segment(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    write_history(docs / "historial.txt", [("uno", 3, "primera"), ("dos", 2, "segunda")])
+    retention = make_retention(tmp_path, segment_bytes=100)
+    assert retention.due(NOW.timestamp())
+
+    changed, evicted = retention.compact(NOW.timestamp())
+    segment = os.path.join(retention.segments_dir, f"{SEGMENT_PREFIX}000001.txt")
+    assert evicted == 0
+    assert sorted(changed) == sorted([segment, retention.history_file])
+    assert keys_in(segment) == ["uno", "dos"]
+    assert keys_in(retention.history_file) == []
+    assert retention.is_history(os.path.relpath(segment, retention.docs_path))
+
+    # La siguiente rotación crea otro segmento y no toca el anterior
+    write_history(docs / "historial.txt", [("tres", 1, "tercera"), ("cuatro", 0, "cuarta")])
+    retention.refresh()
+    changed, _ = retention.compact(NOW.timestamp())
+    assert segment not in changed
+    assert keys_in(os.path.join(retention.segments_dir, f"{SEGMENT_PREFIX}000002.txt")) == ["tres", "cuatro"]
+    assert retention.count == 4
@@ -0,0 +1,69 @@
+import hashlib
+import os
+
+from benchmark import FakeEmbeddings
+from ingestion import IngestionPipeline
+
+
+def write_notes(folder, name, paragraphs):
+    path = folder / name
+    path.write_text("\n\n".join(f"Párrafo {i}: nota número {i} sobre el viaje a Roma y el hotel."
+                                for i in range(paragraphs)), encoding="utf-8")
+    return path
+
+
+def run(pipeline, folder):
+    sources = {entry.name: (entry.stat().st_size, entry.stat().st_mtime_ns)
+               for entry in os.scandir(folder)}
+    return [batch for batch in pipeline.run(str(folder), sources)]
+
+
+def test_large_file_is_split_by_windows(tmp_path):
+    big = write_notes(tmp_path, "grande.txt", 2000)
+    small = write_notes(tmp_path, "pequeño.txt", 3)
+    pipeline = IngestionPipeline(FakeEmbeddings(dim=8), batch_size=16, window_bytes=4096)
+    batches = run(pipeline, tmp_path)
+
+    texts = [text for batch in batches for text in batch["texts"]]
+    ids = [doc_id for batch in batches for doc_id in batch["ids"]]
+    assert len(ids) == len(set(ids))
+    entry = pipeline.files["grande.txt"]
+    assert entry["sha256"] == hashlib.sha256(big.read_bytes()).hexdigest()
+    assert entry["ids"] == [f"grande.txt::{entry['sha256'][:16]}::{i}" for i in range(len(entry["ids"]))]
+    assert len(pipeline.files["pequeño.txt"]["ids"]) >= 1
+    # Ninguna nota se pierde en los cortes entre ventanas
+    joined = " ".join(texts)
+    for i in (0, 999, 1999):
+        assert f"nota número {i} " in joined
+    assert all(len(text) <= 200 for text in texts)
+    assert small.name in {os.path.basename(m["source"]) for b in batches for m in b["metadatas"]}
+
+
+def test_large_file_never_held_whole(tmp_path, monkeypatch):
+    """Ni la lectura ni la división reciben más de una ventana del archivo."""
+    import ingestion
+
+    write_notes(tmp_path, "grande.txt", 5000)
+    write_notes(tmp_path, "pequeño.txt", 3)
+    window = 8 * 1024
+    seen = []
+    split_text = ingestion.split_text
+    monkeypatch.setattr(ingestion, "split_text", lambda text: seen.append(len(text)) or split_text(text))
+    splitter_split = ingestion.RecursiveCharacterTextSplitter.split_text
+    monkeypatch.setattr(ingestion.RecursiveCharacterTextSplitter, "split_text",
+                        lambda self, text: seen.append(len(text)) or splitter_split(self, text))
+
+    pipeline = IngestionPipeline(FakeEmbeddings(dim=8), batch_size=16, split_workers=1,
+                                 window_bytes=window)
+    run(pipeline, tmp_path)
+    assert os.path.getsize(tmp_path / "grande.txt") > 10 * window
+    assert seen and max(seen) <= window
+
+
+def test_non_utf8_file_does_not_abort_ingestion(tmp_path):
+    (tmp_path / "latin1.txt").write_bytes("Canción de la mañana en el salón.".encode("latin-1"))
+    write_notes(tmp_path, "notas.txt", 3)
+    pipeline = IngestionPipeline(FakeEmbeddings(dim=8), batch_size=16)
+    texts = [text for batch in run(pipeline, tmp_path) for text in batch["texts"]]
+    assert set(pipeline.files) == {"latin1.txt", "notas.txt"}
+    assert any(text.startswith("Canci") and "�" in text for text in texts)
@@ -0,0 +1,77 @@
+import pytest
+from langchain_core.documents import Document
+
+from model_router import TIER_FAST, TIER_FULL, ModelRouter, ModelTier
+
+FAST_MODEL = "llama3.2:1b"
+FULL_MODEL = "mistral"
+LONG_QUESTION = "¿" + " ".join(["palabra"] * 40) + "?"
+
+
+def make_router(available=None):
+    created = []
+
+    def client_factory(model, num_ctx, num_predict):
+        created.append((model, num_ctx, num_predict))
+        return object()
+
+    router = ModelRouter(client_factory,
+                         ModelTier(TIER_FAST, FAST_MODEL, num_ctx=2048, num_predict=128),
+                         ModelTier(TIER_FULL, FULL_MODEL, num_ctx=4096, num_predict=256),
+                         greeting_predict=64, detail_predict=512, available=available)
+    return router, created
+
+
+def fragments(*scores):
+    return [Document(page_content=f"fragmento {i}", metadata={"score": score})
+            for i, score in enumerate(scores)]
+
+
+@pytest.mark.parametrize("text, scores, tier, num_predict, reason", [
+    ("¡Hola!", (), TIER_FAST, 64, "saludo"),
+    ("Muchas gracias", (0.9,), TIER_FAST, 64, "saludo"),
+    ("hola, ¿qué hay?", (), TIER_FAST, 64, "saludo"),
+    ("hola, ¿qué hay?", (0.8,), TIER_FAST, 128, "corta_con_contexto"),
+    ("¿Dónde vive mi hermana?", (0.3, 0.75), TIER_FAST, 128, "corta_con_contexto"),
+    ("¿Dónde vive mi hermana?", (0.3,), TIER_FULL, 256, "general"),
+    ("¿Dónde vive mi hermana?", (), TIER_FULL, 256, "general"),
+    ("Explícame cómo funciona el WAL", (0.9,), TIER_FULL, 512, "detalle"),
+    ("¿Por qué falla el servidor?", (0.9,), TIER_FULL, 512, "detalle"),
+    (LONG_QUESTION, (0.9,), TIER_FULL, 512, "detalle"),
+    # "planta" contiene "plan", pero no es la palabra clave
+    ("¿Cuándo riego la planta?", (0.9,), TIER_FAST, 128, "corta_con_contexto"),
+])
+def test_route_selects_tier(text, scores, tier, num_predict, reason):
+    router, _ = make_router()
+    route = router.route(text, fragments(*scores))
+    assert (route.tier.name, route.num_predict, route.reason) == (tier, num_predict, reason)
+    assert route.model == (FAST_MODEL if tier == TIER_FAST else FULL_MODEL)
+    assert route.num_ctx == (2048 if tier == TIER_FAST else 4096)
+    assert router.counters[tier] == 1
+
+
+@pytest.mark.parametrize("available, tier, model, reason", [
+    (lambda: {FAST_MODEL, FULL_MODEL}, TIER_FAST, FAST_MODEL, "saludo"),
+    (lambda: {FULL_MODEL}, TIER_FULL, FULL_MODEL, "saludo_sin_modelo_rapido"),
+    (lambda: set(), TIER_FULL, FULL_MODEL, "saludo_sin_modelo_rapido"),
+    # Si aún no se sabe qué hay instalado, se confía en el nivel elegido
+    (lambda: None, TIER_FAST, FAST_MODEL, "saludo"),
+])
+def test_missing_fast_model_falls_back_to_full_tier(available, tier, model, reason):
+    router, _ = make_router(available)
+    route = router.route("hola")
+    assert (route.tier.name, route.model, route.reason) == (tier, model, reason)
+    assert route.num_predict == 64  # se mantiene el presupuesto del saludo
+    assert route.num_ctx == router.tiers[tier].num_ctx
+
+
+def test_clients_are_pooled_per_budget():
+    router, created = make_router()
+    greeting = router.route("hola")
+    assert router.client(greeting) is router.client(router.route("buenas"))
+    assert router.client(router.route("Explícame el WAL")) is not router.client(greeting)
+    assert created == [(FAST_MODEL, 2048, 64), (FULL_MODEL, 4096, 512)]
+
+    router.warm()
+    assert sorted(created) == sorted([(FAST_MODEL, 2048, 64), (FULL_MODEL, 4096, 512),
+                                      (FAST_MODEL, 2048, 128), (FULL_MODEL, 4096, 256)])
@@ -0,0 +1,201 @@
+import socket
+import time
+import types
+
+import pytest
+
+import ollama_supervisor
+from benchmark import FakeOllamaServer
+from ollama_supervisor import (OllamaSupervisor, STATE_DEGRADED, STATE_DOWN, STATE_READY,
+                               STATE_STARTING)
+
+MODEL = "mistral:7b-instruct"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Reloj manual para el backoff; el resto del módulo sigue usando el real."""
+    now = types.SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(ollama_supervisor, "time", types.SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+@pytest.fixture
+def servers():
+    started = []
+    yield started
+    for server in started:
+        server.stop()
+
+
+def wait_for(condition, timeout: float = 2) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def supervisor_for(url: str, **options) -> OllamaSupervisor:
+    options.setdefault("probe_timeout", 0.5)
+    return OllamaSupervisor(base_url=url, model=MODEL, **options)
+
+
+def test_ready_when_model_loaded(servers):
+    server = FakeOllamaServer(MODEL).start()
+    servers.append(server)
+    supervisor = supervisor_for(server.url)
+    assert supervisor.state == STATE_STARTING
+
+    supervisor.check()
+    assert supervisor.is_ready()
+    assert supervisor.wait_ready(timeout=0)
+    assert server.warmups == []
+    assert supervisor.available == {MODEL}
+
+
+def test_warms_up_installed_model_not_loaded(servers):
+    server = FakeOllamaServer(MODEL, loaded=[]).start()
+    servers.append(server)
+    supervisor = supervisor_for(server.url)
+
+    supervisor.check()
+    assert supervisor.state == STATE_READY
+    assert server.warmups == [MODEL]
+    # Ya cargado: el siguiente sondeo no vuelve a precargar
+    supervisor.check()
+    assert server.warmups == [MODEL]
+
+
+def test_model_missing_is_degraded(servers):
+    server = FakeOllamaServer(MODEL, installed=["otro:latest"]).start()
+    servers.append(server)
+    supervisor = supervisor_for(server.url)
+
+    supervisor.check()
+    assert supervisor.state == STATE_DEGRADED
+    assert MODEL in supervisor.detail
+    assert server.warmups == []
+
+    # Instalado después: el siguiente sondeo lo precarga y queda listo
+    server.installed.add(MODEL)
+    server.loaded.clear()
+    supervisor.check()
+    assert supervisor.state == STATE_READY
+    assert server.warmups == [MODEL]
+
+
+def test_missing_extra_model_does_not_degrade(servers):
+    server = FakeOllamaServer(MODEL, installed=[MODEL, "rapido:1b"], loaded=[MODEL]).start()
+    servers.append(server)
+    supervisor = supervisor_for(server.url, extra_models=("rapido:1b", "no-instalado:1b"))
+
+    supervisor.check()
+    assert supervisor.is_ready()
+    assert wait_for(lambda: server.warmups == ["rapido:1b"])
+
+
+def test_slow_extra_warm_up_does_not_block_probes(servers):
+    server = FakeOllamaServer(MODEL, installed=[MODEL, "rapido:1b"], loaded=[MODEL],
+                              warmup_delay=2).start()
+    servers.append(server)
+    supervisor = supervisor_for(server.url, extra_models=("rapido:1b",))
+
+    started = time.monotonic()
+    supervisor.check()
+    assert supervisor.is_ready()
+    # Mientras se carga el modelo extra los sondeos siguen y no lo relanzan
+    supervisor.check()
+    assert time.monotonic() - started < 1
+    assert wait_for(lambda: "rapido:1b" in server.warmups, timeout=5)
+    assert server.warmups.count("rapido:1b") == 1
+
+
+def test_down_restarts_with_exponential_backoff_and_recovers(clock, servers):
+    port = free_port()
+    restarts = []
+
+    def restart():
+        restarts.append(clock.value)
+        if len(restarts) == 3:
+            # El tercer reinicio levanta por fin el servidor
+            servers.append(FakeOllamaServer(MODEL, loaded=[], port=port).start())
+
+    supervisor = supervisor_for(f"http://127.0.0.1:{port}", restart=restart,
+                                failures_before_restart=2, backoff_base=10, backoff_max=25)
+
+    supervisor.check()
+    assert supervisor.state == STATE_DEGRADED  # un fallo aislado aún no reinicia
+    assert restarts == []
+
+    supervisor.check()
+    assert supervisor.state == STATE_DOWN
+    assert restarts == [1000.0]
+
+    # Dentro del backoff no se reintenta
+    clock.value += 9
+    supervisor.check()
+    assert len(restarts) == 1
+
+    clock.value += 1
+    supervisor.check()
+    assert restarts == [1000.0, 1010.0]  # esperó 10 s
+
+    clock.value += 19
+    supervisor.check()
+    assert len(restarts) == 2
+    clock.value += 1
+    supervisor.check()
+    assert restarts == [1000.0, 1010.0, 1030.0]  # esperó 20 s (doble)
+    assert supervisor.restarts == 3
+    assert not supervisor.wait_ready(timeout=0)
+
+    # Vuelve a responder: se precarga el modelo y los contadores del backoff se reinician
+    supervisor.check()
+    assert supervisor.is_ready()
+    assert servers[0].warmups == [MODEL]
+    assert supervisor._restart_attempts == 0
+    assert supervisor.status()["restarts"] == 3
+
+
+def test_backoff_is_capped(clock):
+    supervisor = supervisor_for(f"http://127.0.0.1:{free_port()}", restart=lambda: None,
+                                failures_before_restart=1, backoff_base=10, backoff_max=25)
+    delays = []
+    for _ in range(4):
+        supervisor.check()
+        delays.append(supervisor._next_restart - clock.value)
+        clock.value = supervisor._next_restart
+    assert delays == [10, 20, 25, 25]
+
+
+def test_report_failure_degrades_until_next_probe(servers):
+    server = FakeOllamaServer(MODEL).start()
+    servers.append(server)
+    supervisor = supervisor_for(server.url)
+    supervisor.check()
+
+    supervisor.report_failure("timeout")
+    assert supervisor.state == STATE_DEGRADED
+    assert supervisor._wakeup.is_set()
+    supervisor.check()
+    assert supervisor.is_ready()
+
+
+def test_background_thread_reaches_ready(servers):
+    server = FakeOllamaServer(MODEL, loaded=[]).start()
+    servers.append(server)
+    supervisor = supervisor_for(server.url, probe_interval=0.05)
+    supervisor.start()
+    try:
+        assert supervisor.wait_ready(timeout=5)
+    finally:
+        supervisor.stop()
+    assert server.warmups == [MODEL]
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+from prefetch import PREFETCH_HIT, PREFETCH_MISS, PREFETCH_NEAR, RetrievalPrefetcher
+
+
+class StubEmbeddings:
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def embed_query(self, text):
+        self.started.set()
+        self.release.wait(5)
+        return [float(len(text))]
+
+
+class StubKnowledge:
+    def __init__(self):
+        self.embeddings = StubEmbeddings()
+        self.version = "v1"
+        self.queries = []
+
+    def knowledge_version(self):
+        return self.version
+
+    def query(self, text, k, vector, record_hits=True, **filters):
+        self.queries.append((text, filters))
+        return [f"fragmento de {text}"]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "la condición no se cumplió a tiempo"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def km():
+    return StubKnowledge()
+
+
+@pytest.fixture
+def prefetcher(km):
+    return RetrievalPrefetcher(lambda: km)
+
+
+def test_same_question_and_filters_reuse_prefetch(km, prefetcher):
+    prefetcher.schedule("¿Dónde vive mi hermana?", {"topics": ["familia"]})
+    # take espera a la precarga en curso en lugar de repetirla
+    result, prefetched = prefetcher.take("dónde vive mi hermana", {"topics": ["familia"]}, "v1")
+    assert result == PREFETCH_HIT
+    assert prefetched.docs == ["fragmento de ¿Dónde vive mi hermana?"]
+    assert km.queries == [("¿Dónde vive mi hermana?", {"topics": ["familia"]})]
+
+    # Lo usado se consume
+    assert prefetcher.take("dónde vive mi hermana", {"topics": ["familia"]}, "v1") == (PREFETCH_MISS, None)
+    assert prefetcher.stats()["hit_rate"] == 0.5
+
+
+@pytest.mark.parametrize("text, filters, version, expected", [
+    ("¿Dónde vive mi hermana?", {}, "v1", PREFETCH_HIT),
+    ("¿Donde vive mi hermana?", {}, "v1", PREFETCH_NEAR),
+    ("¿Qué deporte practico los martes?", {}, "v1", PREFETCH_MISS),
+    ("¿Dónde vive mi hermana?", {"topics": ["familia"]}, "v1", PREFETCH_MISS),
+    ("¿Dónde vive mi hermana?", {}, "v2", PREFETCH_MISS),
+])
+def test_take_matches_text_filters_and_version(prefetcher, text, filters, version, expected):
+    prefetcher.schedule("¿Dónde vive mi hermana?")
+    wait_for(lambda: prefetcher.counters["completed"] == 1)
+    result, prefetched = prefetcher.take(text, filters, version)
+    assert result == expected
+    assert (prefetched is None) == (expected == PREFETCH_MISS)
+
+
+def test_cancel_discards_prefetch_in_progress(km, prefetcher):
+    km.embeddings.release.clear()
+    prefetcher.schedule("¿Dónde vive mi hermana?")
+    assert km.embeddings.started.wait(5)
+    prefetcher.cancel()
+    km.embeddings.release.set()
+    wait_for(lambda: prefetcher.counters["stale"] == 1)
+
+    assert prefetcher.take("¿Dónde vive mi hermana?", {}, "v1") == (PREFETCH_MISS, None)
+    assert prefetcher.counters["completed"] == 0
+    assert km.queries == []
+
+
+def test_short_text_is_not_prefetched(km, prefetcher):
+    prefetcher.schedule("¿hola?")
+    assert prefetcher.counters["scheduled"] == 0
+    assert prefetcher.take("¿hola?", {}, "v1") == (PREFETCH_MISS, None)
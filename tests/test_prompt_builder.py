@@ -0,0 +1,61 @@
+from langchain_core.documents import Document
+
+from prompt_builder import NO_CONTEXT, PromptBuilder
+
+
+def count_words(text):
+    """Un token por palabra: así el presupuesto de cada prueba se calcula a mano."""
+    return len(text.split())
+
+
+def chunk(path, index, text):
+    return Document(page_content=text, id=f"{path}::abc::{index}")
+
+
+def test_contiguous_chunks_are_merged_and_duplicates_dropped():
+    builder = PromptBuilder(count_tokens=count_words, preamble="Sistema.\n")
+    fragments = [
+        chunk("notas.txt", 1, "del parque del Retiro los domingos."),
+        Document(page_content="Juego al pádel los martes."),
+        chunk("notas.txt", 0, "Vivo en Madrid cerca del parque"),
+        Document(page_content="Juego al pádel los martes."),
+    ]
+    # El bloque ocupa el puesto de su fragmento más relevante y el solapamiento se quita
+    assert builder.merge(fragments) == [
+        "Vivo en Madrid cerca del parque del Retiro los domingos.",
+        "Juego al pádel los martes.",
+    ]
+
+    prompt = builder.build("¿Dónde vivo?", fragments)
+    assert prompt == ("Sistema.\nContexto:\n"
+                      "Vivo en Madrid cerca del parque del Retiro los domingos.\n"
+                      "Juego al pádel los martes.\n"
+                      "Pregunta de Victor: ¿Dónde vivo?\n")
+    assert builder.last_stats["fragments"] == 4
+    assert builder.last_stats["blocks"] == 2
+    assert builder.last_stats["selected"] == 2
+
+
+def test_context_is_trimmed_to_budget_in_relevance_order():
+    builder = PromptBuilder(count_tokens=count_words, preamble="Sistema.\n", context_budget=8)
+    fragments = [
+        Document(page_content="uno dos tres cuatro"),  # 5 tokens con el salto de línea
+        Document(page_content="cinco seis siete ocho nueve diez"),  # 7: ya no cabe
+        Document(page_content="once doce"),  # 3: cabe en lo que queda
+    ]
+    prompt = builder.build("pregunta", fragments)
+    assert "Contexto:\nuno dos tres cuatro\nonce doce\nPregunta de Victor: pregunta\n" in prompt
+    assert "cinco" not in prompt
+    assert builder.last_stats["selected"] == 2
+    assert builder.last_stats["context_tokens"] == 8
+
+
+def test_num_ctx_limits_context_and_falls_back_to_no_context():
+    builder = PromptBuilder(count_tokens=count_words, preamble="Sistema.\n", context_budget=1000)
+    fragments = [Document(page_content="uno dos tres cuatro")]
+    # Fijo: preámbulo (1) + pregunta (6) + "Contexto:" (1); 16 - 4 - 8 = 4 tokens, y el fragmento pide 5
+    prompt = builder.build("¿Qué hago hoy?", fragments, num_ctx=16, num_predict=4)
+    assert builder.last_stats["budget"] == 4
+    assert f"Contexto:\n{NO_CONTEXT}\n" in prompt
+    assert prompt.startswith("Sistema.\n")
+    assert prompt.endswith("Pregunta de Victor: ¿Qué hago hoy?\n")
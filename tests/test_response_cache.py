@@ -0,0 +1,75 @@
+import pytest
+
+import response_cache
+from benchmark import FakeEmbeddings
+from knowledge import KnowledgeManager
+from response_cache import SemanticResponseCache
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache.time, "time", clock)
+    return clock
+
+
+@pytest.mark.parametrize("vector, expected", [
+    ([1.0, 0.0, 0.0], "En Madrid"),  # la misma pregunta
+    ([2.0, 0.3, 0.0], "En Madrid"),  # similitud ~0.99, por encima del umbral
+    ([1.0, 0.6, 0.0], None),  # similitud ~0.86, por debajo
+    ([0.0, 0.0, 1.0], None),
+])
+def test_lookup_honours_similarity_threshold(clock, vector, expected):
+    cache = SemanticResponseCache(threshold=0.92)
+    cache.store("¿Dónde vivo?", [1.0, 0.0, 0.0], "En Madrid", "v1")
+    assert cache.lookup(vector, "v1") == expected
+    assert cache.stats()["hits" if expected else "misses"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = SemanticResponseCache(ttl=60)
+    cache.store("¿Dónde vivo?", [1.0, 0.0], "En Madrid", "v1")
+    clock.now += 60
+    assert cache.lookup([1.0, 0.0], "v1") == "En Madrid"
+    clock.now += 1
+    assert cache.lookup([1.0, 0.0], "v1") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_expired_entries_are_not_loaded_from_disk(clock, tmp_path):
+    path = str(tmp_path / "response_cache.json")
+    SemanticResponseCache(ttl=60, persist_path=path).store("¿Dónde vivo?", [1.0, 0.0], "En Madrid", "v1")
+    assert SemanticResponseCache(ttl=60, persist_path=path).lookup([1.0, 0.0], "v1") == "En Madrid"
+    clock.now += 61
+    assert SemanticResponseCache(ttl=60, persist_path=path).stats()["entries"] == 0
+
+
+def test_knowledge_reload_invalidates_cached_answers(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "perfil.txt").write_text("Vivo en Madrid.", encoding="utf-8")
+    km = KnowledgeManager(docs_path=str(docs), vectorstore_path=str(tmp_path / "store"),
+                          embeddings=FakeEmbeddings(dim=16))
+    try:
+        cache = SemanticResponseCache()
+        vector = km.embeddings.embed_query("¿Dónde vivo?")
+        cache.store("¿Dónde vivo?", vector, "En Madrid", km.knowledge_version())
+        assert cache.lookup(vector, km.knowledge_version()) == "En Madrid"
+
+        # Recargar sin cambios no invalida nada
+        km.reload_knowledge()
+        assert cache.lookup(vector, km.knowledge_version()) == "En Madrid"
+
+        (docs / "perfil.txt").write_text("Vivo en Valencia desde este año.", encoding="utf-8")
+        km.reload_knowledge()
+        assert cache.lookup(vector, km.knowledge_version()) is None
+    finally:
+        km.close()
@@ -0,0 +1,94 @@
+import json
+import http.client
+import threading
+
+import pytest
+
+from server import JarvisServer
+
+
+class StubKnowledge:
+    def __init__(self):
+        self.injected = []
+
+    def injected_sources(self):
+        return {}
+
+    def source_id_for(self, path):
+        return "src-test"
+
+    def inject_source(self, path, description=""):
+        self.injected.append(path)
+
+
+def serve(token=None):
+    km = StubKnowledge()
+    server = JarvisServer(("127.0.0.1", 0), engine=None, knowledge_provider=lambda: km, token=token)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, km
+
+
+@pytest.fixture
+def running():
+    started = []
+
+    def start(token=None):
+        server, km = serve(token)
+        started.append(server)
+        return server.server_address[1], km
+
+    yield start
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+def request(port, method, path, body=b"", headers=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    conn.request(method, path, body=body, headers=headers or {})
+    response = conn.getresponse()
+    payload = json.loads(response.read() or b"{}")
+    conn.close()
+    return response.status, payload
+
+
+def test_admin_disabled_without_token(running, tmp_path):
+    port, km = running()
+    target = tmp_path / "secreto.txt"
+    target.write_text("x", encoding="utf-8")
+    body = json.dumps({"path": str(target)})
+    status, payload = request(port, "POST", "/admin/inject", body,
+                              {"Content-Type": "application/json"})
+    assert status == 403
+    assert request(port, "GET", "/admin/sources")[0] == 403
+    assert km.injected == []
+
+
+def test_cross_site_text_plain_post_rejected(running, tmp_path):
+    port, km = running(token="t")
+    target = tmp_path / "secreto.txt"
+    target.write_text("x", encoding="utf-8")
+    body = json.dumps({"path": str(target)})
+    auth = {"Authorization": "Bearer t"}
+    # Un formulario o fetch sin preflight solo puede mandar text/plain
+    status, _ = request(port, "POST", "/admin/inject", body, dict(auth, **{"Content-Type": "text/plain"}))
+    assert status == 415
+    status, _ = request(port, "POST", "/ask", json.dumps({"question": "hola"}),
+                        dict(auth, **{"Content-Type": "text/plain"}))
+    assert status == 415
+    assert km.injected == []
+
+
+def test_admin_requires_valid_token(running, tmp_path):
+    port, km = running(token="t")
+    target = tmp_path / "nota.txt"
+    target.write_text("x", encoding="utf-8")
+    body = json.dumps({"path": str(target)})
+    json_type = {"Content-Type": "application/json; charset=utf-8"}
+    assert request(port, "POST", "/admin/inject", body, json_type)[0] == 401
+    assert request(port, "POST", "/admin/inject", body, dict(json_type, Authorization="Bearer x"))[0] == 401
+
+    status, payload = request(port, "POST", "/admin/inject", body,
+                              dict(json_type, Authorization="Bearer t"))
+    assert status == 202
+    assert payload["source_id"] == "src-test"
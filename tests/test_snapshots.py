@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from benchmark import FakeEmbeddings
+from knowledge import KnowledgeManager
+
+NOTE = "Mi canción favorita es Bohemian Rhapsody de Queen.\n\nLa escucho cada mañana."
+
+
+def open_manager(tmp_path) -> KnowledgeManager:
+    return KnowledgeManager(docs_path=str(tmp_path / "docs"),
+                            vectorstore_path=str(tmp_path / "store"),
+                            embeddings=FakeEmbeddings(dim=32))
+
+
+@pytest.fixture
+def docs(tmp_path):
+    folder = tmp_path / "docs" / "musica"
+    folder.mkdir(parents=True)
+    (folder / "notas.txt").write_text(NOTE, encoding="utf-8")
+    return folder
+
+
+def test_edit_after_restart_and_checkpoint(tmp_path, docs):
+    """Una partición cargada del snapshot anterior sigue siendo escribible tras el siguiente."""
+    open_manager(tmp_path).close()
+
+    km = open_manager(tmp_path)
+    loaded = km.vectorstore.shards["manual/musica"]
+    km.add_interaction_to_history("¿Qué tiempo hace?", "Soleado.")
+    km.checkpoint()
+    # La partición de música no cambió y sigue siendo la cargada al arrancar
+    assert km.vectorstore.shards["manual/musica"] is loaded
+
+    with open(docs / "notas.txt", "a", encoding="utf-8") as f:
+        f.write("\n\nTambién me gusta Imagine de John Lennon.")
+    km.sync_sources()
+
+    entry = km._manifest[os.path.join("musica", "notas.txt")]
+    assert entry["size"] == os.path.getsize(docs / "notas.txt")
+    assert all(doc_id in km.vectorstore for doc_id in entry["ids"])
+
+    # Lo que ya no referencia ninguna partición se borra en el siguiente snapshot
+    km.checkpoint()
+    km.close()
+    snapshots = [e for e in os.listdir(tmp_path / "store") if e.startswith("snapshot-")]
+    assert len(snapshots) == 1
+
+
+def test_inject_after_restart_and_checkpoint(tmp_path, docs):
+    open_manager(tmp_path).close()
+
+    km = open_manager(tmp_path)
+    km.add_interaction_to_history("¿Qué tiempo hace?", "Soleado.")
+    km.checkpoint()
+
+    source = tmp_path / "fuente.txt"
+    source.write_text(NOTE, encoding="utf-8")
+    source_id = km.inject_source(str(source))
+    assert km.injected_sources()[source_id]["complete"]
+    km.close()
+
+
+def test_replay_without_snapshot(tmp_path, docs, monkeypatch):
+    """Una caída antes del primer snapshot se recupera del WAL sin reindexar."""
+    monkeypatch.setattr(KnowledgeManager, "checkpoint", lambda self: None)
+    km = open_manager(tmp_path)
+    source = tmp_path / "fuente.txt"
+    source.write_text(NOTE, encoding="utf-8")
+    source_id = km.inject_source(str(source))
+    km._checkpointer.stop()
+    monkeypatch.undo()
+    assert not os.path.exists(tmp_path / "store" / "CURRENT")
+
+    # Si se reindexara, la fuente se volvería a inyectar desde su archivo: se borra para notarlo
+    source.unlink()
+    km = open_manager(tmp_path)
+    assert source_id in km.injected_sources()
+    assert all(doc_id in km.vectorstore
+               for doc_id in km._source_ids(source_id, km.injected_sources()[source_id]))
+    km.close()
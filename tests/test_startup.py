@@ -0,0 +1,49 @@
+import pytest
+
+from startup import Bootstrap, StartupProfiler
+
+
+def test_failed_component_is_retried_on_next_wait():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("Ollama aún no está arrancado")
+        return "listo"
+
+    bootstrap = Bootstrap(StartupProfiler())
+    bootstrap.add("model", flaky, "Preparando modelo")
+    bootstrap.start()
+    # La primera espera ve el fallo y lo reintenta en el momento
+    assert bootstrap.wait("model", timeout=5) == "listo"
+    assert len(attempts) == 2
+    assert bootstrap.wait("model", timeout=5) == "listo"
+    assert len(attempts) == 2
+
+
+def test_persistent_failure_is_raised_and_retried_again():
+    attempts = []
+
+    def broken():
+        attempts.append(1)
+        raise ConnectionError(f"intento {len(attempts)}")
+
+    bootstrap = Bootstrap(StartupProfiler())
+    bootstrap.add("knowledge", broken, "Cargando")
+    with pytest.raises(ConnectionError, match="intento 2"):
+        bootstrap.wait("knowledge", timeout=5)
+    with pytest.raises(ConnectionError, match="intento 3"):
+        bootstrap.wait("knowledge", timeout=5)
+    assert len(attempts) == 3  # un reintento por espera
+    assert bootstrap.is_ready("knowledge")
+
+
+def test_on_complete_runs_once():
+    calls = []
+    bootstrap = Bootstrap(StartupProfiler())
+    bootstrap.add("a", lambda: 1 / 0, "A")
+    bootstrap.on_complete(lambda: calls.append(1))
+    with pytest.raises(ZeroDivisionError):
+        bootstrap.wait("a", timeout=5)
+    assert calls == [1]
@@ -0,0 +1,32 @@
+from benchmark import FakeEmbeddings
+from knowledge import KnowledgeManager
+
+# Cada párrafo ocupa casi un fragmento entero (200 caracteres)
+PROFILE = ("Me llamo Víctor, vivo en Madrid con mi familia y los domingos comemos todos juntos "
+           "en casa de mis padres, que viven cerca del parque del Retiro desde hace años.\n\n"
+           "Juego al pádel los martes y los jueves, y sigo la liga de fútbol con mi equipo de "
+           "siempre; este año quiero correr mi primera maratón con los amigos del club.\n\n"
+           "Trabajo con Python en un servidor Linux y programo una aplicación de IA que ayuda "
+           "a organizar notas; también reviso el código de otros compañeros por las tardes.")
+
+
+def test_manual_file_is_tagged_per_chunk(tmp_path):
+    docs = tmp_path / "docs"
+    (docs / "viajes").mkdir(parents=True)
+    (docs / "perfil.txt").write_text(PROFILE, encoding="utf-8")
+    # La carpeta manda sobre las palabras clave
+    (docs / "viajes" / "notas.txt").write_text("Partido de fútbol en el hotel de Roma.", encoding="utf-8")
+    km = KnowledgeManager(docs_path=str(docs), vectorstore_path=str(tmp_path / "store"),
+                          embeddings=FakeEmbeddings(dim=16))
+    try:
+        sizes = km.vectorstore.sizes()
+        assert sizes["manual/general"] == 1
+        assert sizes["manual/deportes"] == 1
+        assert sizes["manual/tecnologia"] == 1
+        assert sizes["manual/viajes"] == 1
+
+        docs_found = km.query("¿A qué juego los martes?", k=4, topics=["deportes"])
+        assert [doc.metadata["topic"] for doc in docs_found] == ["deportes"]
+        assert "pádel" in docs_found[0].page_content
+    finally:
+        km.close()
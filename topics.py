@@ -0,0 +1,67 @@
+import os
+import unicodedata
+from typing import Dict, List, Optional
+
+TOPIC_GENERAL = "general"
+
+# Temas de los botones de la interfaz y palabras que los delatan en un texto
+TOPICS: Dict[str, dict] = {
+    "musica": {
+        "label": "🎵 Música",
+        "keywords": ["musica", "cancion", "canciones", "album", "disco", "grupo", "banda",
+                     "concierto", "cantante", "guitarra", "piano", "spotify", "playlist", "rock",
+                     "pop", "jazz", "rap", "letra", "melodia"],
+    },
+    "peliculas": {
+        "label": "🎬 Películas",
+        "keywords": ["pelicula", "peliculas", "cine", "serie", "series", "actor", "actriz",
+                     "director", "netflix", "estreno", "temporada", "capitulo", "trilogia",
+                     "documental", "oscar", "hbo", "disney"],
+    },
+    "tecnologia": {
+        "label": "💻 Tecnología",
+        "keywords": ["tecnologia", "ordenador", "computadora", "portatil", "movil", "telefono",
+                     "software", "programa", "programacion", "python", "codigo", "internet",
+                     "wifi", "aplicacion", "app", "windows", "linux", "inteligencia",
+                     "artificial", "ia", "gpu", "cpu", "servidor"],
+    },
+    "viajes": {
+        "label": "✈️ Viajes",
+        "keywords": ["viaje", "viajes", "viajar", "vuelo", "avion", "hotel", "vacaciones",
+                     "playa", "montana", "pais", "ciudad", "maleta", "pasaporte", "turismo",
+                     "reserva", "aeropuerto", "excursion", "ruta"],
+    },
+    "deportes": {
+        "label": "⚽ Deportes",
+        "keywords": ["deporte", "deportes", "futbol", "baloncesto", "tenis", "partido", "liga",
+                     "equipo", "gol", "entrenamiento", "gimnasio", "correr", "bicicleta",
+                     "natacion", "padel", "maraton", "champions", "mundial"],
+    },
+}
+
+
+def _normalize(text: str) -> str:
+    """Minúsculas y sin tildes, para comparar 'Música' con 'musica'."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+_KEYWORDS = {topic: set(info["keywords"]) for topic, info in TOPICS.items()}
+
+
+def classify_topic(text: str, rel_path: Optional[str] = None) -> str:
+    """Tema de un texto: el de su carpeta si coincide con uno conocido, o el de más palabras clave."""
+    if rel_path:
+        for folder in os.path.normpath(rel_path).split(os.sep)[:-1]:
+            folder = _normalize(folder)
+            if folder in TOPICS:
+                return folder
+    words = [w.strip(".,;:!?¡¿()\"'") for w in _normalize(text).split()]
+    scores = {topic: sum(1 for w in words if w in keywords) for topic, keywords in _KEYWORDS.items()}
+    best = max(scores, key=scores.get)
+    return best if scores[best] else TOPIC_GENERAL
+
+
+def topic_labels() -> List[tuple]:
+    """(clave, etiqueta) de cada tema, en el orden de los botones."""
+    return [(topic, info["label"]) for topic, info in TOPICS.items()]
@@ -0,0 +1,267 @@
+import math
+import bisect
+import tkinter as tk
+import tkinter.font as tkfont
+from typing import Dict, List, Optional
+
+import customtkinter as ctk
+
+SIDE_MARGIN = 20  # separación de las burbujas respecto a los bordes
+MESSAGE_SPACING = 10  # espacio vertical entre burbujas
+BUBBLE_PADX = 15
+BUBBLE_PADY = 10
+MAX_WRAP = 800  # ancho máximo del texto de una burbuja
+OVERSCAN = 600  # píxeles por encima y por debajo de la vista que se materializan
+RESIZE_DEBOUNCE_MS = 120  # espera tras el último cambio de tamaño antes de reajustar
+SCROLL_STEP = 20  # píxeles por unidad de la rueda del ratón
+
+ASSISTANT_COLOR = "#404040"
+USER_COLOR = "#00A3FF"
+
+
+class Message:
+    __slots__ = ("sender", "text", "height", "measured")
+
+    def __init__(self, sender: str, text: str):
+        self.sender = sender
+        self.text = text
+        self.height = 0  # altura en la vista, estimada o medida
+        self.measured = False
+
+
+class TranscriptModel:
+    """Historial completo de la conversación como texto plano, sin widgets."""
+
+    def __init__(self):
+        self.messages: List[Message] = []
+
+    def append(self, sender: str, text: str) -> int:
+        self.messages.append(Message(sender, text))
+        return len(self.messages) - 1
+
+    def set_text(self, index: int, text: str):
+        self.messages[index].text = text
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+
+class _Bubble:
+    """Burbuja reutilizable: se mueve y cambia de texto en lugar de crear widgets nuevos."""
+
+    def __init__(self, canvas: tk.Canvas, font):
+        self.frame = ctk.CTkFrame(canvas, fg_color=ASSISTANT_COLOR, corner_radius=12)
+        self.label = ctk.CTkLabel(self.frame, text="", justify="left", font=font,
+                                  text_color="#FFFFFF")
+        self.label.pack(padx=BUBBLE_PADX, pady=BUBBLE_PADY)
+        self.item = canvas.create_window(0, 0, window=self.frame, anchor="nw", state="hidden")
+        self.index: Optional[int] = None
+        self.sender: Optional[str] = None
+        self.text: Optional[str] = None
+        self.wrap: Optional[int] = None
+
+
+class TranscriptView(ctk.CTkFrame):
+    """Vista de la conversación que solo crea widgets para las burbujas visibles.
+
+    El modelo guarda todos los mensajes; las burbujas se toman de un pool y se
+    colocan en un canvas según la altura de cada mensaje, estimada con la
+    fuente y corregida al medirla. Solo debe usarse desde el hilo de Tk.
+    """
+
+    def __init__(self, master, font=("Segoe UI", 14), bg_color: str = "#2D2D2D", **kwargs):
+        super().__init__(master, fg_color="transparent", **kwargs)
+        self.model = TranscriptModel()
+        self.font = font
+        self._metrics_font = tkfont.Font(family=font[0], size=font[1])
+        self._line_height = self._metrics_font.metrics("linespace")
+
+        self.canvas = tk.Canvas(self, bg=bg_color, highlightthickness=0, bd=0,
+                                yscrollincrement=SCROLL_STEP)
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self._width = 1
+        self._wrap = MAX_WRAP
+        self._offsets: List[int] = [0]  # y de cada mensaje; el último es la altura total
+        self._dirty_from = 0  # primer mensaje cuya posición hay que recalcular
+        self._visible: Dict[int, _Bubble] = {}
+        self._pool: List[_Bubble] = []
+        self._stick_to_bottom = True
+        self._render_job = None
+        self._measure_job = None
+        self._resize_job = None
+
+        # Un único manejador de tamaño, con espera, para toda la conversación
+        self.canvas.bind("<Configure>", self._on_configure)
+        self._bind_wheel(self.canvas)
+
+    # ---- API ----
+
+    def append(self, text: str, sender: str) -> int:
+        """Añade un mensaje y devuelve su índice para actualizarlo después."""
+        self._stick_to_bottom = self._stick_to_bottom or self._at_bottom()
+        index = self.model.append(sender, text)
+        self.model.messages[index].height = self._estimate(text)
+        self._dirty_from = min(self._dirty_from, index)
+        self._schedule_render()
+        return index
+
+    def set_text(self, index: int, text: str):
+        """Cambia el texto de un mensaje (p. ej. la respuesta que llega por streaming)."""
+        message = self.model.messages[index]
+        if message.text == text:
+            return
+        self._stick_to_bottom = self._stick_to_bottom or self._at_bottom()
+        self.model.set_text(index, text)
+        self._set_height(index, self._estimate(text), measured=False)
+        self._schedule_render()
+
+    # ---- disposición ----
+
+    def _estimate(self, text: str) -> int:
+        """Altura aproximada con la fuente; se corrige al medir la burbuja real."""
+        lines = 0
+        for paragraph in text.split("\n"):
+            width = self._metrics_font.measure(paragraph) if paragraph else 0
+            # El corte por palabras deja las líneas algo más cortas que el ancho disponible
+            lines += max(1, math.ceil(width * 1.1 / max(1, self._wrap)))
+        return lines * self._line_height + 2 * BUBBLE_PADY + MESSAGE_SPACING
+
+    def _set_height(self, index: int, height: int, measured: bool):
+        message = self.model.messages[index]
+        message.measured = measured
+        if message.height != height:
+            message.height = height
+            self._dirty_from = min(self._dirty_from, index)
+
+    def _relayout(self):
+        messages = self.model.messages
+        if self._dirty_from >= len(messages):
+            return
+        del self._offsets[self._dirty_from + 1:]
+        for message in messages[self._dirty_from:]:
+            self._offsets.append(self._offsets[-1] + message.height)
+        self._dirty_from = len(messages)
+
+    def _at_bottom(self) -> bool:
+        return self.canvas.yview()[1] >= 0.999
+
+    # ---- dibujo ----
+
+    def _schedule_render(self):
+        if self._render_job is None:
+            self._render_job = self.after_idle(self._render)
+
+    def _render(self):
+        self._render_job = None
+        self._relayout()
+        height = max(self._offsets[-1], self.canvas.winfo_height())
+        self.canvas.configure(scrollregion=(0, 0, self._width, height))
+        if self._stick_to_bottom:
+            self.canvas.yview_moveto(1.0)
+            self._stick_to_bottom = False
+
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first = max(0, bisect.bisect_right(self._offsets, top - OVERSCAN) - 1)
+        last = min(len(self.model), bisect.bisect_left(self._offsets, bottom + OVERSCAN))
+        wanted = range(first, last)
+
+        for index in [i for i in self._visible if i not in wanted]:
+            self._release(self._visible.pop(index))
+        for index in wanted:
+            self._show(index)
+        if self._measure_job is None:
+            self._measure_job = self.after_idle(self._measure)
+
+    def _show(self, index: int):
+        message = self.model.messages[index]
+        bubble = self._visible.get(index)
+        if bubble is None:
+            bubble = self._pool.pop() if self._pool else self._new_bubble()
+            bubble.index = index
+            self._visible[index] = bubble
+        if bubble.sender != message.sender:
+            bubble.sender = message.sender
+            bubble.frame.configure(fg_color=ASSISTANT_COLOR if message.sender == "assistant" else USER_COLOR)
+        if bubble.text != message.text or bubble.wrap != self._wrap:
+            bubble.text, bubble.wrap = message.text, self._wrap
+            bubble.label.configure(text=message.text, wraplength=self._wrap)
+            message.measured = False
+        if message.sender == "assistant":
+            x, anchor = SIDE_MARGIN, "nw"
+        else:
+            x, anchor = self._width - SIDE_MARGIN, "ne"
+        self.canvas.coords(bubble.item, x, self._offsets[index])
+        self.canvas.itemconfigure(bubble.item, anchor=anchor, state="normal")
+
+    def _new_bubble(self) -> _Bubble:
+        bubble = _Bubble(self.canvas, self.font)
+        for widget in (bubble.frame, bubble.label):
+            self._bind_wheel(widget)
+        return bubble
+
+    def _release(self, bubble: _Bubble):
+        self.canvas.itemconfigure(bubble.item, state="hidden")
+        bubble.index = None
+        self._pool.append(bubble)
+
+    def _measure(self):
+        """Sustituye la altura estimada por la real de las burbujas visibles."""
+        self._measure_job = None
+        # Las burbujas anidan varios gestores de geometría que se resuelven en tareas diferidas
+        self.update_idletasks()
+        changed = False
+        for index, bubble in self._visible.items():
+            message = self.model.messages[index]
+            if message.measured:
+                continue
+            height = bubble.frame.winfo_reqheight() + MESSAGE_SPACING
+            changed = changed or height != message.height
+            self._set_height(index, height, measured=True)
+        if changed:
+            self._stick_to_bottom = self._stick_to_bottom or self._at_bottom()
+            self._schedule_render()
+
+    # ---- eventos ----
+
+    def _on_configure(self, event):
+        if self._resize_job is not None:
+            self.after_cancel(self._resize_job)
+        self._resize_job = self.after(RESIZE_DEBOUNCE_MS, self._apply_resize, event.width)
+
+    def _apply_resize(self, width: int):
+        self._resize_job = None
+        wrap = min(int(width * 0.6), MAX_WRAP)
+        self._width = width
+        if wrap != self._wrap:
+            # Con otro ancho cambian todas las alturas: se reestiman y se miden las visibles
+            self._stick_to_bottom = self._stick_to_bottom or self._at_bottom()
+            self._wrap = wrap
+            for index, message in enumerate(self.model.messages):
+                self._set_height(index, self._estimate(message.text), measured=False)
+        self._schedule_render()
+
+    def _on_scrollbar(self, *args):
+        self.canvas.yview(*args)
+        self._schedule_render()
+
+    def _bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", self._on_wheel)  # Windows y macOS
+        widget.bind("<Button-4>", self._on_wheel)  # X11
+        widget.bind("<Button-5>", self._on_wheel)
+
+    def _on_wheel(self, event):
+        if getattr(event, "num", None) == 4:
+            units = -3
+        elif getattr(event, "num", None) == 5:
+            units = 3
+        else:
+            units = -int(event.delta / 120) * 3 if abs(event.delta) >= 120 else -int(event.delta)
+        self.canvas.yview_scroll(units, "units")
+        self._schedule_render()
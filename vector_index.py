@@ -0,0 +1,374 @@
+import os
+import math
+import time
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+# Tipos de índice disponibles
+INDEX_AUTO = "auto"
+INDEX_FLAT = "flat"
+INDEX_IVF = "ivf"
+INDEX_HNSW = "hnsw"
+INDEX_IVFPQ = "ivfpq"
+INDEX_TYPES = (INDEX_FLAT, INDEX_IVF, INDEX_HNSW, INDEX_IVFPQ)
+
+
+class IndexConfig:
+    """Qué índice FAISS construir y con qué parámetros.
+
+    Con index_type="auto" el índice es exacto (flat) hasta `upgrade_threshold`
+    fragmentos, IVF a partir de ahí e IVF-PQ desde `pq_threshold`.
+    """
+
+    def __init__(self, index_type: str = INDEX_AUTO, upgrade_threshold: int = 20_000,
+                 pq_threshold: int = 500_000, nlist: Optional[int] = None, nprobe: int = 8,
+                 hnsw_m: int = 32, ef_construction: int = 80, ef_search: int = 64,
+                 pq_m: int = 16, pq_bits: int = 8, retrain_growth: float = 4.0,
+                 max_tombstones: float = 0.2, mmap: bool = True):
+        if index_type != INDEX_AUTO and index_type not in INDEX_TYPES:
+            raise ValueError(f"Tipo de índice desconocido: {index_type}")
+        self.index_type = index_type
+        self.upgrade_threshold = upgrade_threshold
+        self.pq_threshold = pq_threshold
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.pq_m = pq_m
+        self.pq_bits = pq_bits
+        self.retrain_growth = retrain_growth  # reentrenar IVF al multiplicarse el corpus
+        self.max_tombstones = max_tombstones  # fracción de bajas HNSW antes de compactar
+        self.mmap = mmap
+
+    def target_type(self, count: int) -> str:
+        """Tipo de índice que corresponde a `count` fragmentos."""
+        if self.index_type == INDEX_AUTO:
+            if count >= self.pq_threshold:
+                kind = INDEX_IVFPQ
+            elif count >= self.upgrade_threshold:
+                kind = INDEX_IVF
+            else:
+                kind = INDEX_FLAT
+        else:
+            kind = self.index_type
+        # Los índices entrenados necesitan suficientes puntos para sus centroides
+        if kind == INDEX_IVF and count < 1:
+            return INDEX_FLAT
+        if kind == INDEX_IVFPQ and count < 2 ** self.pq_bits:
+            return INDEX_FLAT
+        return kind
+
+    def nlist_for(self, count: int) -> int:
+        if self.nlist:
+            return min(self.nlist, max(1, count))
+        # ~4·√n listas, con al menos 39 puntos de entrenamiento por lista
+        return max(1, min(int(4 * math.sqrt(count)), count // 39))
+
+    def pq_m_for(self, dim: int) -> int:
+        """Mayor número de subcuantizadores <= pq_m que divide la dimensión."""
+        m = min(self.pq_m, dim)
+        while dim % m:
+            m -= 1
+        return m
+
+    def build(self, kind: str, dim: int, count: int) -> faiss.Index:
+        """Índice vacío (sin entrenar si es IVF) con etiquetas int64 propias."""
+        if kind == INDEX_FLAT:
+            return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+        if kind == INDEX_HNSW:
+            hnsw = faiss.IndexHNSWFlat(dim, self.hnsw_m)
+            hnsw.hnsw.efConstruction = self.ef_construction
+            return faiss.IndexIDMap2(hnsw)
+        quantizer = faiss.IndexFlatL2(dim)
+        if kind == INDEX_IVF:
+            return faiss.IndexIVFFlat(quantizer, dim, self.nlist_for(count))
+        return faiss.IndexIVFPQ(quantizer, dim, self.nlist_for(count),
+                                self.pq_m_for(dim), self.pq_bits)
+
+
+class VectorIndex:
+    """Índice vectorial con etiquetas estables, altas, bajas y búsqueda parametrizable.
+
+    Sustituye al vectorstore FAISS de LangChain, que renumera las posiciones al
+    borrar y por eso solo funciona con IndexFlat. Aquí cada fragmento conserva
+    su etiqueta int64; HNSW, que no admite bajas, las marca como lápidas que se
+    filtran en la búsqueda hasta la siguiente compactación.
+
+    El texto y los metadatos viven en `docstore` (SQLiteDocstore) y solo se leen
+    para los resultados. En memoria queda el mapa id -> etiqueta, que únicamente
+    necesitan los escritores y se carga del snapshot la primera vez que se usa.
+    """
+
+    def __init__(self, config: IndexConfig, kind: str, index: faiss.Index, docstore=None,
+                 labels: Optional[Dict[str, int]] = None, next_label: int = 0,
+                 tombstones: Optional[set] = None, trained_on: int = 0,
+                 labels_path: Optional[str] = None, mmap_path: Optional[str] = None):
+        self.config = config
+        self.kind = kind
+        self.index = index
+        self.docstore = docstore
+        # id -> etiqueta; None hasta que alguien lo pida si viene de un snapshot
+        self._labels = {} if labels is None and labels_path is None else labels
+        self._labels_path = labels_path
+        self.next_label = next_label
+        self.tombstones = tombstones if tombstones is not None else set()
+        self.trained_on = trained_on  # fragmentos con los que se entrenó (IVF)
+        self.mmap_path = mmap_path  # index.faiss mapeado en solo lectura, si lo está
+
+    @classmethod
+    def create(cls, config: IndexConfig, dim: int, docstore=None, next_label: int = 0) -> "VectorIndex":
+        """Índice vacío; empieza siempre exacto porque no hay con qué entrenar."""
+        return cls(config, INDEX_FLAT, config.build(INDEX_FLAT, dim, 0), docstore,
+                   next_label=next_label)
+
+    @classmethod
+    def build(cls, config: IndexConfig, ids: List[str], texts: List[str],
+              metadatas: List[dict], vectors, kind: Optional[str] = None,
+              docstore=None, next_label: int = 0) -> "VectorIndex":
+        """Construye (y entrena si hace falta) un índice con todos los fragmentos dados."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+        kind = kind or config.target_type(len(ids))
+        index = config.build(kind, vectors.shape[1], len(ids))
+        store = cls(config, kind, index, docstore, next_label=next_label,
+                    trained_on=_train_index(index, vectors))
+        if ids:
+            store.add(ids, texts, metadatas, vectors)
+        return store
+
+    def rebuild(self, vectors, kind: Optional[str] = None) -> "VectorIndex":
+        """Mismo contenido y mismas etiquetas en un índice nuevo; el docstore no se toca.
+
+        `vectors` va en el orden de ids().
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(self), -1)
+        kind = kind or self.config.target_type(len(self))
+        index = self.config.build(kind, self.dim, len(self))
+        trained_on = _train_index(index, vectors)
+        labels = dict(self.labels)
+        if labels:
+            index.add_with_ids(vectors, np.fromiter(labels.values(), dtype=np.int64, count=len(labels)))
+        return VectorIndex(self.config, kind, index, self.docstore, labels,
+                           self.next_label, trained_on=trained_on)
+
+    @property
+    def labels(self) -> Dict[str, int]:
+        if self._labels is None:
+            with open(self._labels_path, "r", encoding="utf-8") as f:
+                self._labels = json.load(f)
+        return self._labels
+
+    @property
+    def dim(self) -> int:
+        return self.index.d
+
+    @property
+    def backing_dir(self) -> Optional[str]:
+        """Carpeta del snapshot de la que aún depende (índice mapeado o etiquetas sin leer)."""
+        if self.mmap_path:
+            return os.path.dirname(self.mmap_path)
+        if self._labels is None:
+            return os.path.dirname(self._labels_path)
+        return None
+
+    def __len__(self) -> int:
+        return self.index.ntotal - len(self.tombstones)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.labels
+
+    def ids(self) -> List[str]:
+        return list(self.labels)
+
+    def clone(self) -> "VectorIndex":
+        """Copia en memoria sobre la que puede escribir un escritor sin afectar a los lectores."""
+        if self.mmap_path:
+            # Las listas IVF mapeadas no se pueden clonar; se lee el archivo entero
+            index = faiss.read_index(self.mmap_path)
+        else:
+            index = faiss.clone_index(self.index)
+        return VectorIndex(self.config, self.kind, index, self.docstore,
+                           dict(self.labels), self.next_label, set(self.tombstones), self.trained_on)
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[dict], vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+        labels = np.arange(self.next_label, self.next_label + len(ids), dtype=np.int64)
+        # Primero las filas: una etiqueta en el índice siempre tiene su texto
+        if self.docstore is not None:
+            self.docstore.put(labels.tolist(), ids, texts, metadatas)
+        self.index.add_with_ids(vectors, labels)
+        self.next_label += len(ids)
+        for doc_id, label in zip(ids, labels.tolist()):
+            self.labels[doc_id] = label
+
+    def delete(self, ids: Iterable[str]):
+        labels = [label for label in (self.labels.pop(doc_id, None) for doc_id in ids)
+                  if label is not None]
+        if not labels:
+            return
+        # Las filas se quedan: un lector de una generación anterior aún puede pedirlas
+        if self.kind == INDEX_HNSW:
+            self.tombstones.update(labels)
+        else:
+            self.index.remove_ids(np.asarray(labels, dtype=np.int64))
+
+    def needs_rebuild(self) -> bool:
+        """Si el índice ya no es el adecuado para su tamaño o acumula demasiadas bajas."""
+        count = len(self)
+        if self.config.target_type(count) != self.kind:
+            return True
+        if self.trained_on and count > self.config.retrain_growth * self.trained_on:
+            return True
+        return bool(self.tombstones) and len(self.tombstones) > self.config.max_tombstones * self.index.ntotal
+
+    def reconstruct(self) -> Optional[np.ndarray]:
+        """Vectores exactos en el orden de ids(); None si el índice los comprime o no los guarda."""
+        if self.kind not in (INDEX_FLAT, INDEX_HNSW):
+            return None
+        labels = np.fromiter(self.labels.values(), dtype=np.int64, count=len(self.labels))
+        if not len(labels):
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return self.index.reconstruct_batch(labels)
+
+    def texts(self) -> List[str]:
+        """Texto de cada fragmento en el orden de ids()."""
+        docs = self.docstore.get_many(self.labels.values())
+        return [doc.page_content if doc is not None else "" for doc in docs]
+
+    def search_labels(self, vectors, k: int = 4, nprobe: Optional[int] = None,
+                      ef_search: Optional[int] = None,
+                      allowed: Optional[Iterable[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Búsqueda en bruto: (distancias, etiquetas) con -1 donde no hay resultado.
+
+        `allowed` limita la búsqueda a esas etiquetas (filtro por metadatos).
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        # Los selectores deben seguir vivos mientras dure la búsqueda
+        selectors = []
+        if self.tombstones:
+            batch = faiss.IDSelectorBatch(np.fromiter(self.tombstones, dtype=np.int64))
+            selectors += [batch, faiss.IDSelectorNot(batch)]
+        if allowed is not None:
+            allowed = np.fromiter(allowed, dtype=np.int64)
+            if not len(allowed):
+                return (np.full((len(vectors), k), np.inf, dtype=np.float32),
+                        np.full((len(vectors), k), -1, dtype=np.int64))
+            batch = faiss.IDSelectorBatch(allowed)
+            if selectors:
+                selectors += [batch, faiss.IDSelectorAnd(batch, selectors[-1])]
+            else:
+                selectors.append(batch)
+        selector = selectors[-1] if selectors else None
+        if self.kind in (INDEX_IVF, INDEX_IVFPQ):
+            params = faiss.SearchParametersIVF(nprobe=nprobe or self.config.nprobe)
+        elif self.kind == INDEX_HNSW:
+            params = faiss.SearchParametersHNSW(efSearch=max(k, ef_search or self.config.ef_search))
+        else:
+            params = faiss.SearchParameters() if selector is not None else None
+        if selector is not None:
+            params.sel = selector
+        return self.index.search(vectors, k, params=params)
+
+    def search(self, vector, k: int = 4, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None) -> List[Document]:
+        _, labels = self.search_labels(vector, k, nprobe, ef_search)
+        labels = [label for label in labels[0].tolist() if label != -1]
+        # Solo se leen del docstore las filas de los k resultados
+        return [doc for doc in self.docstore.get_many(labels) if doc is not None]
+
+    # ---- disco ----
+
+    def save(self, directory: str):
+        """Escribe index.faiss, index.json y labels.json en `directory` (debe existir)."""
+        faiss.write_index(self.index, os.path.join(directory, "index.faiss"))
+        meta = {
+            "kind": self.kind,
+            "next_label": self.next_label,
+            "tombstones": sorted(self.tombstones),
+            "trained_on": self.trained_on,
+        }
+        for name, data in (("index.json", meta), ("labels.json", self.labels)):
+            with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+                os.fsync(f.fileno())
+
+    @classmethod
+    def load(cls, directory: str, config: IndexConfig, docstore) -> "VectorIndex":
+        """Carga un snapshot sin leer textos; con config.mmap el índice se mapea en memoria."""
+        meta_path = os.path.join(directory, "index.json")
+        index_path = os.path.join(directory, "index.faiss")
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if config.mmap:
+            index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        else:
+            index = faiss.read_index(index_path)
+        return cls(config, meta["kind"], index, docstore, None, meta["next_label"],
+                   set(meta["tombstones"]), meta["trained_on"],
+                   labels_path=os.path.join(directory, "labels.json"),
+                   mmap_path=index_path if config.mmap else None)
+
+
+def _train_index(index: faiss.Index, vectors: np.ndarray) -> int:
+    """Entrena el índice si lo necesita; devuelve con cuántos vectores (0 si no hizo falta)."""
+    if index.is_trained:
+        return 0
+    index.train(vectors)
+    return len(vectors)
+
+
+def recall_report(vectors: np.ndarray, queries: np.ndarray, config: IndexConfig,
+                  k: int = 4, kinds: Iterable[str] = (INDEX_IVF, INDEX_HNSW, INDEX_IVFPQ),
+                  nprobes: Iterable[int] = (1, 2, 4, 8, 16, 32, 64),
+                  ef_searches: Iterable[int] = (16, 32, 64, 128, 256)) -> List[dict]:
+    """Mide recall@k y latencia de cada tipo de índice frente a la búsqueda exacta.
+
+    Cada fila es {kind, param, value, recall, mean_ms, p95_ms, build_s}. Las
+    consultas se lanzan de una en una, como llegan desde el asistente.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    ids = [str(i) for i in range(len(vectors))]
+    texts = [""] * len(ids)
+    metadatas = [{}] * len(ids)
+
+    def measure(store: VectorIndex, **params) -> Tuple[np.ndarray, float, float]:
+        found, latencies = [], []
+        for query in queries:
+            start = time.perf_counter()
+            _, labels = store.search_labels(query, k, **params)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append(labels[0])
+        return np.stack(found), float(np.mean(latencies)), float(np.percentile(latencies, 95))
+
+    start = time.perf_counter()
+    exact = VectorIndex.build(config, ids, texts, metadatas, vectors, kind=INDEX_FLAT)
+    truth, mean_ms, p95_ms = measure(exact)
+    rows = [{"kind": INDEX_FLAT, "param": "", "value": "", "recall": 1.0,
+             "mean_ms": mean_ms, "p95_ms": p95_ms, "build_s": time.perf_counter() - start}]
+
+    def recall(found: np.ndarray) -> float:
+        hits = sum(len(set(f.tolist()) & set(t.tolist()) - {-1}) for f, t in zip(found, truth))
+        expected = sum(len(set(t.tolist()) - {-1}) for t in truth)
+        return hits / expected if expected else 1.0
+
+    for kind in kinds:
+        if kind == INDEX_IVFPQ and len(ids) < 2 ** config.pq_bits:
+            continue  # no hay puntos suficientes para entrenar el cuantizador
+        start = time.perf_counter()
+        store = VectorIndex.build(config, ids, texts, metadatas, vectors, kind=kind)
+        build_s = time.perf_counter() - start
+        if kind == INDEX_HNSW:
+            sweep = [("efSearch", value, {"ef_search": value}) for value in ef_searches]
+        else:
+            nlist = faiss.extract_index_ivf(store.index).nlist
+            sweep = [("nprobe", value, {"nprobe": value}) for value in nprobes if value <= nlist]
+        for param, value, params in sweep:
+            found, mean_ms, p95_ms = measure(store, **params)
+            rows.append({"kind": kind, "param": param, "value": value, "recall": recall(found),
+                         "mean_ms": mean_ms, "p95_ms": p95_ms, "build_s": build_s})
+    return rows
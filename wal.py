@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import zlib
+import struct
+import threading
+from typing import Callable, Iterator, List, Optional
+
+import numpy as np
+
+# Cabecera de cada registro: longitud del JSON, longitud del bloque binario y CRC32
+_FRAME = struct.Struct("<III")
+
+
+class WriteAheadLog:
+    """Registro en disco de las mutaciones del vectorstore, dividido en segmentos."""
+
+    def __init__(self, wal_path: str, fsync: bool = True):
+        self.wal_path = wal_path
+        self.fsync = fsync
+        self.last_seq = 0
+        self._file = None
+        self._segment = None
+        self._segment_bytes = 0
+        self._backlog_bytes = 0
+        self._first_write = None
+        self._lock = threading.Lock()
+        os.makedirs(self.wal_path, exist_ok=True)
+
+    def segments(self) -> List[str]:
+        """Rutas de los segmentos existentes, en orden de escritura."""
+        names = sorted(n for n in os.listdir(self.wal_path) if n.endswith(".log"))
+        return [os.path.join(self.wal_path, n) for n in names]
+
+    def replay(self, after_seq: int = 0) -> Iterator[dict]:
+        """Recorre los registros con número de secuencia mayor que after_seq."""
+        for segment in self.segments():
+            for record in self._read_segment(segment):
+                self.last_seq = max(self.last_seq, record["seq"])
+                if record["seq"] > after_seq:
+                    yield record
+
+    def _read_segment(self, segment: str) -> Iterator[dict]:
+        with open(segment, "rb") as f:
+            while True:
+                header = f.read(_FRAME.size)
+                if len(header) < _FRAME.size:
+                    return
+                meta_len, blob_len, crc = _FRAME.unpack(header)
+                payload = f.read(meta_len + blob_len)
+                if len(payload) < meta_len + blob_len or zlib.crc32(payload) != crc:
+                    # Registro truncado por una caída: el resto del segmento no es fiable
+                    print(f"⚠️ Registro incompleto en {os.path.basename(segment)}, se ignora el resto")
+                    return
+                record = json.loads(payload[:meta_len].decode("utf-8"))
+                if blob_len:
+                    record["vectors"] = np.frombuffer(
+                        payload[meta_len:], dtype=np.float32
+                    ).reshape(record.pop("shape"))
+                yield record
+
+    def open(self, start_seq: Optional[int] = None):
+        """Abre un segmento nuevo; nunca se escribe a continuación de uno posiblemente truncado."""
+        with self._lock:
+            if start_seq is not None:
+                self.last_seq = max(self.last_seq, start_seq)
+            # Lo que quede de ejecuciones anteriores cuenta para el próximo snapshot
+            self._backlog_bytes = sum(os.path.getsize(s) for s in self.segments())
+            self._open_segment()
+            if self._backlog_bytes:
+                self._first_write = time.time()
+
+    def _open_segment(self):
+        if self._file:
+            self._file.close()
+        self._segment = os.path.join(self.wal_path, f"{self.last_seq + 1:012d}.log")
+        self._file = open(self._segment, "ab")
+        self._segment_bytes = 0
+        self._first_write = None
+
+    def append(self, op: str, vectors=None, **fields) -> dict:
+        """Escribe un registro de forma duradera y lo devuelve con su número de secuencia."""
+        with self._lock:
+            self.last_seq += 1
+            record = {"seq": self.last_seq, "op": op, **fields}
+            blob = b""
+            meta = dict(record)
+            if vectors is not None:
+                vectors = np.asarray(vectors, dtype=np.float32)
+                meta["shape"] = list(vectors.shape)
+                blob = vectors.tobytes()
+                record["vectors"] = vectors
+            meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+            payload = meta_bytes + blob
+            self._file.write(_FRAME.pack(len(meta_bytes), len(blob), zlib.crc32(payload)))
+            self._file.write(payload)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._segment_bytes += _FRAME.size + len(payload)
+            if self._first_write is None:
+                self._first_write = time.time()
+            return record
+
+    def pending(self):
+        """Bytes y antigüedad (segundos) de lo registrado desde el último snapshot."""
+        with self._lock:
+            age = time.time() - self._first_write if self._first_write else 0.0
+            return self._backlog_bytes + self._segment_bytes, age
+
+    def rotate(self) -> List[str]:
+        """Cierra el segmento actual y devuelve los segmentos que cubrirá el próximo snapshot."""
+        with self._lock:
+            closed = [s for s in self.segments() if s != self._segment]
+            if self._segment_bytes:
+                closed.append(self._segment)
+                self._open_segment()
+            else:
+                self._first_write = None
+            self._backlog_bytes = 0
+            return closed
+
+    def purge(self, segments: List[str]):
+        """Borra segmentos cuyo contenido ya está incluido en un snapshot."""
+        for segment in segments:
+            try:
+                os.remove(segment)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+class Checkpointer(threading.Thread):
+    """Hilo en segundo plano que lanza snapshots según tamaño o antigüedad del WAL."""
+
+    def __init__(self, wal: WriteAheadLog, checkpoint: Callable[[], None],
+                 max_bytes: int = 8 * 1024 * 1024, max_age: float = 300,
+                 poll_interval: float = 5):
+        super().__init__(daemon=True, name="jarvis-checkpointer")
+        self.wal = wal
+        self.checkpoint = checkpoint
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+    def request(self):
+        """Pide un snapshot lo antes posible."""
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        self.join()
+
+    def run(self):
+        while not self._stopped.is_set():
+            forced = self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                return
+            size, age = self.wal.pending()
+            if size and (forced or size >= self.max_bytes or age >= self.max_age):
+                try:
+                    self.checkpoint()
+                except Exception as e:
+                    print(f"⚠️ Error al crear snapshot: {str(e)}")